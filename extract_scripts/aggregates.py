@@ -0,0 +1,125 @@
+from collections import defaultdict
+from pathlib import Path
+import pandas as pd
+
+# Columns each aggregate table is grouped by, in addition to the year.
+# These mirror the group_by(...) calls in the R plotting scripts.
+AGGREGATE_GROUPINGS = {
+    "by_year": [],
+    "by_person_year": ["person"],
+    "by_sex_year": ["sex"],
+    "by_party_year": ["party_id", "party_name"],
+    "by_gov_year": ["gov"],
+}
+
+# Column that marks a positive row for each task type, if any.
+FLAG_COLUMNS = {
+    "sf_main_clause": "is_stylized",
+    "sf_sub_clause": "is_stylized",
+    "hardspeech": None,
+}
+
+
+class AggregateCounter:
+    """
+    Keep running counts of result rows per grouping and year while extracting.
+
+    Args:
+        task_type: Type of task the result rows come from.
+        columns: Column names of the result rows, in order.
+    """
+
+    def __init__(self, task_type, columns):
+        self.task_type = task_type
+        self.year_index = columns.index("year")
+        self.group_indices = {
+            name: [columns.index(column) for column in group_columns]
+            for name, group_columns in AGGREGATE_GROUPINGS.items()
+        }
+        flag_column = FLAG_COLUMNS.get(task_type)
+        self.flag_index = columns.index(flag_column) if flag_column else None
+        self.counts = {
+            name: defaultdict(lambda: [0, 0]) for name in AGGREGATE_GROUPINGS
+        }
+
+    def update(self, rows):
+        """
+        Add a batch of result rows to the running counts.
+
+        Args:
+            rows: List of result rows.
+        """
+        for row in rows:
+            year = row[self.year_index]
+            flag = 0
+            if self.flag_index is not None:
+                flag = int(row[self.flag_index] or 0)
+
+            for name, indices in self.group_indices.items():
+                key = (*[row[index] for index in indices], year)
+                counts = self.counts[name][key]
+                counts[0] += 1
+                counts[1] += flag
+
+    def add_table(self, name, table_path: Path):
+        """
+        Add the counts of a saved aggregate table, e.g. from another shard.
+
+        Args:
+            name: Name of the grouping.
+            table_path: Path of the saved table.
+        """
+        size = len(AGGREGATE_GROUPINGS[name]) + 1
+        table = pd.read_csv(table_path, sep="\t", dtype=str, keep_default_na=False)
+        for row in table.itertuples(index=False):
+            counts = self.counts[name][tuple(row[:size])]
+            counts[0] += int(row.total)
+            if self.flag_index is not None:
+                counts[1] += int(row.nr_sf)
+
+    def get_table(self, name):
+        """
+        Build the aggregate table for one grouping.
+
+        Args:
+            name: Name of the grouping, a key in AGGREGATE_GROUPINGS.
+
+        Returns:
+            A DataFrame with the group columns, year and the counts.
+        """
+        group_columns = [*AGGREGATE_GROUPINGS[name], "year"]
+        rows = [[*key, *counts] for key, counts in self.counts[name].items()]
+        table = pd.DataFrame(rows, columns=[*group_columns, "total", "nr_sf"])
+        table = table.sort_values(group_columns, na_position="first", kind="stable")
+
+        if self.flag_index is None:
+            return table.drop(columns="nr_sf")
+
+        table["nr_not_sf"] = table["total"] - table["nr_sf"]
+        table["proportion"] = table["nr_sf"] / table["total"] * 100
+        return table
+
+    def save(self, output_file: Path):
+        """
+        Save every aggregate table next to the main output file.
+
+        Args:
+            output_file: Path of the main output TSV file.
+        """
+        for name in AGGREGATE_GROUPINGS:
+            table_path = aggregate_path(output_file, name)
+            self.get_table(name).to_csv(table_path, sep="\t", index=False)
+
+
+def aggregate_path(output_file: Path, name):
+    """
+    Get the path of an aggregate table belonging to a main output file.
+
+    Args:
+        output_file: Path of the main output TSV file.
+        name: Name of the grouping.
+
+    Returns:
+        Path: e.g. 'sf_main_clause.by_sex_year.tsv' for 'sf_main_clause.tsv'.
+    """
+    return output_file.with_name(f"{output_file.stem}.{name}.tsv")
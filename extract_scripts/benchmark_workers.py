@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+# Times the extraction of a corpus with the thread and process executors, to compare
+# them on free-threaded Python builds (e.g. python3.13t), where threads run in parallel.
+from collectmp_cli import add_input_args, validate_input_args, get_corpus_sources
+from utils import TASK_TYPES
+import argparse
+import time
+import sys
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark extraction with threads against processes."
+    )
+
+    add_input_args(parser)
+
+    parser.add_argument(
+        "--task-type",
+        type=str,
+        help=f"Task type to extract. Defaults to {TASK_TYPES[0]}.",
+        default=TASK_TYPES[0],
+        choices=TASK_TYPES,
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        help="Numbers of workers to time each executor with. Defaults to 1 2 4.",
+        default=[1, 2, 4],
+    )
+
+    parser.add_argument(
+        "--limit",
+        type=int,
+        help="Only process the first files of the corpus.",
+        default=None,
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    xml_files, metadata, speech_path, freq_dict_path, phonetic_dict_path = validate_input_args(args, [args.task_type])
+    xml_files = xml_files[: args.limit]
+
+    from corpus_extrator import CorpusExtractor
+
+    gil_enabled = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"Python {sys.version.split()[0]}, GIL {'enabled' if gil_enabled else 'disabled'}, {len(xml_files)} files")
+
+    start = time.perf_counter()
+    corpus = CorpusExtractor(
+        metadata, speech_path, phonetic_dict_path, freq_dict_path, args.task_type, None,
+        **get_corpus_sources(args.xml_path),
+    )
+    print(f"Loading metadata: {time.perf_counter() - start:.2f} s")
+
+    expected = None
+    for executor in ["thread", "process"]:
+        for workers in args.workers:
+            run = CorpusExtractor(
+                None, None, None, None, args.task_type, None,
+                metadata=corpus.metadata,
+                token_cache=corpus.token_cache,
+                corpus_reader=corpus.corpus_reader,
+            )
+            start = time.perf_counter()
+            run.process_files(xml_files, workers, executor)
+            seconds = time.perf_counter() - start
+
+            if expected is None:
+                expected = run.results
+            same = "same results" if run.results == expected else "DIFFERENT RESULTS"
+            print(f"{executor:>7} x {workers}: {seconds:.2f} s, {len(xml_files) / seconds:.1f} files/s, {same}")
+
+
+if __name__ == "__main__":
+    main()
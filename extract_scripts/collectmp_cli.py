@@ -1,8 +1,13 @@
 #!/usr/bin/env python
 
-from utils import TASK_TYPES, METADATA_FILE, SPEECH_TYPES_FILE, PHONE_DICT, FREQ_DICT, SaveConfig
-from corpus_extrator import CorpusExtractor
+# Only light modules are imported here, so --help and argument errors return instantly.
+# The extraction modules, which import pandas, tqdm and lexicalrichness, are imported
+# once the arguments have been validated.
+from utils import TASK_TYPES, TASK_METADATA, METADATA_FILE, SPEECH_TYPES_FILE, PHONE_DICT, FREQ_DICT, SaveConfig, is_token_cache
+from sharding import parse_shard, select_shard, check_shards, merge_shards
+from corpus_reader import CorpusReader, is_archive
 from pathlib import Path
+import functools
 import argparse
 import sys
 import json
@@ -17,16 +22,61 @@ def check_path(path):
     return path
 
 
-def validate_args(args):
+@functools.cache
+def load_token_cache(xml_path):
+    if not (xml_path.is_dir() and is_token_cache(xml_path)):
+        return None
+
+    from token_cache import TokenCache
+
+    try:
+        return TokenCache(xml_path)
+    except ValueError as error:
+        print("Error:", error)
+        sys.exit(1)
+
+
+@functools.cache
+def load_corpus_reader(xml_path):
+    try:
+        return CorpusReader(xml_path)
+    except (ValueError, OSError) as error:
+        print(f"Error: Could not read {xml_path}: {error}")
+        sys.exit(1)
+
+
+def get_corpus_sources(xml_path):
+    token_cache = load_token_cache(xml_path)
+    if token_cache:
+        return {"token_cache": token_cache}
+    return {"corpus_reader": load_corpus_reader(xml_path)}
+
+
+def load_feature_cache(args, freq_dict_path):
+    if not args.feature_cache:
+        return None
+
+    from speech_feature_cache import SpeechFeatureCache
+
+    return SpeechFeatureCache(args.feature_cache, freq_dict_path)
+
+
+def validate_input_args(args, task_types):
     if not args.xml_path.exists():
         print(f"Error: The path {args.xml_path} does not exist.")
         sys.exit(1)
 
-    path_is_dir = args.xml_path.is_dir()
+    token_cache = load_token_cache(args.xml_path)
 
-    if path_is_dir:
-        xml_files = list(args.xml_path.rglob("*.xml"))
+    if token_cache:
+        xml_files = token_cache.get_paths()
         metadata = args.metadata or (args.xml_path / METADATA_FILE)
+        metadata_exists = metadata.exists()
+    elif args.xml_path.is_dir() or is_archive(args.xml_path):
+        corpus_reader = load_corpus_reader(args.xml_path)
+        xml_files = corpus_reader.get_files()
+        metadata = args.metadata or corpus_reader.find(METADATA_FILE) or (args.xml_path / METADATA_FILE)
+        metadata_exists = corpus_reader.contains(metadata)
     else:
         xml_files = [args.xml_path]
         metadata = args.metadata
@@ -36,8 +86,9 @@ def validate_args(args):
                 "Error: Providing a metadata file is required when processing a single file"
             )
             sys.exit(1)
+        metadata_exists = metadata.exists()
 
-    if not metadata.exists():
+    if not metadata_exists:
         print(f"Error: Metadata file '{metadata}' not found.")
         sys.exit(1)
 
@@ -48,14 +99,60 @@ def validate_args(args):
     freq_dict_path = check_path(freq_dict_path)
 
     phonetic_dict_path = args.phonetic_dict
-    phonetic_dict_path = check_path(phonetic_dict_path)
+    if any("phone_dict" in TASK_METADATA[task_type] for task_type in task_types):
+        phonetic_dict_path = check_path(phonetic_dict_path)
+
+    return xml_files, metadata, speech_path, freq_dict_path, phonetic_dict_path
+
+
+def validate_args(args):
+    input_paths = validate_input_args(args, [args.task_type])
 
     output_dir = args.out_path.resolve()
     if not output_dir.exists():
         print(f"Error: The chosen output directory '{output_dir}' does not exist.")
         sys.exit(1)
 
-    return xml_files, metadata, speech_path, freq_dict_path, phonetic_dict_path
+    if args.workers < 1:
+        print("Error: --workers must be at least 1.")
+        sys.exit(1)
+
+    if args.shard and args.db:
+        print("Error: --db can not be used with --shard. Merge the shards first.")
+        sys.exit(1)
+
+    if args.shard and args.speech_features:
+        print("Error: --speech-features can not be used with --shard, the shards would overwrite each other's features.")
+        sys.exit(1)
+
+    if args.detector_cache_size < 0:
+        print("Error: --detector-cache-size can not be negative.")
+        sys.exit(1)
+
+    if args.sample is not None and not 0 < args.sample <= 1:
+        print("Error: --sample must be a fraction greater than 0 and at most 1.")
+        sys.exit(1)
+
+    if args.shard and (args.previous or args.fingerprints):
+        print("Error: --previous and --fingerprints can not be used with --shard.")
+        sys.exit(1)
+
+    if args.previous:
+        check_path(args.previous)
+
+    if args.dedup and args.shard:
+        print("Error: --dedup can not be used with --shard, near-duplicates are found among all speeches.")
+        sys.exit(1)
+
+    if args.plan_files < 1:
+        print("Error: --plan-files must be at least 1.")
+        sys.exit(1)
+
+    if args.sample is not None and args.shard:
+        print("Error: --sample can not be used with --shard, the sample weights need all speeches.")
+        sys.exit(1)
+
+    return input_paths
 
 
 def load_configs(config_path):
@@ -67,47 +164,145 @@ def load_configs(config_path):
             if "configs" not in json_dict:
                 print("Error: Config file must contain a 'configs' key.")
                 sys.exit(1)
-            configs = [SaveConfig(**config) for config in json_dict["configs"]]
+            try:
+                configs = [SaveConfig(**config) for config in json_dict["configs"]]
+            except (TypeError, ValueError) as error:
+                print("Error: Invalid config:", error)
+                sys.exit(1)
     return configs
 
 
+def save_results(corpus, args, file_indices, file_name=None):
+    if args.shard:
+        corpus.save_shard(args.out_path.resolve(), file_name, *args.shard, file_indices)
+    else:
+        corpus.save_results(args.out_path.resolve(), file_name)
+
+
+def load_previous(args, file_name=None):
+    if not args.previous:
+        return None
+
+    from release_diff import PreviousResults
+
+    results_file = check_path(args.previous.resolve() / f"{file_name or args.task_type}.tsv")
+    try:
+        return PreviousResults(results_file, args.task_type)
+    except ValueError as error:
+        print("Error:", error)
+        sys.exit(1)
+
+
 def process_configs(configs, args, xml_files, metadata, speech_path, freq_dict_path, phonetic_dict_path):
+    from corpus_extrator import CorpusExtractor
+
+    corpus_sources = get_corpus_sources(args.xml_path)
+    feature_cache = load_feature_cache(args, freq_dict_path)
+    sample = None
+    if args.sample is not None:
+        from sampling import SpeechSample
+
+        sample = SpeechSample(args.sample, args.seed)
+        print("Sampling speeches:", sample)
+    file_indices = {teifile: index for index, teifile in enumerate(xml_files)}
+    if args.shard:
+        xml_files = select_shard(xml_files, *args.shard)
+        print(f"Processing shard {args.shard[0]} of {args.shard[1]}: {len(xml_files)} files")
+
     if configs:
         for config in configs:
             print("Extracting from", config)
             corpus = CorpusExtractor(
-                metadata, speech_path, phonetic_dict_path, freq_dict_path, args.task_type, config
+                metadata, speech_path, phonetic_dict_path, freq_dict_path, args.task_type, config,
+                **corpus_sources,
+                feature_cache=feature_cache,
+                sample=sample,
+                all_speech_features=args.speech_features,
+                detector_cache_size=args.detector_cache_size,
+                previous=load_previous(args, config.person or None),
+                record_fingerprints=args.fingerprints,
+                dedup=args.dedup,
             )
-            corpus.process_files(xml_files)
-            if not config.person:
-                corpus.save_results(args.out_path.resolve())
-            else:
-                corpus.save_results(args.out_path.resolve(), config.person)
+            corpus.process_files(xml_files, args.workers, args.executor)
+            save_results(corpus, args, file_indices, config.person or None)
+            if args.fingerprints or args.previous:
+                corpus.save_fingerprints(args.out_path.resolve(), config.person or None)
+            if args.speech_features:
+                corpus.save_speech_features(args.out_path.resolve(), config.person or None)
+            if args.db:
+                corpus.save_results_db(args.db.resolve(), config.person or None)
     else:
         corpus = CorpusExtractor(
-            metadata, speech_path, phonetic_dict_path, freq_dict_path, args.task_type, None
+            metadata, speech_path, phonetic_dict_path, freq_dict_path, args.task_type, None,
+            **corpus_sources,
+            feature_cache=feature_cache,
+            sample=sample,
+            all_speech_features=args.speech_features,
+            detector_cache_size=args.detector_cache_size,
+            previous=load_previous(args),
+            record_fingerprints=args.fingerprints,
+            dedup=args.dedup,
         )
-        corpus.process_files(xml_files)
-        corpus.save_results(args.out_path.resolve())
+        corpus.process_files(xml_files, args.workers, args.executor)
+        save_results(corpus, args, file_indices)
+        if args.fingerprints or args.previous:
+            corpus.save_fingerprints(args.out_path.resolve())
+        if args.speech_features:
+            corpus.save_speech_features(args.out_path.resolve())
+        if args.db:
+            corpus.save_results_db(args.db.resolve())
 
+    if feature_cache:
+        feature_cache.close()
 
-def parse_args():
-    parser = argparse.ArgumentParser(
-        description="Process IGC-PARLA corpus files and output a TSV file with stylistic fronting or hardspeech data."
+
+def plan_configs(configs, args, xml_files, metadata, speech_path, freq_dict_path, phonetic_dict_path):
+    import time
+    from corpus_extrator import CorpusExtractor
+    from planning import CorpusSurvey, ExtractionPlan
+
+    corpus_sources = get_corpus_sources(args.xml_path)
+    sample = None
+    if args.sample is not None:
+        from sampling import SpeechSample
+
+        sample = SpeechSample(args.sample, args.seed)
+    if args.shard:
+        xml_files = select_shard(xml_files, *args.shard)
+        print(f"Planning shard {args.shard[0]} of {args.shard[1]}")
+
+    survey = CorpusSurvey(xml_files, **corpus_sources)
+    survey.print()
+    plan = ExtractionPlan(survey, args.workers, args.executor, args.plan_files)
+
+    # The feature cache is left out, so the plan does not add to it and assumes it is empty
+    start = time.perf_counter()
+    loaded = CorpusExtractor(
+        metadata, speech_path, phonetic_dict_path, freq_dict_path, args.task_type, None, **corpus_sources
     )
+    metadata_seconds = time.perf_counter() - start
+
+    for config in configs or [None]:
+        print("Planning", args.task_type, "extraction from", config or "all")
+        corpus = CorpusExtractor(
+            None, None, None, None, args.task_type, config,
+            metadata=loaded.metadata,
+            **corpus_sources,
+            sample=sample,
+            all_speech_features=args.speech_features,
+            detector_cache_size=args.detector_cache_size,
+        )
+        plan.add_config(corpus, metadata_seconds)
+    plan.print()
+
 
+def add_input_args(parser):
     parser.add_argument(
         "xml_path",
         type=Path,
-        help="Path to an archive directory containing XML files, or a single XML file.",
-    )
-
-    parser.add_argument(
-        "--task-type",
-        type=str,
-        help=f"What type of data you want to extract from the corpus. Defaults to {TASK_TYPES[0]}.",
-        default=TASK_TYPES[0],
-        choices=TASK_TYPES,
+        help="Path to an archive directory containing XML files, a .tar.gz or .zip archive of it, "
+        "a token cache made with the 'cache' command, or a single XML file. "
+        "The XML files may be compressed as .xml.gz or .xml.zst.",
     )
 
     parser.add_argument(
@@ -138,6 +333,22 @@ def parse_args():
         default=Path(".", PHONE_DICT),
     )
 
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Process IGC-PARLA corpus files and output a TSV file with stylistic fronting or hardspeech data."
+    )
+
+    add_input_args(parser)
+
+    parser.add_argument(
+        "--task-type",
+        type=str,
+        help=f"What type of data you want to extract from the corpus. Defaults to {TASK_TYPES[0]}.",
+        default=TASK_TYPES[0],
+        choices=TASK_TYPES,
+    )
+
     parser.add_argument(
         "--out-path",
         type=Path,
@@ -152,13 +363,670 @@ def parse_args():
         default=None,
     )
 
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        help="Only process one shard of the corpus files, given as 'i/N' for shard i of N. "
+        "The output of all N shards can be combined with the 'merge' command.",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--sample",
+        type=float,
+        help="Only process a random fraction of the speeches, e.g. 0.1. The output gets a sample_weight column, "
+        "and rates with confidence intervals are saved to a .sample_estimates.tsv file next to it.",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="Seed of the --sample. The same seed gives the same speeches. Defaults to 0.",
+        default=0,
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of files to process in parallel. Defaults to 1.",
+        default=1,
+    )
+
+    parser.add_argument(
+        "--executor",
+        type=str,
+        help="How to run the workers: 'thread' shares the metadata between threads, which runs in parallel "
+        "on free-threaded Python builds, and 'process' gives each worker process its own copy. Defaults to 'thread'.",
+        default="thread",
+        choices=["thread", "process"],
+    )
+
+    parser.add_argument(
+        "--speech-features",
+        action="store_true",
+        help="Also save a table of speech-level features (word ranks, lemma types, MATTR) with one row per processed speech.",
+    )
+
+    parser.add_argument(
+        "--feature-cache",
+        type=Path,
+        help="An optional path to an SQLite database of speech-level features (MATTR, word ranks), shared by all "
+        "task types and configs. Features of speeches already in it are reused instead of computed again.",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--detector-cache-size",
+        type=int,
+        help="Number of distinct sentences whose detector output is kept, so repeated sentences such as "
+        "'Herra forseti .' are only checked once. 0 turns the cache off. Defaults to 100000.",
+        default=100000,
+    )
+
+    parser.add_argument(
+        "--db",
+        type=Path,
+        help="An optional path to an SQLite database. The results are also saved there, indexed for the 'query' command.",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--fingerprints",
+        action="store_true",
+        help="Also save <name>.speeches.tsv with the content hash of every processed speech, "
+        "so a run on a later release can carry the results forward with --previous.",
+    )
+
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Cluster near-duplicate speeches, such as read-out boilerplate and speeches transcribed twice, "
+        "and add a dedup_cluster column with the id of the first speech of each row's cluster.",
+    )
+
+    parser.add_argument(
+        "--previous",
+        type=Path,
+        help="Output directory of a run on an earlier release, made with --fingerprints and the same frequency list. "
+        "The results of speeches with unchanged tokens are carried forward from the results file of the same name "
+        "there, and only new and changed speeches are checked.",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Do not extract, but estimate the wall time, peak memory and output size of the run with the chosen "
+        "workers and configs, from the file sizes and the time a few files take.",
+    )
+
+    parser.add_argument(
+        "--plan-files",
+        type=int,
+        help="Number of files --plan times for each config. Defaults to 8.",
+        default=8,
+    )
+
     return parser.parse_args()
 
 
+def parse_query_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="collectmp_cli.py query",
+        description="Filter extraction results saved to an SQLite database with --db and output them as TSV.",
+    )
+
+    parser.add_argument("db", type=Path, help="Path to the SQLite database.")
+
+    parser.add_argument(
+        "--table",
+        type=str,
+        help="Table to query, i.e. the task type or person name used when saving. Defaults to the only table in the database.",
+        default=None,
+    )
+
+    parser.add_argument("--person", nargs="+", default=[], help="Only rows for these people.")
+    parser.add_argument("--year", nargs="+", default=[], help="Only rows from these years.")
+    parser.add_argument("--party-id", nargs="+", default=[], help="Only rows for these party ids, e.g. party.S.")
+    parser.add_argument("--speech-type", nargs="+", default=[], help="Only rows with these speech types.")
+    parser.add_argument("--speech-id", nargs="+", default=[], help="Only rows from these speeches.")
+
+    parser.add_argument(
+        "--columns",
+        nargs="+",
+        default=None,
+        help="Columns to output. Defaults to all columns.",
+    )
+
+    parser.add_argument("--limit", type=int, default=None, help="Maximum number of rows to output.")
+
+    parser.add_argument(
+        "--out-file",
+        type=Path,
+        help="Optional path to save the output TSV file. Defaults to printing to stdout.",
+        default=None,
+    )
+
+    return parser.parse_args(argv)
+
+
+def query(argv):
+    args = parse_query_args(argv)
+    check_path(args.db)
+
+    from results_db import query_results_db, get_tables
+
+    tables = get_tables(args.db)
+    table = args.table
+    if not table:
+        if len(tables) != 1:
+            print(f"Error: The database has the tables {tables}. Choose one with --table.")
+            sys.exit(1)
+        table = tables[0]
+    elif table not in tables:
+        print(f"Error: Table '{table}' not found. Available tables: {tables}.")
+        sys.exit(1)
+
+    filters = {
+        "person": args.person,
+        "year": args.year,
+        "party_id": args.party_id,
+        "speech_type": args.speech_type,
+        "speech_id": args.speech_id,
+    }
+    try:
+        data = query_results_db(args.db, table, filters, args.columns, args.limit)
+    except ValueError as error:
+        print("Error:", error)
+        sys.exit(1)
+    data.to_csv(args.out_file or sys.stdout, sep="\t", index=False)
+
+
+def parse_serve_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="collectmp_cli.py serve",
+        description="Load the corpus metadata and dictionaries once and serve extraction jobs over local HTTP.",
+    )
+
+    add_input_args(parser)
+
+    parser.add_argument(
+        "--feature-cache",
+        type=Path,
+        help="An optional path to an SQLite database of speech-level features (MATTR, word ranks), shared by all "
+        "task types and configs. Features of speeches already in it are reused instead of computed again.",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--host",
+        type=str,
+        help="Host to listen on. Defaults to 127.0.0.1.",
+        default="127.0.0.1",
+    )
+
+    parser.add_argument(
+        "--port",
+        type=int,
+        help="Port to listen on. Defaults to 8765.",
+        default=8765,
+    )
+
+    return parser.parse_args(argv)
+
+
+def serve(argv):
+    args = parse_serve_args(argv)
+    xml_files, metadata, speech_path, freq_dict_path, phonetic_dict_path = validate_input_args(args, TASK_TYPES)
+    corpus_sources = get_corpus_sources(args.xml_path)
+    if "corpus_reader" in corpus_sources:
+        corpus_dir = corpus_sources["corpus_reader"].get_root()
+    else:
+        corpus_dir = args.xml_path
+
+    from corpus_extrator import CorpusExtractor
+    import extraction_server
+
+    feature_cache = load_feature_cache(args, freq_dict_path)
+    corpus = CorpusExtractor(
+        metadata, speech_path, phonetic_dict_path, freq_dict_path, TASK_TYPES[0], None,
+        **corpus_sources,
+        feature_cache=feature_cache,
+    )
+    extraction_server.serve(corpus, xml_files, corpus_dir, args.host, args.port)
+    if feature_cache:
+        feature_cache.close()
+
+
+def parse_merge_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="collectmp_cli.py merge",
+        description="Merge the outputs of a run split with --shard into the output of a single-node run.",
+    )
+
+    parser.add_argument("out_file", type=Path, help="Path of the merged TSV file.")
+    parser.add_argument(
+        "shard_files",
+        type=Path,
+        nargs="+",
+        help="The shard output files, e.g. hardspeech.shard-1-of-4.tsv ... hardspeech.shard-4-of-4.tsv.",
+    )
+
+    return parser.parse_args(argv)
+
+
+def merge(argv):
+    args = parse_merge_args(argv)
+    for shard_file in args.shard_files:
+        check_path(shard_file)
+
+    error = check_shards(args.shard_files)
+    if error:
+        print("Error:", error)
+        sys.exit(1)
+
+    merge_shards(args.shard_files, args.out_file)
+
+
+def parse_cache_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="collectmp_cli.py cache",
+        description="Convert the corpus XML files to a binary token cache. The cache can be given "
+        "instead of the corpus directory to later runs, which then skip parsing the XML.",
+    )
+
+    parser.add_argument("xml_path", type=Path, help="Path to an archive directory containing XML files, or a .tar.gz or .zip archive of it.")
+    parser.add_argument("cache_dir", type=Path, help="Directory to write the token cache to.")
+
+    return parser.parse_args(argv)
+
+
+def cache(argv):
+    args = parse_cache_args(argv)
+    if not (args.xml_path.is_dir() or is_archive(args.xml_path)):
+        print(f"Error: The path {args.xml_path} is not a directory or an archive.")
+        sys.exit(1)
+    if args.cache_dir.exists() and any(args.cache_dir.iterdir()) and not is_token_cache(args.cache_dir):
+        print(f"Error: The directory {args.cache_dir} is not empty and is not a token cache.")
+        sys.exit(1)
+
+    from token_cache import build_token_cache
+
+    build_token_cache(load_corpus_reader(args.xml_path), args.cache_dir)
+
+
+def parse_fingerprint_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="collectmp_cli.py fingerprint",
+        description="Save the content hash of every speech of a corpus release, to compare releases with 'release-diff'.",
+    )
+
+    parser.add_argument(
+        "xml_path",
+        type=Path,
+        help="Path to an archive directory containing XML files, a .tar.gz or .zip archive of it, or a token cache.",
+    )
+    parser.add_argument("out_file", type=Path, help="Path of the speech manifest TSV file.")
+
+    return parser.parse_args(argv)
+
+
+def fingerprint(argv):
+    args = parse_fingerprint_args(argv)
+    check_path(args.xml_path)
+
+    from release_diff import fingerprint_corpus, save_manifest
+
+    token_cache = load_token_cache(args.xml_path)
+    corpus_reader = None if token_cache else load_corpus_reader(args.xml_path)
+    xml_files = token_cache.get_paths() if token_cache else corpus_reader.get_files()
+
+    fingerprints = fingerprint_corpus(xml_files, corpus_reader, token_cache)
+    save_manifest(args.out_file, fingerprints)
+    print(f"Fingerprinted {len(fingerprints)} speeches. Manifest saved to", args.out_file)
+
+
+def parse_release_diff_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="collectmp_cli.py release-diff",
+        description="Compare the speeches of two corpus releases by their ids and content hashes.",
+    )
+
+    parser.add_argument("old_manifest", type=Path, help="Speech manifest of the older release, from 'fingerprint' or --fingerprints.")
+    parser.add_argument("new_manifest", type=Path, help="Speech manifest of the newer release.")
+    parser.add_argument(
+        "--out-file",
+        type=Path,
+        help="Optional path of a TSV file listing the added, removed and changed speeches.",
+        default=None,
+    )
+
+    return parser.parse_args(argv)
+
+
+def release_diff(argv):
+    args = parse_release_diff_args(argv)
+    check_path(args.old_manifest)
+    check_path(args.new_manifest)
+
+    from release_diff import DIFF_HEADERS, DIFF_STATUSES, diff_manifests, load_manifest
+    from utils import write_tsv
+
+    try:
+        diff = diff_manifests(load_manifest(args.old_manifest), load_manifest(args.new_manifest))
+    except ValueError as error:
+        print("Error:", error)
+        sys.exit(1)
+
+    print(", ".join(f"{len(diff[status])} {status}" for status in DIFF_STATUSES))
+    if args.out_file:
+        rows = ((speech_id, status) for status in DIFF_STATUSES[:3] for speech_id in diff[status])
+        write_tsv(args.out_file, DIFF_HEADERS, rows)
+        print("Changes saved to", args.out_file)
+
+
+def parse_diff_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="collectmp_cli.py diff",
+        description="Compare two extraction outputs row by row, e.g. before and after a detector change, "
+        "and count the added, removed and changed rows per task, person and year.",
+    )
+
+    parser.add_argument("old", type=Path, help="The older results file (TSV or Parquet), or an output directory.")
+    parser.add_argument("new", type=Path, help="The newer results file, or an output directory whose files are compared with those of the same name.")
+    parser.add_argument(
+        "--out-file",
+        type=Path,
+        help="Optional path of a TSV file with the counts per task, person and year.",
+        default=None,
+    )
+    parser.add_argument(
+        "--partition-size",
+        type=int,
+        help="Megabytes of input per partition. One partition of the older output is held in memory at a time. Defaults to 64.",
+        default=64,
+    )
+    parser.add_argument(
+        "--temp-dir",
+        type=Path,
+        help="Directory for the temporary partition files, which take about as much space as the outputs. Defaults to the system temporary directory.",
+        default=None,
+    )
+
+    return parser.parse_args(argv)
+
+
+def diff(argv):
+    args = parse_diff_args(argv)
+    check_path(args.old)
+    check_path(args.new)
+    if args.temp_dir:
+        check_path(args.temp_dir)
+    if args.old.is_dir() != args.new.is_dir():
+        print("Error: Compare two results files or two output directories.")
+        sys.exit(1)
+    if args.partition_size < 1:
+        print("Error: --partition-size must be at least 1.")
+        sys.exit(1)
+
+    from output_diff import OutputDiff, pair_results_files, save_row_diff
+    import tempfile
+
+    try:
+        if args.old.is_dir():
+            pairs, only_old, only_new = pair_results_files(args.old, args.new)
+            for path in only_old + only_new:
+                print("Only in", path.parent, "-", path.name)
+            if not pairs:
+                print(f"Error: {args.old} and {args.new} have no results files of the same name.")
+                sys.exit(1)
+        else:
+            pairs = [(args.old, args.new)]
+        diffs = [OutputDiff(old_file, new_file, new_file.stem, args.partition_size) for old_file, new_file in pairs]
+        for output_diff in diffs:
+            with tempfile.TemporaryDirectory(dir=args.temp_dir) as temp_dir:
+                output_diff.run(Path(temp_dir))
+    except ValueError as error:
+        print("Error:", error)
+        sys.exit(1)
+
+    for output_diff in diffs:
+        output_diff.print()
+    if args.out_file:
+        save_row_diff(args.out_file, diffs)
+        print("Counts saved to", args.out_file)
+
+
+def parse_index_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="collectmp_cli.py index",
+        description="Build an inverted index of the words, lemmas and tags of a token cache for the 'concordance' command.",
+    )
+
+    parser.add_argument("cache_dir", type=Path, help="Directory of a token cache made with the 'cache' command.")
+
+    return parser.parse_args(argv)
+
+
+def index(argv):
+    args = parse_index_args(argv)
+    check_path(args.cache_dir)
+    token_cache = load_token_cache(args.cache_dir)
+    if not token_cache:
+        print(f"Error: {args.cache_dir} is not a token cache. Make one with the 'cache' command.")
+        sys.exit(1)
+
+    from concordance import build_concordance_index
+
+    build_concordance_index(token_cache)
+
+
+def parse_concordance_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="collectmp_cli.py concordance",
+        description="Find token sequences in an indexed token cache and output them with their context as TSV.",
+    )
+
+    parser.add_argument("cache_dir", type=Path, help="Directory of a token cache indexed with the 'index' command.")
+    parser.add_argument(
+        "pattern",
+        type=str,
+        help="Tokens to find, separated by spaces. Each token is a '&'-separated list of conditions like "
+        "'lemma=hafa', 'tag=sþ*' or 'word=hefur', where a trailing '*' matches a prefix. A bare value matches "
+        "the word and '*' matches any token, e.g. 'lemma=hafa&tag=s* * tag=sþ*'.",
+    )
+
+    parser.add_argument(
+        "--context",
+        type=int,
+        help="Maximum number of words before and after each match, within its sentence. Defaults to 10.",
+        default=10,
+    )
+
+    parser.add_argument("--limit", type=int, default=None, help="Maximum number of matches to output.")
+
+    parser.add_argument(
+        "--out-file",
+        type=Path,
+        help="Optional path to save the output TSV file. Defaults to printing to stdout.",
+        default=None,
+    )
+
+    return parser.parse_args(argv)
+
+
+def concordance(argv):
+    args = parse_concordance_args(argv)
+    check_path(args.cache_dir)
+    token_cache = load_token_cache(args.cache_dir)
+    if not token_cache:
+        print(f"Error: {args.cache_dir} is not a token cache. Make one with the 'cache' command.")
+        sys.exit(1)
+
+    from concordance import ConcordanceIndex, CONCORDANCE_HEADERS
+    import pandas as pd
+
+    try:
+        rows = ConcordanceIndex(token_cache).query(args.pattern, args.context, args.limit)
+    except ValueError as error:
+        print("Error:", error)
+        sys.exit(1)
+
+    data = pd.DataFrame(rows, columns=CONCORDANCE_HEADERS)
+    data.to_csv(args.out_file or sys.stdout, sep="\t", index=False)
+
+
+def parse_freq_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="collectmp_cli.py freq",
+        description="Count the lemma and tag frequencies of the corpus and save them as a frequency list "
+        "that can be given to --freq-dict instead of the Gigaword list.",
+    )
+
+    parser.add_argument(
+        "xml_path",
+        type=Path,
+        help="Path to an archive directory containing XML files, a .tar.gz or .zip archive of it, or a token cache.",
+    )
+    parser.add_argument("out_file", type=Path, help="Path of the frequency list, e.g. parla_freq.json.")
+
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        help="Only count one shard of the corpus files, given as 'i/N'. The counts are saved to "
+        "e.g. parla_freq.shard-i-of-N.npz, and all N shards can be combined with the 'freq-merge' command.",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--max-exact-keys",
+        type=int,
+        help="Number of distinct lemma/tag pairs counted exactly, which bounds the memory used. "
+        "Pairs seen after that are counted in a count-min sketch. Defaults to 2000000.",
+        default=2_000_000,
+    )
+
+    parser.add_argument(
+        "--sketch-width",
+        type=int,
+        help="Number of counters in each row of the count-min sketch. Defaults to 1048576.",
+        default=1 << 20,
+    )
+
+    parser.add_argument("--sketch-depth", type=int, help="Number of rows of the count-min sketch. Defaults to 4.", default=4)
+
+    parser.add_argument(
+        "--heavy-hitters",
+        type=int,
+        help="Number of the most frequent sketched pairs kept in the frequency list. Defaults to 100000.",
+        default=100_000,
+    )
+
+    return parser.parse_args(argv)
+
+
+def print_frequency_summary(counter, out_file):
+    print(
+        f"Counted {counter.words} words: {len(counter.exact)} lemma/tag pairs exactly, "
+        f"{counter.sketched_words} words of other pairs in the sketch (at most {counter.get_max_error()} too high)."
+    )
+    print("Frequency list saved to", out_file)
+
+
+def freq(argv):
+    args = parse_freq_args(argv)
+    check_path(args.xml_path)
+
+    from frequency_list import FrequencyCounter, count_corpus
+    from sharding import shard_path
+
+    token_cache = load_token_cache(args.xml_path)
+    corpus_reader = None if token_cache else load_corpus_reader(args.xml_path)
+    xml_files = token_cache.get_paths() if token_cache else corpus_reader.get_files()
+    if args.shard:
+        xml_files = select_shard(xml_files, *args.shard)
+        print(f"Counting shard {args.shard[0]} of {args.shard[1]}: {len(xml_files)} files")
+
+    counter = FrequencyCounter(args.max_exact_keys, args.sketch_width, args.sketch_depth, args.heavy_hitters)
+    count_corpus(xml_files, counter, corpus_reader, token_cache)
+
+    if args.shard:
+        out_file = shard_path(args.out_file, *args.shard, suffix=".npz")
+        counter.save(out_file)
+        print(f"Counted {counter.words} words. Shard counts saved to", out_file)
+    else:
+        counter.save_rank_table(args.out_file)
+        print_frequency_summary(counter, args.out_file)
+
+
+def parse_freq_merge_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="collectmp_cli.py freq-merge",
+        description="Merge the counts of a 'freq' run split with --shard into one frequency list.",
+    )
+
+    parser.add_argument("out_file", type=Path, help="Path of the frequency list, e.g. parla_freq.json.")
+    parser.add_argument(
+        "shard_files",
+        type=Path,
+        nargs="+",
+        help="The shard counts, e.g. parla_freq.shard-1-of-4.npz ... parla_freq.shard-4-of-4.npz.",
+    )
+
+    return parser.parse_args(argv)
+
+
+def freq_merge(argv):
+    args = parse_freq_merge_args(argv)
+    for shard_file in args.shard_files:
+        check_path(shard_file)
+
+    error = check_shards(args.shard_files, results=False)
+    if error:
+        print("Error:", error)
+        sys.exit(1)
+
+    from frequency_list import FrequencyCounter
+
+    counter = FrequencyCounter.load(args.shard_files[0])
+    for shard_file in args.shard_files[1:]:
+        try:
+            counter.merge(FrequencyCounter.load(shard_file))
+        except ValueError as error:
+            print("Error:", error)
+            sys.exit(1)
+
+    counter.save_rank_table(args.out_file)
+    print_frequency_summary(counter, args.out_file)
+
+
+COMMANDS = {
+    "cache": cache,
+    "concordance": concordance,
+    "diff": diff,
+    "fingerprint": fingerprint,
+    "freq": freq,
+    "freq-merge": freq_merge,
+    "index": index,
+    "merge": merge,
+    "query": query,
+    "release-diff": release_diff,
+    "serve": serve,
+}
+
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        COMMANDS[sys.argv[1]](sys.argv[2:])
+        return
+
     args = parse_args()
     xml_files, metadata, speech_path, freq_dict_path, phonetic_dict_path = validate_args(args)
     configs = load_configs(args.config_file)
+    if args.plan:
+        plan_configs(configs, args, xml_files, metadata, speech_path, freq_dict_path, phonetic_dict_path)
+        return
     process_configs(configs, args, xml_files, metadata, speech_path, freq_dict_path, phonetic_dict_path)
 
 
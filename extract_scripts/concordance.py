@@ -0,0 +1,219 @@
+from token_cache import TokenCache, read_column
+import numpy as np
+import json
+
+INDEX_VERSION = 1
+INDEX_DIR = "concordance"
+
+# Token columns that are indexed, and can be matched in query patterns
+INDEXED_COLUMNS = ["word", "lemma", "tag"]
+
+CONCORDANCE_HEADERS = ["year", "date", "person", "speech_id", "before", "match", "after", "lemma", "tag"]
+
+
+def build_concordance_index(token_cache: TokenCache):
+    """
+    Build an inverted index of the word, lemma and tag columns of a token cache.
+
+    For each column, the positions of all tokens are sorted by their vocabulary id, so
+    the positions of an id are one contiguous, sorted slice. The slices start at the
+    offsets stored next to them. The index is written to the 'concordance' directory
+    of the cache.
+
+    Args:
+        token_cache: The token cache to index.
+    """
+    index_dir = token_cache.cache_dir / INDEX_DIR
+    index_dir.mkdir(exist_ok=True)
+    vocabulary_size = len(token_cache.vocabulary)
+
+    for name in INDEXED_COLUMNS:
+        column = token_cache.columns[name]
+        # A stable sort keeps the positions of each id in corpus order
+        np.argsort(column, kind="stable").astype(np.int64).tofile(index_dir / f"{name}.postings.bin")
+        counts = np.bincount(column, minlength=vocabulary_size)
+        np.concatenate([[0], np.cumsum(counts)]).astype(np.int64).tofile(index_dir / f"{name}.offsets.bin")
+
+    manifest = {"version": INDEX_VERSION, "tokens": token_cache.manifest["tokens"]}
+    with open(index_dir / "manifest.json", "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=4)
+
+    print(f"Indexed {token_cache.manifest['tokens']} tokens in", index_dir)
+
+
+def parse_pattern(pattern):
+    """
+    Parse a query pattern. A pattern is a sequence of token patterns separated by spaces,
+    each a '&'-separated list of conditions like 'lemma=hafa' or 'tag=sþ*', where a
+    trailing '*' matches any value with that prefix. A bare value, like 'hefur', matches
+    the word, and '*' matches any token.
+
+    Args:
+        pattern: The query pattern, e.g. 'lemma=hafa tag=sþ*'.
+
+    Returns:
+        list[list[tuple]]: The (column, value, is_prefix) conditions of each token pattern.
+
+    Raises:
+        ValueError: If a condition names a column that is not indexed.
+    """
+    token_patterns = []
+    for token_pattern in pattern.split():
+        conditions = []
+        for condition in token_pattern.split("&"):
+            if condition == "*":
+                continue
+            name, separator, value = condition.partition("=")
+            if not separator:
+                name, value = "word", condition
+            name = name or "word"
+            if name not in INDEXED_COLUMNS:
+                raise ValueError(f"Unknown column '{name}' in '{condition}'. Choose from {INDEXED_COLUMNS}.")
+            is_prefix = value.endswith("*")
+            conditions.append((name, value.rstrip("*") if is_prefix else value, is_prefix))
+        token_patterns.append(conditions)
+    return token_patterns
+
+
+class ConcordanceIndex:
+    """
+    Answer sequence pattern queries from the inverted index of a token cache, without
+    reading the XML. The index is memory-mapped, so a query only reads the postings of
+    the values in its pattern.
+
+    Args:
+        token_cache: The token cache. Its index must have been built with build_concordance_index.
+    """
+
+    def __init__(self, token_cache: TokenCache):
+        self.cache = token_cache
+        index_dir = token_cache.cache_dir / INDEX_DIR
+        manifest_path = index_dir / "manifest.json"
+        if not manifest_path.exists():
+            raise ValueError(f"The token cache in {token_cache.cache_dir} has no concordance index. Build it with the 'index' command.")
+        with open(manifest_path, "r", encoding="utf-8") as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest["version"] != INDEX_VERSION or manifest["tokens"] != token_cache.manifest["tokens"]:
+            raise ValueError(f"The concordance index in {index_dir} does not match the token cache. Build it again.")
+
+        self.postings = {name: read_column(index_dir / f"{name}.postings.bin", np.int64) for name in INDEXED_COLUMNS}
+        self.offsets = {name: read_column(index_dir / f"{name}.offsets.bin", np.int64) for name in INDEXED_COLUMNS}
+        self.file_starts = np.array([file["speeches"][0] for file in token_cache.manifest["files"]], dtype=np.int64)
+        self.ids = {}
+
+    def get_ids(self, value, is_prefix):
+        """
+        Get the vocabulary ids of a value, or of all values with a prefix.
+
+        Args:
+            value: The value.
+            is_prefix: True to match all values that start with it.
+
+        Returns:
+            np.ndarray: The ids.
+        """
+        if is_prefix:
+            return np.array(
+                [index for index, entry in enumerate(self.cache.vocabulary) if entry and entry.startswith(value)],
+                dtype=np.int64,
+            )
+        if not self.ids:
+            self.ids = {entry: index for index, entry in enumerate(self.cache.vocabulary)}
+        return np.array([self.ids[value]] if value in self.ids else [], dtype=np.int64)
+
+    def get_positions(self, conditions):
+        """
+        Get the positions of the tokens that match all conditions of a token pattern.
+
+        Args:
+            conditions: List of (column, value, is_prefix) conditions.
+
+        Returns:
+            np.ndarray: The sorted positions.
+        """
+        positions = None
+        for name, value, is_prefix in conditions:
+            offsets = self.offsets[name]
+            slices = [
+                self.postings[name][offsets[index] : offsets[index + 1]]
+                for index in self.get_ids(value, is_prefix)
+                if offsets[index] < offsets[index + 1]
+            ]
+            matched = np.sort(np.concatenate(slices)) if len(slices) > 1 else np.array(slices[0] if slices else [], dtype=np.int64)
+            positions = matched if positions is None else np.intersect1d(positions, matched, assume_unique=True)
+        return positions
+
+    def find(self, pattern):
+        """
+        Find the token sequences that match a pattern within a sentence.
+
+        Args:
+            pattern: The query pattern, see parse_pattern.
+
+        Returns:
+            tuple: Arrays of the start positions of the matches and of their sentence indices.
+
+        Raises:
+            ValueError: If the pattern is empty or only has wildcards.
+        """
+        token_patterns = parse_pattern(pattern)
+        if not any(token_patterns):
+            raise ValueError("The pattern needs at least one condition that is not '*'.")
+
+        starts = None
+        for offset, conditions in enumerate(token_patterns):
+            if not conditions:
+                continue
+            candidates = self.get_positions(conditions) - offset
+            starts = candidates if starts is None else np.intersect1d(starts, candidates, assume_unique=True)
+
+        # Drop matches that start before the corpus or cross the end of their sentence
+        starts = starts[starts >= 0]
+        sentences = np.searchsorted(self.cache.sentence_offsets, starts, side="right") - 1
+        within = starts + len(token_patterns) <= self.cache.sentence_offsets[sentences + 1]
+        return starts[within], sentences[within]
+
+    def query(self, pattern, context=10, limit=None):
+        """
+        Get the matches of a pattern with their context, keyword-in-context style.
+
+        Args:
+            pattern: The query pattern, see parse_pattern.
+            context: Maximum number of words before and after the match, within the sentence.
+            limit: Optional maximum number of matches.
+
+        Returns:
+            list[list]: One row per match, with the columns in CONCORDANCE_HEADERS.
+        """
+        starts, sentences = self.find(pattern)
+        starts, sentences = starts[:limit], sentences[:limit]
+        length = len(parse_pattern(pattern))
+        speeches = np.searchsorted(self.cache.speech_offsets, sentences, side="right") - 1
+        files = np.searchsorted(self.file_starts, speeches, side="right") - 1
+
+        vocabulary = self.cache.vocabulary
+        columns = self.cache.columns
+        manifest_files = self.cache.manifest["files"]
+        rows = []
+        for start, sentence, speech, file in zip(starts.tolist(), sentences.tolist(), speeches.tolist(), files.tolist()):
+            sentence_start, sentence_end = self.cache.sentence_offsets[sentence : sentence + 2].tolist()
+            end = start + length
+            words = [vocabulary[word] or "" for word in columns["word"][max(sentence_start, start - context) : min(sentence_end, end + context)].tolist()]
+            before = min(context, start - sentence_start)
+
+            date = manifest_files[file]["date"] or ""
+            attributes = self.cache.speech_attributes[speech]
+            rows.append(
+                [
+                    date.split("-")[0],
+                    date,
+                    attributes.get("who", "")[1:],
+                    attributes.get("{http://www.w3.org/XML/1998/namespace}id", ""),
+                    " ".join(words[:before]),
+                    " ".join(words[before : before + length]),
+                    " ".join(words[before + length :]),
+                    " ".join(vocabulary[lemma] or "" for lemma in columns["lemma"][start:end].tolist()),
+                    " ".join(vocabulary[tag] or "" for tag in columns["tag"][start:end].tolist()),
+                ]
+            )
+        return rows
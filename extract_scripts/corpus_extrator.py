@@ -1,12 +1,43 @@
 from tqdm import tqdm
 import pandas as pd
 import json
+import io
 from file_handler import FileHandler
-from collections import defaultdict
+from aggregates import AggregateCounter
+from results_db import save_results_db
+from speech_features import SPEECH_FEATURE_HEADERS
+from sharding import KEY_HEADERS, shard_path
+from token_cache import TokenCache
+from corpus_reader import CorpusReader
+from speech_feature_cache import SpeechFeatureCache
+from sampling import SpeechSample, SampleEstimator, SAMPLE_WEIGHT_HEADER
+from detector_cache import DetectorCache, DETECTOR_CACHE_SIZE
+from release_diff import PreviousResults, save_manifest, get_manifest_path
+from near_duplicates import NearDuplicateIndex, DEDUP_CLUSTER_HEADER
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import defaultdict, deque, namedtuple
 from pathlib import Path
 import xml.etree.ElementTree as ET
-from utils import TEI_NS, XML_NS, headers, SaveConfig
+from utils import TEI_NS, XML_NS, TASK_METADATA, METADATA_SOURCES, headers, SaveConfig, LazyMetadata, file_year, write_tsv, pad_row
 from typing import Optional
+import threading
+import time
+
+# What CorpusExtractor.extract_file returns for each file
+FileResults = namedtuple(
+    "FileResults",
+    [
+        "results",
+        "speech_features",
+        "features_reused",
+        "sample_units",
+        "sentences_reused",
+        "sentences_checked",
+        "fingerprints",
+        "speeches_carried",
+        "signatures",
+    ],
+)
 
 
 class CorpusExtractor:
@@ -20,66 +51,508 @@ class CorpusExtractor:
         freq_list: Path to the frequency list file.
         task_type: Type of task to perform (e.g., extraction type).
         save_data: Optional configuration for saving data.
+        metadata: Optional metadata dictionary already loaded by another CorpusExtractor.
+            If given, the metadata and dictionary files are not read again.
+        token_cache: Optional TokenCache to read the files from instead of parsing the XML.
+        corpus_reader: Optional CorpusReader to read the files and the metadata file with,
+            for compressed files and archives. The files are then read in a background thread.
+        feature_cache: Optional SpeechFeatureCache to reuse speech-level features from.
+        sample: Optional SpeechSample. Only the sampled speeches are processed, and the
+            results get a sample_weight column and rate estimates.
+        all_speech_features: Compute the speech-level features of every processed speech,
+            for save_speech_features. Otherwise they are only computed for speeches with results.
+        detector_cache_size: Number of distinct sentences whose detector output is kept
+            for reuse. 0 turns the cache off.
+        previous: Optional PreviousResults of a run on an earlier release. The results
+            of unchanged speeches are carried forward, and only the other speeches are checked.
+        record_fingerprints: Record the content hash of every processed speech, for
+            save_fingerprints. Always done with previous.
+        dedup: Cluster the processed speeches with their near-duplicates, see
+            NearDuplicateIndex, and add a dedup_cluster column to the results.
     """
     def __init__(
-        self, metadata_file, speech_type_file, phonetic_dict_file, freq_list, task_type, save_data: Optional[SaveConfig] = None
+        self,
+        metadata_file,
+        speech_type_file,
+        phonetic_dict_file,
+        freq_list,
+        task_type,
+        save_data: Optional[SaveConfig] = None,
+        metadata: Optional[dict] = None,
+        token_cache: Optional[TokenCache] = None,
+        corpus_reader: Optional[CorpusReader] = None,
+        feature_cache: Optional[SpeechFeatureCache] = None,
+        sample: Optional[SpeechSample] = None,
+        all_speech_features: bool = False,
+        detector_cache_size: int = DETECTOR_CACHE_SIZE,
+        previous: Optional[PreviousResults] = None,
+        record_fingerprints: bool = False,
+        dedup: bool = False,
     ):
-        self.metadata_root = ET.parse(metadata_file)
-        self.metadata = self.get_metadata(
-            speech_type_file, phonetic_dict_file, freq_list
-        )
+        self.metadata_file = metadata_file
+        self.metadata_root = None
+        self.metadata_lock = threading.Lock()
+        self.corpus_reader = corpus_reader
+        if metadata is None:
+            metadata = self.get_metadata(
+                speech_type_file, phonetic_dict_file, freq_list
+            )
+            self.load_metadata(metadata, TASK_METADATA[task_type])
+        self.metadata = metadata
         self.results = []
+        self.row_counts = []
+        self.speech_features = []
         self.task_type = task_type
         self.data = None
         self.save_data = save_data
+        self.token_cache = token_cache
+        self.feature_cache = feature_cache
+        self.sample = sample
+        self.all_speech_features = all_speech_features
+        self.detector_cache_size = detector_cache_size
+        self.detector_cache = DetectorCache(detector_cache_size) if detector_cache_size else None
+        self.previous = previous
+        self.record_fingerprints = record_fingerprints
+        self.fingerprints = {}
+        self.dedup = dedup
+        self.dedup_index = NearDuplicateIndex() if dedup else None
+        self.dedup_clusters = {}
+        self.aggregates = AggregateCounter(task_type, headers[task_type])
+        self.sample_estimator = SampleEstimator(task_type, headers[task_type]) if sample else None
 
         if save_data and save_data.save_path:
             save_data.save_path.mkdir(parents=True, exist_ok=True)
 
-    def process_files(self, teifiles: list[Path]):
+    def process_files(self, teifiles: list[Path], workers=1, executor="thread"):
         """
         Process a list of TEI files to extract data based on the task type.
 
         Args:
             teifiles: List of paths to TEI files to process.
+            workers: Number of files to process in parallel.
+            executor: "thread" to process the files in threads that share the metadata,
+                or "process" to process them in worker processes with a copy of it each.
         """
-        for teifile in tqdm(teifiles, desc=f"Extracting {self.task_type} data"):
-            if self.save_data and self.save_data.years:
-                try:
-                    if int(teifile.parent.stem) not in self.save_data.years:
-                        continue
-                except ValueError:
-                    continue
-            handler = FileHandler(teifile, self.metadata, self.task_type, save_data=self.save_data)
-            results = handler.get_results()
+        features_reused = features_computed = 0
+        sentences_reused = sentences_checked = 0
+        speeches_carried = 0
+
+        extracted = self.iter_extracted(teifiles, workers, executor)
+        for teifile, extraction in tqdm(extracted, total=len(teifiles), desc=f"Extracting {self.task_type} data"):
+            results = []
+            if extraction:
+                results = extraction.results
+                sentences_reused += extraction.sentences_reused
+                sentences_checked += extraction.sentences_checked
+                speeches_carried += extraction.speeches_carried
+                self.fingerprints.update(extraction.fingerprints)
+                if self.dedup_index:
+                    self.dedup_index.add(extraction.signatures)
+                if extraction.speech_features is not None:
+                    self.speech_features.append(extraction.speech_features)
+                    features_reused += extraction.features_reused
+                    features_computed += len(extraction.speech_features) - extraction.features_reused
+                if self.sample_estimator:
+                    self.sample_estimator.add_units(extraction.sample_units)
             self.results.extend(results)
+            self.row_counts.append((teifile, len(results)))
+            self.aggregates.update(results)
 
         self.data = pd.DataFrame(self.results)
 
+        if self.dedup_index:
+            self.dedup_clusters = self.dedup_index.get_clusters()
+            print(
+                f"Near-duplicates: {len(self.dedup_clusters)} of {len(self.dedup_index.speech_ids)} speeches "
+                f"in {len(set(self.dedup_clusters.values()))} clusters"
+            )
+
+        if self.feature_cache:
+            print(f"Speech feature cache: {features_reused} speeches reused, {features_computed} computed")
+
+        if self.previous:
+            print(f"Carried forward {speeches_carried} of {len(self.fingerprints)} speeches from {self.previous}")
+
+        if self.detector_cache is not None and sentences_checked:
+            print(
+                f"Detector cache: {sentences_reused} of {sentences_checked} sentences reused "
+                f"({sentences_reused / sentences_checked:.1%} hits)"
+            )
+
+    def iter_extracted(self, teifiles: list[Path], workers=1, executor="thread"):
+        """
+        Extract the files one at a time, in order, without keeping their results.
+
+        Args:
+            teifiles: List of paths to TEI files.
+            workers: Number of files to process in parallel.
+            executor: "thread" or "process", see process_files.
+
+        Yields:
+            tuple: Each file and its FileResults, or None if the file is not selected.
+        """
+        extracted = self.extract_files(teifiles, workers, executor)
+        try:
+            for teifile in teifiles:
+                yield teifile, next(extracted) if self.is_selected(teifile) else None
+        finally:
+            extracted.close()
+
+    def iter_results(self, teifiles: list[Path], workers=1, executor="thread"):
+        """
+        Extract the files and yield their result rows as soon as each file is done, so the
+        results can be filtered or the extraction stopped early without waiting for the
+        whole corpus. The rows are not kept, nor counted in the aggregate tables.
+
+        Args:
+            teifiles: List of paths to TEI files.
+            workers: Number of files to process in parallel.
+            executor: "thread" or "process", see process_files.
+
+        Yields:
+            list: The result rows in file order, padded to the columns in headers[task_type].
+        """
+        length = len(headers[self.task_type])
+        for _, extraction in self.iter_extracted(teifiles, workers, executor):
+            if extraction:
+                for row in extraction.results:
+                    yield pad_row(row, length)
+
+    def iter_batches(self, teifiles: list[Path], batch_size=10000, workers=1, executor="thread"):
+        """
+        Extract the files and yield their results in DataFrames of up to batch_size rows.
+
+        Args:
+            teifiles: List of paths to TEI files.
+            batch_size: Maximum number of rows per DataFrame.
+            workers: Number of files to process in parallel.
+            executor: "thread" or "process", see process_files.
+
+        Yields:
+            pd.DataFrame: The next rows of the results, with the columns in headers[task_type].
+        """
+        columns = headers[self.task_type]
+        batch = []
+        for row in self.iter_results(teifiles, workers, executor):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield pd.DataFrame(batch, columns=columns)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns)
+
+    def extract_files(self, teifiles: list[Path], workers=1, executor="thread"):
+        """
+        Extract the selected files, in order. With more than one worker, up to twice as
+        many files as there are workers are in progress at a time.
+
+        Args:
+            teifiles: List of paths to TEI files.
+            workers: Number of files to process in parallel.
+            executor: "thread" or "process", see process_files.
+
+        Yields:
+            FileResults: The result of extract_file for each selected file.
+        """
+        selected = [teifile for teifile in teifiles if self.is_selected(teifile)]
+
+        if workers <= 1:
+            yield from map(self.extract_file, selected, self.read_files(selected, prefetch=True))
+            return
+
+        if executor == "process":
+            pool = ProcessPoolExecutor(workers, initializer=init_worker, initargs=(self.get_worker_args(),))
+            jobs = self.get_worker_jobs(selected)
+        else:
+            pool = ThreadPoolExecutor(workers)
+            sources = self.read_files(selected, prefetch=True)
+            jobs = ((self.extract_file, teifile, source) for teifile, source in zip(selected, sources))
+
+        with pool:
+            pending = deque()
+            try:
+                for function, *args in jobs:
+                    pending.append(pool.submit(function, *args))
+                    if len(pending) >= 2 * workers:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                # When the caller stops early, the files not started yet are dropped
+                for future in pending:
+                    future.cancel()
+
+    def get_worker_args(self):
+        """
+        Get what worker processes need to make their own CorpusExtractor. The metadata
+        is passed as a plain dictionary, as the loaders of LazyMetadata can not be pickled.
+
+        Returns:
+            dict: Keyword arguments for CorpusExtractor.
+        """
+        return {
+            "task_type": self.task_type,
+            "save_data": self.save_data,
+            "metadata": dict(self.metadata),
+            "token_cache": self.token_cache,
+            "corpus_reader": self.corpus_reader,
+            "feature_cache": self.feature_cache,
+            "sample": self.sample,
+            "all_speech_features": self.all_speech_features,
+            "detector_cache_size": self.detector_cache_size,
+            "previous": self.previous,
+            "record_fingerprints": self.record_fingerprints,
+            "dedup": self.dedup,
+        }
+
+    def get_worker_jobs(self, teifiles: list[Path]):
+        """
+        Get the jobs for worker processes. Workers read the files themselves, except
+        members of tar archives, which can only be read in one pass and are read here.
+
+        Args:
+            teifiles: List of paths to TEI files.
+
+        Yields:
+            tuple: The function to run in the worker and its arguments.
+        """
+        if self.corpus_reader and self.corpus_reader.archive_type == "tar":
+            for teifile, source in zip(teifiles, self.corpus_reader.prefetch(teifiles)):
+                yield extract_in_worker, teifile, source.getvalue()
+        else:
+            for teifile in teifiles:
+                yield extract_in_worker, teifile
+
+    def is_selected(self, teifile: Path):
+        """
+        Check if a TEI file's year is in the save configuration.
+
+        Args:
+            teifile: Path to the TEI file.
+
+        Returns:
+            bool: False if the file should be skipped.
+        """
+        if self.save_data and self.save_data.filters_years():
+            try:
+                return self.save_data.includes_year(int(file_year(teifile)))
+            except ValueError:
+                return False
+        return True
+
+    def read_files(self, teifiles: list[Path], prefetch=False):
+        """
+        Get the sources FileHandler reads the TEI files from: the files themselves,
+        their contents read by the corpus reader, or the files in the token cache.
+
+        Args:
+            teifiles: List of paths to TEI files.
+            prefetch: Whether to read the files in a background thread.
+
+        Yields:
+            The source of each file, in order.
+        """
+        if self.token_cache:
+            yield from map(self.token_cache.get_file, teifiles)
+        elif self.corpus_reader and prefetch:
+            yield from self.corpus_reader.prefetch(teifiles)
+        elif self.corpus_reader:
+            yield from self.corpus_reader.read_files(teifiles)
+        else:
+            yield from teifiles
+
+    def extract_file(self, teifile: Path, source=None):
+        """
+        Extract the results and speech features of a single TEI file. This only reads
+        the shared metadata, so it can run in several threads at once.
+
+        Args:
+            teifile: Path to the TEI file to process.
+            source: Optional source of the file from read_files. Defaults to reading the file.
+
+        Returns:
+            FileResults: The results, speech features and sampled speeches of the file.
+        """
+        if source is None:
+            source = next(self.read_files([teifile]))
+        handler = FileHandler(
+            source,
+            self.metadata,
+            self.task_type,
+            save_data=self.save_data,
+            feature_cache=self.feature_cache,
+            sample=self.sample,
+            all_speech_features=self.all_speech_features,
+            detector_cache=self.detector_cache,
+            previous=self.previous,
+            record_fingerprints=self.record_fingerprints,
+            dedup=self.dedup,
+        )
+        return FileResults(
+            handler.get_results(),
+            handler.get_speech_features(),
+            handler.features_reused,
+            handler.get_sample_units(),
+            handler.sentences_reused,
+            handler.sentences_checked,
+            handler.get_fingerprints(),
+            handler.speeches_carried,
+            handler.get_signatures(),
+        )
+
     def save_results(self, save_path, file_name=None):
         """
-        Save the extracted results to a specified path in TSV format.
+        Save the extracted results to a specified path in TSV format,
+        along with the aggregate tables used by the R plotting scripts.
+
+        Args:
+            save_path: Directory where the results will be saved.
+            file_name: Optional name for the output file. Defaults to task type.
+        """
+        save_path.mkdir(parents=True, exist_ok=True)
+
+        save_path = self.get_results_path(save_path, file_name)
+
+        write_tsv(save_path, self.get_headers(), self.get_rows())
+        self.aggregates.save(save_path)
+
+        print("Data saved to", save_path)
+
+        if self.sample_estimator:
+            self.sample_estimator.save(save_path, self.results)
+
+    def get_headers(self):
+        """
+        Get the column names of the output, which depend on the task type, on
+        whether the run is sampled and on whether near-duplicates are clustered.
+
+        Returns:
+            list[str]: The column names.
+        """
+        columns = headers[self.task_type]
+        if self.sample_estimator:
+            columns = [*columns, SAMPLE_WEIGHT_HEADER]
+        if self.dedup:
+            columns = [*columns, DEDUP_CLUSTER_HEADER]
+        return columns
+
+    def get_rows(self):
+        """
+        Get the output rows, padded to the task's columns and with the extra columns
+        of get_headers added.
+
+        Yields:
+            list: The output rows.
+        """
+        length = len(headers[self.task_type])
+        for row in self.results:
+            speech_id = row[-1]
+            row = pad_row(row, length)
+            if self.sample_estimator:
+                row = [*row, self.sample_estimator.get_row_weight(row)]
+            if self.dedup:
+                # Speeches without near-duplicates are their own cluster
+                row = [*row, self.dedup_clusters.get(speech_id, speech_id)]
+            yield row
+
+    def save_shard(self, save_path, file_name, shard, shard_count, file_indices: dict):
+        """
+        Save the results of one shard of a multi-node run. Each row starts with the
+        index of its file among all corpus files and its index within the file,
+        which the merge step uses to restore the order of a single-node run.
 
         Args:
             save_path: Directory where the results will be saved.
             file_name: Optional name for the output file. Defaults to task type.
+            shard: The shard number.
+            shard_count: The number of shards.
+            file_indices: Dictionary mapping every corpus file to its index.
         """
         save_path.mkdir(parents=True, exist_ok=True)
+        save_path = shard_path(self.get_results_path(save_path, file_name), shard, shard_count)
+
+        keys = [
+            (file_indices[teifile], row_index)
+            for teifile, row_count in self.row_counts
+            for row_index in range(row_count)
+        ]
+        rows = (
+            [*key, *pad_row(row, len(headers[self.task_type]))]
+            for key, row in zip(keys, self.results)
+        )
+        write_tsv(save_path, [*KEY_HEADERS, *headers[self.task_type]], rows)
+        self.aggregates.save(save_path)
+
+        print("Shard saved to", save_path)
+
+    def get_results_path(self, save_path, file_name=None):
+        """
+        Get the path of the results TSV file.
 
+        Args:
+            save_path: Directory where the results are saved.
+            file_name: Optional name for the output file. Defaults to task type.
+
+        Returns:
+            Path: The path of the TSV file.
+        """
         if file_name:
-            save_path = save_path / f"{file_name}.tsv" 
+            return save_path / f"{file_name}.tsv"
+        return save_path / f"{self.task_type}.tsv"
+
+    def save_fingerprints(self, save_path, file_name=None):
+        """
+        Save the content hashes of the processed speeches next to the results, so a run
+        on a later release can carry the results forward with PreviousResults.
+
+        Args:
+            save_path: Directory where the results are saved.
+            file_name: Optional name of the results file. Defaults to task type.
+        """
+        save_path.mkdir(parents=True, exist_ok=True)
+        manifest_path = get_manifest_path(self.get_results_path(save_path, file_name))
+        save_manifest(manifest_path, self.fingerprints)
+
+        print("Speech manifest saved to", manifest_path)
+
+    def save_speech_features(self, save_path, file_name=None):
+        """
+        Save the speech-level features of all processed speeches in TSV format.
+
+        Args:
+            save_path: Directory where the features will be saved.
+            file_name: Optional name of the results file they belong to. Defaults to task type.
+        """
+        save_path.mkdir(parents=True, exist_ok=True)
+        save_path = save_path / f"{file_name or self.task_type}.speech_features.tsv"
+
+        if self.speech_features:
+            data = pd.concat(self.speech_features, ignore_index=True)
         else:
-            save_path = save_path / f"{self.task_type}.tsv"
+            data = pd.DataFrame(columns=SPEECH_FEATURE_HEADERS)
+        data.to_csv(save_path, sep="\t", index=False)
 
-        self.data.to_csv(
-            save_path, sep="\t", index=False, header=headers[self.task_type]
-        )
+        print("Speech features saved to", save_path)
 
-        print("Data saved to", save_path)
+    def save_results_db(self, db_path: Path, table_name=None):
+        """
+        Save the extracted results to an indexed table in an SQLite database.
+
+        Args:
+            db_path: Path to the SQLite database file.
+            table_name: Optional name for the table. Defaults to task type.
+        """
+        data = pd.DataFrame(list(self.get_rows()), columns=self.get_headers())
+        table_name = table_name or self.task_type
+        save_results_db(data, db_path, table_name)
+
+        print(f"Data saved to table '{table_name}' in", db_path)
 
     def get_metadata(self, speech_type_file, phonetic_dict_file, freq_list):
         """
         Retrieve metadata including speech types, phonetic dictionary, and frequency list.
+        Each entry is loaded the first time it is used, so e.g. the phonetic dictionary
+        is never read for the SF tasks.
 
         Args:
             speech_type_file: Path to the speech type file.
@@ -87,16 +560,52 @@ class CorpusExtractor:
             freq_list: Path to the frequency list file.
 
         Returns:
-            A dictionary containing metadata information.
+            A LazyMetadata dictionary containing metadata information.
         """
-        return {
-            "mp_dict": self.get_mp_data(),
-            "parties": self.get_parties(),
-            "relations": self.get_relations(),
-            "speech_types": self.get_speech_types(speech_type_file),
-            "phone_dict": self.get_phone_dict(phonetic_dict_file),
-            "freq_dict": self.get_frq_dict(freq_list),
-        }
+        return LazyMetadata({
+            "mp_dict": self.get_mp_data,
+            "parties": self.get_parties,
+            "relations": self.get_relations,
+            "speech_types": lambda: self.get_speech_types(speech_type_file),
+            "phone_dict": lambda: self.get_phone_dict(phonetic_dict_file),
+            "freq_dict": lambda: self.get_frq_dict(freq_list),
+        })
+
+    def load_metadata(self, metadata: LazyMetadata, keys: list):
+        """
+        Load metadata entries concurrently, one thread per source file, so the start-up
+        time is about that of the slowest file instead of their sum. The time each
+        source took is printed.
+
+        Args:
+            metadata: The LazyMetadata from get_metadata.
+            keys: The metadata keys to load.
+        """
+        sources = {}
+        for key in keys:
+            sources.setdefault(METADATA_SOURCES[key], []).append(key)
+        start = time.perf_counter()
+        timings = metadata.load_concurrently(sources)
+        print(
+            f"Loaded metadata in {time.perf_counter() - start:.2f} s: "
+            + ", ".join(f"{source} {seconds:.2f} s" for source, seconds in timings.items())
+        )
+
+    def get_metadata_root(self):
+        """
+        Parse the metadata XML file the first time it is needed. The speaker, party and
+        relation entries are all read from it, so it is only parsed once.
+
+        Returns:
+            ElementTree: The parsed metadata file.
+        """
+        with self.metadata_lock:
+            if self.metadata_root is None:
+                metadata_file = self.metadata_file
+                if self.corpus_reader:
+                    metadata_file = self.corpus_reader.read(metadata_file)
+                self.metadata_root = ET.parse(metadata_file)
+        return self.metadata_root
 
     def get_phone_dict(self, dict_file):
         """
@@ -154,7 +663,7 @@ class CorpusExtractor:
         mp_dict = dict()
 
         # get mp person data
-        mps = self.metadata_root.findall(".//tei:person", TEI_NS)
+        mps = self.get_metadata_root().findall(".//tei:person", TEI_NS)
         for mp in mps:
 
             mp_id = mp.attrib[f"{XML_NS}id"]
@@ -192,7 +701,7 @@ class CorpusExtractor:
         Returns:
             A dictionary mapping party IDs to their names.
         """
-        orgs = self.metadata_root.findall(".//tei:org", TEI_NS)
+        orgs = self.get_metadata_root().findall(".//tei:org", TEI_NS)
         parties = {}
         for org in orgs:
 
@@ -210,7 +719,7 @@ class CorpusExtractor:
         Returns:
             A list of relations extracted from the metadata.
         """
-        relations = self.metadata_root.findall(".//tei:relation", TEI_NS)
+        relations = self.get_metadata_root().findall(".//tei:relation", TEI_NS)
         return relations
 
     def get_speech_types(self, speech_type_file):
@@ -230,3 +739,33 @@ class CorpusExtractor:
         speech_types = speech_types.to_dict()["type"]
 
         return speech_types
+
+
+# The CorpusExtractor of a worker process, made once by init_worker
+_worker_corpus = None
+
+
+def init_worker(worker_args):
+    """
+    Make the CorpusExtractor of a worker process.
+
+    Args:
+        worker_args: Keyword arguments from CorpusExtractor.get_worker_args.
+    """
+    global _worker_corpus
+    _worker_corpus = CorpusExtractor(None, None, None, None, **worker_args)
+
+
+def extract_in_worker(teifile: Path, data: Optional[bytes] = None):
+    """
+    Extract a TEI file in a worker process.
+
+    Args:
+        teifile: Path to the TEI file.
+        data: Optional contents of the file, if the worker can not read it itself.
+
+    Returns:
+        FileResults: The result of CorpusExtractor.extract_file.
+    """
+    source = io.BytesIO(data) if data is not None else None
+    return _worker_corpus.extract_file(teifile, source)
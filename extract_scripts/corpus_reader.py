@@ -0,0 +1,332 @@
+from pathlib import Path
+import threading
+import tarfile
+import zipfile
+import queue
+import gzip
+import io
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_SUFFIXES = (".gz", ".zst")
+XML_SUFFIXES = (".xml", ".xml.gz", ".xml.zst")
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz")
+ZIP_SUFFIXES = (".zip",)
+
+# Number of files read ahead of the parser by CorpusReader.prefetch
+PREFETCH_DEPTH = 8
+
+
+def is_xml_file(name):
+    """
+    Check if a file name is an XML file, compressed or not.
+
+    Args:
+        name: The file name or path.
+
+    Returns:
+        bool: True for names ending in .xml, .xml.gz or .xml.zst.
+    """
+    return str(name).endswith(XML_SUFFIXES)
+
+
+def get_xml_name(path: Path):
+    """
+    Get the name of an XML file without its compression suffix.
+
+    Args:
+        path: Path of the file.
+
+    Returns:
+        str: e.g. 'file.xml' for 'file.xml.gz'.
+    """
+    name = path.name
+    for suffix in COMPRESSION_SUFFIXES:
+        name = name.removesuffix(suffix)
+    return name
+
+
+def is_archive(path: Path):
+    """
+    Check if a path is a tar or zip archive.
+
+    Args:
+        path: Path to check.
+
+    Returns:
+        bool: True for .tar, .tar.gz, .tgz and .zip files.
+    """
+    return path.is_file() and path.name.endswith(TAR_SUFFIXES + ZIP_SUFFIXES)
+
+
+def decompress(name, data: bytes):
+    """
+    Decompress the contents of a file according to its name.
+
+    Args:
+        name: The file name or path, ending in .gz, .zst or neither.
+        data: The contents of the file.
+
+    Returns:
+        bytes: The decompressed contents.
+    """
+    name = str(name)
+    if name.endswith(".gz"):
+        return gzip.decompress(data)
+    if name.endswith(".zst"):
+        with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)) as reader:
+            return reader.read()
+    return data
+
+
+class CorpusReader:
+    """
+    List and read the corpus XML files in a directory, a single file, or a tar or zip
+    archive, such as the original IGC-Parla download. Files can be compressed with
+    gzip or zstandard, and archive members are read without extracting the archive.
+
+    Files in archives get paths as if the archive were a directory, e.g.
+    'IGC-Parla.tar.gz/IGC-Parla/2015/file.xml', so their years and names are found
+    the same way as for unpacked files.
+
+    Args:
+        path: Path to the corpus directory, file or archive.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.archive_type = None
+        self.members = {}
+        self.sizes = {}
+        self.tar_offsets = {}
+
+        if path.is_file() and path.name.endswith(TAR_SUFFIXES):
+            self.archive_type = "tar"
+            # Keep the archive order, so the archive is read in a single pass
+            with tarfile.open(path) as archive:
+                members = [member for member in archive if member.isfile()]
+            sizes = {member.name: member.size for member in members}
+            names = list(sizes)
+            # Members of an uncompressed archive can be read directly at their offsets
+            if not path.name.endswith(TAR_SUFFIXES[1:]):
+                self.tar_offsets = {member.name: member.offset_data for member in members}
+        elif path.is_file() and path.name.endswith(ZIP_SUFFIXES):
+            self.archive_type = "zip"
+            with zipfile.ZipFile(path) as archive:
+                sizes = {info.filename: info.file_size for info in archive.infolist() if not info.is_dir()}
+            names = sorted(sizes)
+        elif path.is_dir():
+            names = None
+            self.files = sorted(
+                file for suffix in XML_SUFFIXES for file in path.rglob(f"*{suffix}")
+            )
+        else:
+            names = None
+            self.files = [path]
+
+        if names is not None:
+            self.members = {path / name: name for name in names}
+            self.sizes = {path / name: size for name, size in sizes.items()}
+            self.files = [file for file in self.members if is_xml_file(file.name)]
+
+        if zstandard is None and any(file.name.endswith(".zst") for file in self.files):
+            raise ValueError("Reading .zst files requires the zstandard package: pip install zstandard")
+
+    def get_files(self):
+        """
+        Get the XML files of the corpus.
+
+        Returns:
+            list[Path]: The files, sorted, or in archive order for tar archives.
+        """
+        return self.files
+
+    def get_root(self):
+        """
+        Get the directory the file paths are relative to.
+
+        Returns:
+            Path: The corpus directory or archive, or the parent directory of a single file.
+        """
+        if self.archive_type or self.path.is_dir():
+            return self.path
+        return self.path.parent
+
+    def find(self, name):
+        """
+        Find a file in the corpus by name, also when it is compressed.
+
+        Args:
+            name: The uncompressed file name, e.g. the metadata file name.
+
+        Returns:
+            Path: The first file with that name, or None if there is none.
+        """
+        names = (name, f"{name}.gz", f"{name}.zst")
+        if self.archive_type:
+            return next((file for file in self.members if file.name in names), None)
+        if self.path.is_dir():
+            return next((self.path / name for name in names if (self.path / name).exists()), None)
+
+    def get_size(self, path: Path):
+        """
+        Get the size of a file without reading it. For archive members, this is their
+        size when unpacked from the archive. Compressed .gz and .zst files are counted
+        at their compressed size.
+
+        Args:
+            path: Path of the file.
+
+        Returns:
+            int: The size in bytes.
+        """
+        if path in self.sizes:
+            return self.sizes[path]
+        return path.stat().st_size
+
+    def contains(self, path: Path):
+        """
+        Check if a path is a file of the corpus or an existing file.
+
+        Args:
+            path: The path to check.
+
+        Returns:
+            bool: True if the file can be read with read.
+        """
+        return path in self.members or path.is_file()
+
+    def read(self, path: Path):
+        """
+        Read a single file, decompressed. Archive members are read from the archive,
+        other paths from the file system.
+
+        Args:
+            path: Path of the file.
+
+        Returns:
+            io.BytesIO: The contents of the file.
+        """
+        if path not in self.members:
+            return io.BytesIO(decompress(path, path.read_bytes()))
+        return next(self.read_files([path]))
+
+    def read_files(self, paths: list[Path]):
+        """
+        Read files one by one, decompressed.
+
+        Args:
+            paths: Paths of the files to read.
+
+        Yields:
+            io.BytesIO: The contents of each file, in the order of paths.
+        """
+        if self.archive_type == "tar":
+            files = self.read_tar_members(paths)
+        else:
+            files = self.read_paths(paths)
+
+        for path, data in zip(paths, files):
+            yield io.BytesIO(decompress(path, data))
+
+    def read_paths(self, paths: list[Path]):
+        """
+        Read files from the file system or a zip archive.
+
+        Args:
+            paths: Paths of the files to read.
+
+        Yields:
+            bytes: The compressed contents of each file.
+        """
+        archive = None
+        try:
+            for path in paths:
+                if path in self.members:
+                    archive = archive or zipfile.ZipFile(self.path)
+                    yield archive.read(self.members[path])
+                else:
+                    yield path.read_bytes()
+        finally:
+            if archive:
+                archive.close()
+
+    def read_tar_members(self, paths: list[Path]):
+        """
+        Read members of a tar archive. Members of an uncompressed archive are read at
+        their offsets. A compressed archive can not be read from the middle, so it is read
+        in one pass, and members that are asked for out of archive order are kept in
+        memory until they are needed.
+
+        Args:
+            paths: Paths of the members to read.
+
+        Yields:
+            bytes: The compressed contents of each member.
+        """
+        if self.tar_offsets:
+            with open(self.path, "rb") as archive:
+                for path in paths:
+                    name = self.members[path]
+                    archive.seek(self.tar_offsets[name])
+                    yield archive.read(self.sizes[path])
+            return
+
+        wanted = {self.members[path] for path in paths}
+        read = {}
+        with tarfile.open(self.path, "r|*") as archive:
+            members = iter(archive)
+            for path in paths:
+                name = self.members[path]
+                while name not in read:
+                    member = next(members)
+                    if member.name in wanted:
+                        read[member.name] = archive.extractfile(member).read()
+                yield read.pop(name)
+
+    def prefetch(self, paths: list[Path], depth=PREFETCH_DEPTH):
+        """
+        Read files in a background thread, so reading and decompressing the next files
+        overlaps with parsing the current one.
+
+        Args:
+            paths: Paths of the files to read.
+            depth: Maximum number of files read ahead.
+
+        Yields:
+            io.BytesIO: The contents of each file, in the order of paths.
+        """
+        files = queue.Queue(maxsize=depth)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    files.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def read():
+            try:
+                for file in self.read_files(paths):
+                    if not put((file, None)):
+                        return
+            except Exception as error:
+                put((None, error))
+
+        thread = threading.Thread(target=read, name="corpus-prefetch", daemon=True)
+        thread.start()
+        try:
+            for _ in paths:
+                file, error = files.get()
+                if error:
+                    raise error
+                yield file
+        finally:
+            stop.set()
+            thread.join()
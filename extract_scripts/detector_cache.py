@@ -0,0 +1,59 @@
+from collections import OrderedDict
+import threading
+
+# Number of distinct sentences whose detector output is kept
+DETECTOR_CACHE_SIZE = 100000
+
+
+class DetectorCache:
+    """
+    A bounded, least recently used cache of the detector output of sentences.
+
+    Parliamentary speeches repeat the same formulaic sentences, like "Herra forseti .",
+    so the output of Speech.check_sentence is stored by the task type and the sentence's
+    tokens, and reused for every later occurrence. The output only depends on those and on
+    the metadata, so a cache must not be shared between runs with different dictionaries.
+
+    The cache is shared by all threads of a run and guarded by a lock.
+
+    Args:
+        maxsize: Maximum number of sentences to keep.
+    """
+
+    def __init__(self, maxsize=DETECTOR_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Get the stored output of a sentence, and mark it as recently used.
+
+        Args:
+            key: Tuple of the task type and the sentence's tokens.
+
+        Returns:
+            tuple: The stored result rows, or None if the sentence is not in the cache.
+        """
+        with self.lock:
+            rows = self.entries.get(key)
+            if rows is not None:
+                self.entries.move_to_end(key)
+            return rows
+
+    def put(self, key, rows):
+        """
+        Store the output of a sentence, dropping the least recently used one if full.
+
+        Args:
+            key: Tuple of the task type and the sentence's tokens.
+            rows: The result rows of the sentence. They are stored as a tuple, as they are shared.
+        """
+        with self.lock:
+            self.entries[key] = tuple(rows)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
@@ -0,0 +1,233 @@
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from corpus_extrator import CorpusExtractor
+from corpus_reader import CorpusReader
+from utils import TASK_TYPES, headers, SaveConfig
+from pathlib import Path
+import traceback
+import csv
+import json
+
+
+class ExtractionServer(HTTPServer):
+    """
+    A local HTTP server that keeps the corpus metadata and dictionaries in memory
+    and runs extraction jobs against them. Jobs run one at a time.
+
+    Args:
+        address: Tuple of host and port to listen on.
+        corpus: CorpusExtractor whose metadata is shared by all jobs.
+        xml_files: List of the corpus TEI files jobs can process.
+        corpus_dir: Directory of the corpus, used to resolve relative file paths in jobs.
+    """
+
+    def __init__(self, address, corpus: CorpusExtractor, xml_files: list[Path], corpus_dir: Path):
+        super().__init__(address, ExtractionRequestHandler)
+        self.corpus = corpus
+        self.xml_files = xml_files
+        self.corpus_dir = corpus_dir
+
+    def get_job_files(self, paths):
+        """
+        Resolve the files of a job. Directories are searched for XML files. Paths must
+        be in the corpus directory, so a job can not read files elsewhere on the disk.
+
+        Args:
+            paths: List of file or directory paths, absolute or relative to the corpus directory.
+                If empty, all corpus files are used.
+
+        Returns:
+            list[Path]: The TEI files to process.
+
+        Raises:
+            ValueError: If a path does not exist or is outside the corpus directory.
+        """
+        if not paths:
+            return self.xml_files
+
+        corpus_reader = self.corpus.corpus_reader
+        if self.corpus.token_cache or (corpus_reader and corpus_reader.archive_type):
+            return self.get_listed_job_files(paths)
+
+        corpus_dir = self.corpus_dir.resolve()
+        files = []
+        for path in paths:
+            path = (self.corpus_dir / path).resolve()
+            if not path.is_relative_to(corpus_dir):
+                raise ValueError(f"The path {path} is not in the corpus directory.")
+            if not path.exists():
+                raise ValueError(f"The path {path} does not exist.")
+            files.extend(CorpusReader(path).get_files())
+        return files
+
+    def get_listed_job_files(self, paths):
+        """
+        Resolve the files of a job when the corpus is read from an archive or a token cache,
+        whose files are not on disk.
+
+        Args:
+            paths: List of file or directory paths relative to the archive or cache.
+
+        Returns:
+            list[Path]: The corpus files in or under the given paths.
+        """
+        files = []
+        for path in paths:
+            path = self.corpus_dir / path
+            matches = [
+                teifile for teifile in self.xml_files
+                if teifile == path or path in teifile.parents
+            ]
+            if not matches:
+                raise ValueError(f"The path {path} is not in the corpus.")
+            files.extend(matches)
+        return files
+
+
+class ExtractionRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handles requests to an ExtractionServer.
+
+    GET /status returns the corpus the server has loaded.
+    POST /extract takes a JSON job and streams the results back as TSV, file by file.
+    A job looks like {"task_type": "hardspeech", "config": {...}, "paths": ["2013"]},
+    where "config" holds SaveConfig fields other than "save_path", as the server writes
+    no files. Only "task_type" is required, and jobs must be sent as application/json, so
+    a web page can not post one without the browser asking the server first. If the job
+    fails after the results have started, the stream ends with an "Error: ..." line.
+    """
+
+    server: ExtractionServer
+
+    def do_GET(self):
+        if self.path != "/status":
+            self.send_error(404, "Unknown path. Use GET /status or POST /extract.")
+            return
+
+        status = {
+            "corpus_dir": str(self.server.corpus_dir.resolve()),
+            "files": len(self.server.xml_files),
+            "task_types": TASK_TYPES,
+        }
+        self.send_json(status)
+
+    def do_POST(self):
+        if self.path != "/extract":
+            self.send_error(404, "Unknown path. Use GET /status or POST /extract.")
+            return
+        if self.headers.get_content_type() != "application/json":
+            self.send_error(415, "Jobs must be sent with Content-Type: application/json.")
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            job = json.loads(self.rfile.read(length) or b"{}")
+            task_type = job.get("task_type", TASK_TYPES[0])
+            if task_type not in TASK_TYPES:
+                raise ValueError(f"Unknown task type '{task_type}'. Choose one of {TASK_TYPES}.")
+            config = get_job_config(job.get("config"))
+            files = self.server.get_job_files(job.get("paths", []))
+        except (ValueError, TypeError) as error:
+            self.send_error(400, str(error))
+            return
+
+        corpus = CorpusExtractor(
+            None,
+            None,
+            None,
+            None,
+            task_type,
+            config,
+            metadata=self.server.corpus.metadata,
+            token_cache=self.server.corpus.token_cache,
+            corpus_reader=self.server.corpus.corpus_reader,
+            feature_cache=self.server.corpus.feature_cache,
+        )
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/tab-separated-values; charset=utf-8")
+        self.end_headers()
+
+        writer = csv.writer(_LineWriter(self.wfile), delimiter="\t", lineterminator="\n")
+        writer.writerow(headers[task_type])
+        try:
+            # The files are read in one pass, so a job on a compressed archive decompresses it once
+            for _, extraction in corpus.iter_extracted(files):
+                if extraction:
+                    writer.writerows(extraction.results)
+                    self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            print(f"Client disconnected from {task_type} job, config: {config}")
+            return
+        except Exception as error:
+            # The 200 status has been sent, so the error is reported at the end of the stream
+            traceback.print_exc()
+            self.wfile.write(f"Error: {error}\n".encode("utf-8"))
+            return
+
+        print(f"Finished {task_type} job on {len(files)} files, config: {config}")
+
+    def send_json(self, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def get_job_config(config):
+    """
+    Make the SaveConfig of a job. Jobs can not save speeches, so that a request can not
+    make the server write files.
+
+    Args:
+        config: Dictionary of SaveConfig fields from the job, or None.
+
+    Returns:
+        SaveConfig: The config, or None if the job has none.
+
+    Raises:
+        ValueError: If the config sets a save path or a person that looks like a path.
+        TypeError: If the config is not a dictionary or has unknown fields.
+    """
+    if not config:
+        return None
+    if not isinstance(config, dict):
+        raise TypeError("The job's config must be a JSON object.")
+    if config.get("save_path"):
+        raise ValueError("Jobs can not set 'save_path'. The results are streamed back.")
+    person = config.get("person") or ""
+    if not isinstance(person, str) or "/" in person or "\\" in person or person in (".", ".."):
+        raise ValueError(f"Invalid person '{person}'.")
+    return SaveConfig(**config)
+
+
+class _LineWriter:
+    """Encodes the text written by a csv.writer to a binary stream."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        self.stream.write(text.encode("utf-8"))
+
+
+def serve(corpus: CorpusExtractor, xml_files: list[Path], corpus_dir: Path, host="127.0.0.1", port=8765):
+    """
+    Run an ExtractionServer until interrupted.
+
+    Args:
+        corpus: CorpusExtractor with the metadata loaded.
+        xml_files: List of the corpus TEI files.
+        corpus_dir: Directory of the corpus.
+        host: Host to listen on. Defaults to localhost.
+        port: Port to listen on.
+    """
+    server = ExtractionServer((host, port), corpus, xml_files, corpus_dir)
+    print(f"Serving extraction jobs for {len(xml_files)} files on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -1,5 +1,6 @@
 from utils import (
     TEI_NS,
+    XML_NS,
     is_in_timespan,
     DATE_FORMAT,
     GOVERNMENTS,
@@ -7,11 +8,19 @@ from utils import (
     SaveConfig,
 )
 from datetime import datetime
-from speech import Speech
+from speech import Speech, get_speaker_type, get_speech_type
+from speech_features import SpeechFeatureTable, SPEECH_FEATURE_HEADERS
+from speech_feature_cache import SpeechFeatureCache
+from sampling import SpeechSample
+from token_cache import CachedFile
+from detector_cache import DetectorCache
+from release_diff import PreviousResults
+from near_duplicates import get_signature
 import xml.etree.ElementTree as ET
 from xml.etree.ElementTree import Element
 from pathlib import Path
 from typing import Optional
+import pandas as pd
 
 
 class FileHandler:
@@ -19,10 +28,20 @@ class FileHandler:
     Initialize the FileHandler with a TEI file, metadata, task type, and optional save configuration.
 
     Args:
-        teifile: Path to the TEI file to process.
+        teifile: Path to the TEI file to process, a file object with its contents,
+            or a CachedFile from a token cache.
         metadata: Metadata dictionary containing information about MPs, parties, etc.
         task_type: Type of task to perform (default is "sf_sub_clause").
         save_data: Optional configuration for saving data.
+        feature_cache: Optional SpeechFeatureCache to reuse speech-level features from.
+        sample: Optional SpeechSample. Only the sampled speeches are processed.
+        all_speech_features: Compute the speech-level features of every processed speech,
+            not only of the speeches with results.
+        detector_cache: Optional DetectorCache to reuse the detector output of repeated sentences.
+        previous: Optional PreviousResults of an earlier release. The results of unchanged
+            speeches are carried forward from it instead of checking the speeches again.
+        record_fingerprints: Record the content hash of every processed speech.
+        dedup: Record the MinHash signature of every processed speech, for near-duplicate detection.
     """
 
     def __init__(
@@ -31,20 +50,45 @@ class FileHandler:
         metadata,
         task_type="sf_sub_clause",
         save_data: Optional[SaveConfig] = None,
+        feature_cache: Optional[SpeechFeatureCache] = None,
+        sample: Optional[SpeechSample] = None,
+        all_speech_features: bool = False,
+        detector_cache: Optional[DetectorCache] = None,
+        previous: Optional[PreviousResults] = None,
+        record_fingerprints: bool = False,
+        dedup: bool = False,
     ):
-        self.root = ET.parse(teifile).getroot()
         self.task_type = task_type
         self.metadata = metadata
         self.save_data = save_data
-        self.file_date = self.root.findall(".//tei:bibl/tei:date", TEI_NS)[0].text
+        self.feature_cache = feature_cache
+        self.sample = sample
+        self.all_speech_features = all_speech_features
+        self.detector_cache = detector_cache
+        self.previous = previous
+        self.record_fingerprints = record_fingerprints
+        self.dedup = dedup
+        if isinstance(teifile, CachedFile):
+            self.root = None
+            self.file_date = teifile.date
+            self.speeches = teifile.speeches
+        else:
+            self.root = ET.parse(teifile).getroot()
+            self.file_date = self.root.findall(".//tei:bibl/tei:date", TEI_NS)[0].text
+            self.speeches = self.root.findall(".//tei:u", TEI_NS)
         self.file_year = self.file_date.split("-")[0]
-        self.speeches = self.root.findall(".//tei:u", TEI_NS)
         self.results = []
+        self.speech_features = None
+        self.features_reused = 0
+        self.sentences_reused = 0
+        self.sentences_checked = 0
+        self.sample_units = []
+        self.fingerprints = []
+        self.signatures = []
+        self.speeches_carried = 0
         self.mp_affiliations = {}
 
-        if not (self.save_data and self.save_data.years) or (
-            int(self.file_year) in self.save_data.years
-        ):
+        if not self.save_data or self.save_data.includes_date(self.file_date):
             self.process_file()
 
     def get_results(self):
@@ -56,11 +100,50 @@ class FileHandler:
         """
         return self.results
 
+    def get_sample_units(self):
+        """
+        Retrieve the speeches that could be sampled, for weighting the sample.
+
+        Returns:
+            A list of (year, person, party_id, speech_id, word_count) tuples, with
+            word_count None for speeches that were not sampled.
+        """
+        return self.sample_units
+
+    def get_fingerprints(self):
+        """
+        Retrieve the content hashes of the processed speeches, if they were recorded.
+
+        Returns:
+            A list of (speech_id, content_hash) tuples.
+        """
+        return self.fingerprints
+
+    def get_signatures(self):
+        """
+        Retrieve the MinHash signatures of the processed speeches, if they were recorded.
+
+        Returns:
+            A list of (speech_id, signature) tuples, with signature None for speeches without words.
+        """
+        return self.signatures
+
+    def get_speech_features(self):
+        """
+        Retrieve the speech-level features of the speeches with results in the TEI file,
+        or of all processed speeches with all_speech_features.
+
+        Returns:
+            A DataFrame with one row per speech, or None if no speeches were processed.
+        """
+        return self.speech_features
+
     def process_file(self):
         """
         Process the TEI file to extract speeches and affiliations.
 
         This method identifies MPs and their affiliations, then processes each speech in the file.
+        Only the affiliations of the MPs included by the config are looked up.
         """
         if self.speeches:
             mps = set(
@@ -70,6 +153,9 @@ class FileHandler:
                     if "who" in speech.attrib
                 ]
             )
+            if self.save_data:
+                mp_dict = self.metadata["mp_dict"]
+                mps = {mp for mp in mps if self.save_data.includes_speaker(mp, mp_dict[mp]["sex"])}
             self.mp_affiliations = {
                 mp: self.find_current_affiliation(
                     self.metadata["mp_dict"][mp]["affiliations"],
@@ -79,23 +165,102 @@ class FileHandler:
                 for mp in mps
             }
 
-            for speech in self.speeches:
+            speeches = [
+                speech
+                for speech in map(self.read_speech, self.speeches)
+                if speech is not None
+            ]
+            if not speeches:
+                return
+
+            if self.record_fingerprints or self.previous:
+                self.fingerprints = [(speech.speech_id, speech.content_hash) for speech in speeches]
+            if self.dedup:
+                self.signatures = [(speech.speech_id, get_signature(speech.sentences)) for speech in speeches]
+            if self.previous:
+                for speech in speeches:
+                    contents = self.previous.get_contents(speech.speech_id, speech.content_hash)
+                    if contents is not None:
+                        speech.carry_forward(contents)
+                        self.speeches_carried += 1
+
+            # Find the hits first, so the speech-level features are only computed for
+            # speeches with output rows, unless the features of all speeches are saved
+            featured = [
+                speech
+                for speech in speeches
+                if (not speech.carried and speech.check_speech()) or self.all_speech_features
+            ]
+            if featured:
+                self.speech_features = self.compute_speech_features(featured)
+                for speech, features in zip(featured, self.speech_features.itertuples()):
+                    speech.set_features(features)
+
+            for speech in speeches:
                 self.process_speech(speech)
+                if not speech.carried:
+                    self.sentences_reused += speech.sentences_reused
+                    self.sentences_checked += len(speech.sentences)
+
+    def compute_speech_features(self, speeches: list[Speech]):
+        """
+        Compute the speech-level features of the speeches. With a feature cache, only
+        speeches whose tokens are not in the cache are computed, and then added to it.
+
+        Args:
+            speeches: List of Speech objects.
 
-    def process_speech(self, teispeech):
+        Returns:
+            pd.DataFrame: One row per speech, with the columns in SPEECH_FEATURE_HEADERS.
+        """
+        if not self.feature_cache:
+            return SpeechFeatureTable(speeches).compute()
+
+        content_hashes = [speech.content_hash for speech in speeches]
+        features = self.feature_cache.get_many(content_hashes)
+        missing = {
+            content_hash: speech
+            for content_hash, speech in zip(content_hashes, speeches)
+            if content_hash not in features
+        }
+
+        self.features_reused = sum(content_hash in features for content_hash in content_hashes)
+
+        if missing:
+            table = SpeechFeatureTable(missing.values()).compute()
+            computed = dict(zip(missing, table[SPEECH_FEATURE_HEADERS[3:]].itertuples(index=False, name=None)))
+            self.feature_cache.put_many(computed)
+            features.update(computed)
+
+        rows = [
+            (speech.speech_id, speech.speech_year, speech.author_id, *features[content_hash])
+            for content_hash, speech in zip(content_hashes, speeches)
+        ]
+        return pd.DataFrame(rows, columns=SPEECH_FEATURE_HEADERS)
+
+    def read_speech(self, teispeech):
         """
-        Process an individual speech element from the TEI file.
+        Read an individual speech element from the TEI file.
 
         Args:
             teispeech: An XML element representing a speech.
+
+        Returns:
+            Speech: The speech, or None if it has no speaker, is filtered out or is not sampled.
         """
         if "who" in teispeech.attrib:
 
             author = teispeech.attrib["who"][1:]
 
-            if self.save_data and self.save_data.person != author:
+            if self.save_data and not self.is_included(teispeech, author):
                 return
 
+            if self.sample:
+                speech_id = teispeech.attrib[f"{XML_NS}id"]
+                if not self.sample.is_sampled(speech_id):
+                    self.add_sample_unit(author, speech_id, None)
+                    return
+
             speech = Speech(
                 teispeech,
                 self.file_date,
@@ -103,15 +268,60 @@ class FileHandler:
                 self.metadata,
                 self.mp_affiliations,
                 self.task_type,
+                self.detector_cache,
             )
+            if self.sample:
+                self.add_sample_unit(author, speech.speech_id, speech.word_count)
+            return speech
+
+    def is_included(self, teispeech, author):
+        """
+        Check a speech against the config filters, using only its speaker's metadata and
+        the attributes of its <u> element, so speeches that are filtered out are never read.
+
+        Args:
+            teispeech: An XML element representing a speech, or a CachedSpeech.
+            author: The speaker's id.
 
-            speech.check_speech()
-            results = speech.get_results()
+        Returns:
+            bool: True if the speech is included by the config.
+        """
+        if author not in self.mp_affiliations:
+            return False
+        if not self.save_data.includes_affiliation(self.mp_affiliations[author]):
+            return False
+        if not (self.save_data.speaker_types or self.save_data.speech_types):
+            return True
+        speech_type = None
+        if self.save_data.speech_types:
+            speech_type = get_speech_type(teispeech.attrib["source"], self.metadata["speech_types"])
+        return self.save_data.includes_speech(get_speaker_type(teispeech), speech_type)
+
+    def add_sample_unit(self, author, speech_id, word_count):
+        """
+        Record a speech that could be sampled.
+
+        Args:
+            author: The speaker's id.
+            speech_id: The xml:id of the speech.
+            word_count: Number of words in the speech, or None if it was not sampled.
+        """
+        party = self.mp_affiliations[author].party
+        self.sample_units.append((self.file_year, author, party, speech_id, word_count))
+
+    def process_speech(self, speech: Speech):
+        """
+        Extract the results of an individual speech.
+
+        Args:
+            speech: The Speech to process.
+        """
+        results = speech.get_results()
 
-            if self.save_data and self.save_data.save_path:
-                speech.save_speech_text(self.save_data.save_path)
+        if self.save_data and self.save_data.save_path:
+            speech.save_speech_text(self.save_data.save_path)
 
-            self.results.extend(results)
+        self.results.extend(results)
 
     def find_current_affiliation(
         self, affiliations: list[Element], date: str, relations
@@ -0,0 +1,351 @@
+from utils import TEI_NS, simple_tag
+from corpus_reader import CorpusReader
+from token_cache import TokenCache
+from collections import Counter
+from tqdm import tqdm
+from pathlib import Path
+import xml.etree.ElementTree as ET
+import numpy as np
+import hashlib
+import json
+import math
+
+# Number of distinct (lemma, tag) pairs counted exactly before new pairs go to the sketch
+MAX_EXACT_KEYS = 2_000_000
+
+# Size of the count-min sketch. With width w, an estimate is at most e / w times the
+# number of sketched words too high, with probability 1 - e^-depth.
+SKETCH_WIDTH = 1 << 20
+SKETCH_DEPTH = 4
+
+# Number of sketched pairs kept as candidates for the rank table
+HEAVY_HITTERS = 100_000
+
+
+def get_key(lemma, tag):
+    """
+    Get the key of a lemma and tag, as used in FrequencyCounter.
+
+    Args:
+        lemma: The lemma.
+        tag: The full tag of the word.
+
+    Returns:
+        str: The lemma and the simplified tag, separated by a tab.
+    """
+    return f"{lemma}\t{simple_tag(tag)}"
+
+
+class CountMinSketch:
+    """
+    A count-min sketch of word counts. The buckets of a key only depend on the key, so
+    sketches of the same size made in different processes can be added together.
+
+    Args:
+        width: Number of counters per row.
+        depth: Number of rows, each with its own hash of the keys.
+    """
+
+    def __init__(self, width=SKETCH_WIDTH, depth=SKETCH_DEPTH):
+        self.table = np.zeros((depth, width), dtype=np.int64)
+
+    def get_buckets(self, keys: list[str]):
+        """
+        Get the bucket of each key in each row.
+
+        Args:
+            keys: The keys.
+
+        Returns:
+            np.ndarray: Array of shape (len(keys), depth) of bucket indices.
+        """
+        depth, width = self.table.shape
+        digests = b"".join(hashlib.blake2b(key.encode("utf-8"), digest_size=8 * depth).digest() for key in keys)
+        return (np.frombuffer(digests, dtype=np.uint64).reshape(-1, depth) % np.uint64(width)).astype(np.int64)
+
+    def add(self, keys: list[str], counts: list[int]):
+        """
+        Add counts of keys.
+
+        Args:
+            keys: The keys.
+            counts: The count of each key.
+        """
+        buckets = self.get_buckets(keys)
+        counts = np.asarray(counts, dtype=np.int64)
+        for row in range(self.table.shape[0]):
+            np.add.at(self.table[row], buckets[:, row], counts)
+
+    def estimate(self, keys: list[str]):
+        """
+        Estimate the counts of keys. The estimates are never too low.
+
+        Args:
+            keys: The keys.
+
+        Returns:
+            np.ndarray: The estimated count of each key.
+        """
+        if not keys:
+            return np.zeros(0, dtype=np.int64)
+        buckets = self.get_buckets(keys)
+        rows = np.arange(self.table.shape[0])
+        return self.table[rows, buckets].min(axis=1)
+
+
+class FrequencyCounter:
+    """
+    Count lemma and tag frequencies in one pass over the corpus. Pairs are counted
+    exactly until max_exact_keys distinct pairs have been seen. After that, pairs that
+    are not counted exactly already go to a count-min sketch, and the most frequent of
+    them are kept as heavy hitter candidates for the rank table.
+
+    Counters of different shards of the corpus can be saved, loaded and merged, as
+    long as their sketches have the same size.
+
+    Args:
+        max_exact_keys: Number of distinct pairs counted exactly.
+        sketch_width: Width of the count-min sketch.
+        sketch_depth: Depth of the count-min sketch.
+        heavy_hitters: Number of sketched pairs kept for the rank table.
+    """
+
+    def __init__(
+        self,
+        max_exact_keys=MAX_EXACT_KEYS,
+        sketch_width=SKETCH_WIDTH,
+        sketch_depth=SKETCH_DEPTH,
+        heavy_hitters=HEAVY_HITTERS,
+    ):
+        self.max_exact_keys = max_exact_keys
+        self.heavy_hitters = heavy_hitters
+        self.exact = {}
+        self.sketch = CountMinSketch(sketch_width, sketch_depth)
+        self.candidates = set()
+        # Exactly counted pairs that can also have counts in the sketch, after a merge
+        self.sketched_exact = set()
+        self.words = 0
+        self.sketched_words = 0
+
+    def update(self, counts: dict):
+        """
+        Add the counts of a file.
+
+        Args:
+            counts: Maps keys from get_key to their counts in the file.
+        """
+        overflow_keys = []
+        overflow_counts = []
+        for key, count in counts.items():
+            if key in self.exact:
+                self.exact[key] += count
+            elif len(self.exact) < self.max_exact_keys:
+                self.exact[key] = count
+            else:
+                overflow_keys.append(key)
+                overflow_counts.append(count)
+
+        self.words += sum(counts.values())
+        if overflow_keys:
+            self.sketch.add(overflow_keys, overflow_counts)
+            self.sketched_words += sum(overflow_counts)
+            self.candidates.update(overflow_keys)
+            if len(self.candidates) > 2 * self.heavy_hitters:
+                self.prune_candidates()
+
+    def prune_candidates(self):
+        """
+        Keep only the heavy_hitters candidates with the highest estimated counts.
+        """
+        if len(self.candidates) <= self.heavy_hitters:
+            return
+        keys = sorted(self.candidates)
+        estimates = self.sketch.estimate(keys)
+        top = np.argsort(-estimates, kind="stable")[: self.heavy_hitters]
+        self.candidates = {keys[index] for index in top}
+
+    def merge(self, other: "FrequencyCounter"):
+        """
+        Add the counts of another counter, e.g. of another shard.
+
+        Args:
+            other: The other counter.
+
+        Raises:
+            ValueError: If the sketches have different sizes.
+        """
+        if self.sketch.table.shape != other.sketch.table.shape:
+            raise ValueError(
+                f"Can not merge sketches of sizes {self.sketch.table.shape} and {other.sketch.table.shape}."
+            )
+        # A pair counted exactly by one counter may be in the sketch of the other,
+        # if the other had no room left for exact counts
+        if other.sketched_words:
+            self.sketched_exact.update(key for key in self.exact if key not in other.exact)
+        if self.sketched_words:
+            self.sketched_exact.update(key for key in other.exact if key not in self.exact)
+        self.sketched_exact |= other.sketched_exact
+
+        for key, count in other.exact.items():
+            self.exact[key] = self.exact.get(key, 0) + count
+        self.sketch.table += other.sketch.table
+        self.candidates |= other.candidates
+        self.words += other.words
+        self.sketched_words += other.sketched_words
+        self.prune_candidates()
+
+    def get_max_error(self):
+        """
+        Get the bound on how much too high the sketched counts are, which holds with
+        probability 1 - e^-depth.
+
+        Returns:
+            int: The bound.
+        """
+        return math.ceil(math.e / self.sketch.table.shape[1] * self.sketched_words)
+
+    def get_counts(self):
+        """
+        Get the count of every pair in the rank table: the exact counts, plus the
+        estimated counts of the heavy hitters of the sketch and of exactly counted
+        pairs that can also be in the sketch.
+
+        Returns:
+            dict: Maps keys to counts.
+        """
+        self.prune_candidates()
+        counts = dict(self.exact)
+        keys = sorted(self.candidates | self.sketched_exact)
+        for key, estimate in zip(keys, self.sketch.estimate(keys).tolist()):
+            counts[key] = counts.get(key, 0) + estimate
+        return counts
+
+    def get_rank_table(self):
+        """
+        Get the frequency list in the format of the Gigaword list, which can be used as
+        the frequency list of an extraction.
+
+        Returns:
+            dict: Maps lemmas to tags to [frequency, rank], where rank 1 is the most frequent pair.
+        """
+        counts = self.get_counts()
+        ordered = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        table = {}
+        for rank, (key, count) in enumerate(ordered, start=1):
+            lemma, tag = key.split("\t")
+            table.setdefault(lemma, {})[tag] = [count, rank]
+        return table
+
+    def save_rank_table(self, json_file: Path):
+        """
+        Save the rank table as JSON.
+
+        Args:
+            json_file: Path of the JSON file.
+        """
+        with open(json_file, "w", encoding="utf-8") as json_out:
+            json.dump(self.get_rank_table(), json_out, ensure_ascii=False)
+
+    def save(self, path: Path):
+        """
+        Save the state of the counter, e.g. of a shard, to be loaded and merged later.
+
+        Args:
+            path: Path of the .npz file.
+        """
+        np.savez(
+            path,
+            exact_keys=np.array(list(self.exact), dtype=str),
+            exact_counts=np.array(list(self.exact.values()), dtype=np.int64),
+            candidates=np.array(sorted(self.candidates), dtype=str),
+            sketched_exact=np.array(sorted(self.sketched_exact), dtype=str),
+            sketch=self.sketch.table,
+            settings=np.array([self.max_exact_keys, self.heavy_hitters, self.words, self.sketched_words], dtype=np.int64),
+        )
+
+    @classmethod
+    def load(cls, path: Path):
+        """
+        Load a counter saved with save.
+
+        Args:
+            path: Path of the .npz file.
+
+        Returns:
+            FrequencyCounter: The counter.
+        """
+        with np.load(path) as data:
+            max_exact_keys, heavy_hitters, words, sketched_words = data["settings"].tolist()
+            depth, width = data["sketch"].shape
+            counter = cls(max_exact_keys, width, depth, heavy_hitters)
+            counter.exact = dict(zip(data["exact_keys"].tolist(), data["exact_counts"].tolist()))
+            counter.candidates = set(data["candidates"].tolist())
+            counter.sketched_exact = set(data["sketched_exact"].tolist())
+            counter.sketch.table = data["sketch"].copy()
+            counter.words = words
+            counter.sketched_words = sketched_words
+        return counter
+
+
+def count_xml_file(source):
+    """
+    Count the lemmas and tags of the words in a TEI file.
+
+    Args:
+        source: Path or file object of the TEI file.
+
+    Returns:
+        Counter: Maps keys from get_key to counts.
+    """
+    counts = Counter()
+    for aword in ET.parse(source).getroot().iterfind(".//tei:w", TEI_NS):
+        lemma = aword.get("lemma")
+        tag = aword.get("pos")
+        if lemma and tag:
+            counts[get_key(lemma, tag)] += 1
+    return counts
+
+
+def count_cached_file(token_cache: TokenCache, path: Path):
+    """
+    Count the lemmas and tags of the words in a file of a token cache, from its token ids.
+
+    Args:
+        token_cache: The token cache.
+        path: Path of the file, as returned by TokenCache.get_paths.
+
+    Returns:
+        Counter: Maps keys from get_key to counts.
+    """
+    first, last = token_cache.files[path.relative_to(token_cache.cache_dir).as_posix()]["speeches"]
+    sentences = token_cache.speech_offsets[[first, last]]
+    start, end = token_cache.sentence_offsets[sentences].tolist()
+
+    token_counts = np.bincount(token_cache.columns["token"][start:end])
+    vocabulary = token_cache.vocabulary
+    counts = Counter()
+    for token_id in np.flatnonzero(token_counts).tolist():
+        _, lemma, tag = (vocabulary[value] for value in token_cache.token_types[token_id])
+        if lemma and tag and lemma != "NONE":
+            counts[get_key(lemma, tag)] += int(token_counts[token_id])
+    return counts
+
+
+def count_corpus(teifiles: list[Path], counter: FrequencyCounter, corpus_reader: CorpusReader = None, token_cache: TokenCache = None):
+    """
+    Count the lemmas and tags of the words in the corpus files.
+
+    Args:
+        teifiles: Paths of the files to count.
+        counter: The FrequencyCounter to add the counts to.
+        corpus_reader: CorpusReader to read the files with, if they are not in a token cache.
+        token_cache: Token cache the files are in.
+    """
+    if token_cache:
+        for teifile in tqdm(teifiles, desc="Counting words"):
+            counter.update(count_cached_file(token_cache, teifile))
+        return
+
+    sources = corpus_reader.prefetch(teifiles) if corpus_reader else teifiles
+    for source in tqdm(sources, total=len(teifiles), desc="Counting words"):
+        counter.update(count_xml_file(source))
@@ -0,0 +1,173 @@
+import numpy as np
+import zlib
+
+DEDUP_CLUSTER_HEADER = "dedup_cluster"
+
+# Number of words per shingle
+SHINGLE_SIZE = 5
+
+# Number of hash functions of a MinHash signature, split into BANDS bands for LSH.
+# With 16 bands of 4, speeches sharing 80% of their shingles are almost always
+# compared, and speeches sharing less than 30% hardly ever.
+NUM_PERM = 64
+BANDS = 16
+
+# Share of the signature that two speeches must have in common to be near-duplicates
+DEDUP_THRESHOLD = 0.8
+
+# Number of shingles hashed at a time, to bound the memory of long speeches
+SHINGLE_CHUNK = 4096
+
+# Odd multiplier for combining word hashes into shingle hashes and rows into band keys
+HASH_BASE = np.uint64(0x9E3779B97F4A7C15)
+
+# The hash functions are the same in every run and worker process, so signatures can be compared
+_rng = np.random.default_rng(1204)
+MULTIPLIERS = _rng.integers(0, 2**64, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+INCREMENTS = _rng.integers(0, 2**64, NUM_PERM, dtype=np.uint64)
+
+
+def get_shingles(sentences, shingle_size=SHINGLE_SIZE):
+    """
+    Hash the overlapping word sequences of a speech. Words are lowercased and punctuation
+    is skipped, so differences in casing and punctuation between transcriptions do not count.
+
+    Args:
+        sentences: The sentences of the speech.
+        shingle_size: Number of words per shingle. Shorter speeches are one shingle.
+
+    Returns:
+        np.ndarray: The distinct shingle hashes, empty if the speech has no words.
+    """
+    word_hashes = np.fromiter(
+        (
+            zlib.crc32(token.word.lower().encode("utf-8"))
+            for sentence in sentences
+            for token in sentence.tokens
+            if token.lemma != "NONE"
+        ),
+        dtype=np.uint64,
+    )
+    count = max(1, len(word_hashes) - shingle_size + 1)
+    shingles = np.zeros(count, dtype=np.uint64)
+    for offset in range(min(shingle_size, len(word_hashes))):
+        shingles = shingles * HASH_BASE + word_hashes[offset : offset + count]
+    return np.unique(shingles) if len(word_hashes) else word_hashes
+
+
+def get_signature(sentences):
+    """
+    Get the MinHash signature of a speech: the smallest hash of its shingles under each
+    of NUM_PERM hash functions. The share of equal values in the signatures of two
+    speeches estimates the share of shingles they have in common.
+
+    Args:
+        sentences: The sentences of the speech.
+
+    Returns:
+        np.ndarray: NUM_PERM 32-bit values, or None if the speech has no words.
+    """
+    shingles = get_shingles(sentences)
+    if not len(shingles):
+        return None
+    signature = np.full(NUM_PERM, np.iinfo(np.uint64).max, dtype=np.uint64)
+    for start in range(0, len(shingles), SHINGLE_CHUNK):
+        chunk = shingles[start : start + SHINGLE_CHUNK]
+        hashes = MULTIPLIERS[:, None] * chunk[None, :] + INCREMENTS[:, None]
+        np.minimum(signature, hashes.min(axis=1), out=signature)
+    return (signature >> np.uint64(32)).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """
+    Find clusters of near-duplicate speeches, such as read-out boilerplate and speeches
+    transcribed twice, without comparing every pair of speeches.
+
+    The signatures are split into bands, and only speeches with an equal band are
+    compared: each speech with the first speech with the same band. A pair is kept if
+    its signatures agree in at least threshold of their values, and the kept pairs are
+    joined into clusters. This takes time roughly linear in the number of speeches.
+
+    Args:
+        threshold: Share of equal signature values for two speeches to be near-duplicates.
+        bands: Number of bands the signatures are split into.
+    """
+
+    def __init__(self, threshold=DEDUP_THRESHOLD, bands=BANDS):
+        self.threshold = threshold
+        self.bands = bands
+        self.speech_ids = []
+        self.signatures = []
+
+    def add(self, signatures):
+        """
+        Add speeches, in corpus order.
+
+        Args:
+            signatures: List of (speech_id, signature) tuples from get_signature.
+                Speeches without a signature are left out.
+        """
+        for speech_id, signature in signatures:
+            if signature is not None:
+                self.speech_ids.append(speech_id)
+                self.signatures.append(signature)
+
+    def get_candidates(self, matrix):
+        """
+        Get the pairs of speeches with an equal band.
+
+        Args:
+            matrix: The signatures, one row per speech.
+
+        Yields:
+            tuple[np.ndarray, np.ndarray]: The indices of the first speech with the band
+                and of the other speeches with it, for each band.
+        """
+        rows = matrix.shape[1] // self.bands
+        positions = np.arange(len(matrix))
+        for band in range(self.bands):
+            keys = np.zeros(len(matrix), dtype=np.uint64)
+            for column in range(band * rows, (band + 1) * rows):
+                keys = keys * HASH_BASE + matrix[:, column]
+            _, buckets = np.unique(keys, return_inverse=True)
+            order = np.argsort(buckets, kind="stable")
+            sorted_buckets = buckets[order]
+            starts = np.r_[True, sorted_buckets[1:] != sorted_buckets[:-1]]
+            firsts = order[np.maximum.accumulate(np.where(starts, positions, 0))]
+            pairs = firsts != order
+            yield firsts[pairs], order[pairs]
+
+    def get_clusters(self):
+        """
+        Cluster the speeches.
+
+        Returns:
+            dict: Maps the id of every speech in a cluster of two or more to the id of
+                the first speech of its cluster.
+        """
+        if not self.signatures:
+            return {}
+        matrix = np.vstack(self.signatures).astype(np.uint64)
+        parents = list(range(len(matrix)))
+
+        def find(index):
+            while parents[index] != index:
+                parents[index] = parents[parents[index]]
+                index = parents[index]
+            return index
+
+        for firsts, others in self.get_candidates(matrix):
+            similar = (matrix[firsts] == matrix[others]).mean(axis=1) >= self.threshold
+            for first, other in zip(firsts[similar].tolist(), others[similar].tolist()):
+                first, other = find(first), find(other)
+                if first != other:
+                    # The earliest speech of a cluster is its root
+                    parents[max(first, other)] = min(first, other)
+
+        roots = [find(index) for index in range(len(matrix))]
+        sizes = np.bincount(roots, minlength=len(matrix))
+        return {
+            speech_id: self.speech_ids[root]
+            for speech_id, root in zip(self.speech_ids, roots)
+            if sizes[root] > 1
+        }
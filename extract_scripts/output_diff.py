@@ -0,0 +1,379 @@
+from utils import write_tsv
+from release_diff import DIFF_STATUSES, CONTEXT_LENGTH, parse_value, get_content_columns
+from sharding import KEY_HEADERS
+from collections import Counter, defaultdict
+from tqdm import tqdm
+from pathlib import Path
+import math
+import zlib
+import csv
+
+# Columns that tell the results of a speech apart: SF rows by their clause, HS rows by their word
+TEXT_COLUMNS = ["relevant_text", "word"]
+
+ROW_DIFF_HEADERS = ["task", "person", "year", *DIFF_STATUSES]
+
+# Megabytes of input per partition. A partition of the older output is held in memory at a time.
+PARTITION_SIZE = 64
+
+RESULT_SUFFIXES = {".tsv", ".parquet"}
+
+# Joins the compared values of a row into one string, which takes far less memory than a list of them
+VALUE_SEPARATOR = "\x1f"
+
+
+def is_parquet(path: Path):
+    return path.suffix == ".parquet"
+
+
+def read_parquet_file(path: Path):
+    """
+    Open a Parquet file. pyarrow is only needed for Parquet outputs.
+
+    Args:
+        path: Path of the file.
+
+    Returns:
+        pyarrow.parquet.ParquetFile: The file.
+
+    Raises:
+        ValueError: If pyarrow is not installed.
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError(f"Reading {path} needs pyarrow. Install it with 'pip install pyarrow'.")
+    return pq.ParquetFile(path)
+
+
+def read_header(path: Path):
+    """
+    Read the column names of a results file.
+
+    Args:
+        path: Path of a TSV or Parquet file.
+
+    Returns:
+        list[str]: The column names.
+    """
+    if is_parquet(path):
+        return read_parquet_file(path).schema_arrow.names
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        return next(csv.reader(file, delimiter="\t"), [])
+
+
+def read_rows(path: Path):
+    """
+    Stream the rows of a results file, without its header.
+
+    Args:
+        path: Path of a TSV or Parquet file.
+
+    Yields:
+        list or tuple: The values of each row, strings for TSV files and typed values for Parquet files.
+    """
+    if is_parquet(path):
+        for batch in read_parquet_file(path).iter_batches():
+            yield from zip(*(column.to_pylist() for column in batch.columns))
+        return
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        reader = csv.reader(file, delimiter="\t")
+        next(reader, None)
+        yield from reader
+
+
+def get_data_size(path: Path):
+    """
+    Get the size of the data of a results file.
+
+    Args:
+        path: Path of a TSV or Parquet file.
+
+    Returns:
+        int: The file size of a TSV file, or the uncompressed size of a Parquet file.
+    """
+    if is_parquet(path):
+        metadata = read_parquet_file(path).metadata
+        return sum(metadata.row_group(index).total_byte_size for index in range(metadata.num_row_groups))
+    return path.stat().st_size
+
+
+def is_results_file(path: Path):
+    """
+    Check whether a file is an extraction output, rather than e.g. an aggregate table or a manifest.
+
+    Args:
+        path: Path of a file.
+
+    Returns:
+        bool: True if it is a TSV or Parquet file with a speech id and a text column.
+    """
+    if path.suffix not in RESULT_SUFFIXES or not path.is_file():
+        return False
+    columns = read_header(path)
+    return "speech_id" in columns and any(column in columns for column in TEXT_COLUMNS)
+
+
+def pair_results_files(old_dir: Path, new_dir: Path):
+    """
+    Match the results files of two output directories by name, so e.g. an older
+    hardspeech.tsv is compared with a newer hardspeech.tsv or hardspeech.parquet.
+
+    Args:
+        old_dir: The older output directory.
+        new_dir: The newer output directory.
+
+    Returns:
+        tuple: A list of (old file, new file) pairs, and lists of the files only in the older
+            and only in the newer directory.
+    """
+    old_files = {path.stem: path for path in sorted(old_dir.iterdir()) if is_results_file(path)}
+    new_files = {path.stem: path for path in sorted(new_dir.iterdir()) if is_results_file(path)}
+    pairs = [(old_files[name], new_files[name]) for name in new_files if name in old_files]
+    only_old = [path for name, path in old_files.items() if name not in new_files]
+    only_new = [path for name, path in new_files.items() if name not in old_files]
+    return pairs, only_old, only_new
+
+
+def format_value(value, column):
+    """
+    Write a value the same way whether it was read from a TSV or a Parquet file, e.g.
+    a missing value as '' and a whole number stored as a float as '25'.
+
+    Args:
+        value: The value.
+        column: Name of its column.
+
+    Returns:
+        str: The value as text.
+    """
+    if isinstance(value, str):
+        try:
+            value = parse_value(value, column)
+        except ValueError:
+            return value
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def is_empty(value):
+    return value is None or value == "" or (isinstance(value, float) and math.isnan(value))
+
+
+def align_row(row, columns: list):
+    """
+    Match the values of a result row to their columns. Some detectors give shorter
+    output than others, and their rows were padded at the end when saved, so the speech
+    id of such a row is the last value that is not empty, and the values between gov
+    and speech_source are aligned with get_content_columns.
+
+    Args:
+        row: The values of the row.
+        columns: The columns of the output, which may have shard positions in front of
+            the task's columns and e.g. a sample weight after them.
+
+    Returns:
+        dict: Maps column names to values.
+    """
+    start = columns.index("year") if "year" in columns else 0
+    end = columns.index("speech_id") + 1
+    values = list(row[start:end])
+    while values and is_empty(values[-1]):
+        values.pop()
+
+    task_columns = columns[start:end]
+    aligned = dict(zip(columns[:start], row[:start]))
+    aligned.update(zip(task_columns[:CONTEXT_LENGTH], values[:CONTEXT_LENGTH]))
+    contents = values[CONTEXT_LENGTH:-2]
+    aligned.update(zip(get_content_columns(len(contents), task_columns), contents))
+    aligned.update(zip(task_columns[-2:], values[CONTEXT_LENGTH:][-2:]))
+    aligned.update(zip(columns[end:], row[end:]))
+    return aligned
+
+
+class OutputDiff:
+    """
+    Compare two outputs of the same task row by row, in bounded memory. A row is
+    identified by its speech id, its relevant text (SF) or word (HS), and how many rows
+    before it in the file have the same speech id and text. The values of short rows
+    are aligned to their columns with align_row.
+
+    The outputs are compared with a grace hash join: both are streamed once and each row
+    is written to one of a number of partition files by the hash of its speech id and
+    text, so the rows with the same key end up in partitions with the same number. Then
+    the partitions are joined in turn, holding only one partition of the older output
+    in memory. The columns that are in both outputs are compared, except the shard
+    positions. Values are compared as text, and only read back as numbers when one of
+    the outputs is a Parquet file.
+
+    Args:
+        old_file: The older results file, TSV or Parquet.
+        new_file: The newer results file.
+        task: Name of the task the counts are reported under, e.g. the file name.
+        partition_size: Megabytes of input per partition.
+
+    Raises:
+        ValueError: If the outputs do not have the key columns.
+    """
+
+    def __init__(self, old_file: Path, new_file: Path, task, partition_size=PARTITION_SIZE):
+        self.old_file = old_file
+        self.new_file = new_file
+        self.task = task
+        self.old_columns = read_header(old_file)
+        self.new_columns = read_header(new_file)
+
+        for path, columns in [(old_file, self.old_columns), (new_file, self.new_columns)]:
+            if "speech_id" not in columns or not any(column in columns for column in TEXT_COLUMNS):
+                raise ValueError(f"{path} is not an extraction output, it has no speech_id and {' or '.join(TEXT_COLUMNS)} columns.")
+        self.text_column = next(column for column in TEXT_COLUMNS if column in self.new_columns)
+        if self.text_column not in self.old_columns:
+            raise ValueError(f"{old_file} and {new_file} are outputs of different task types.")
+
+        self.normalize = is_parquet(old_file) or is_parquet(new_file)
+        self.columns = [column for column in self.new_columns if column in self.old_columns and column not in KEY_HEADERS]
+        self.only_old = [column for column in self.old_columns if column not in self.new_columns]
+        self.only_new = [column for column in self.new_columns if column not in self.old_columns]
+        size = max(get_data_size(old_file), get_data_size(new_file))
+        self.partitions = max(1, math.ceil(size / (partition_size * 1_000_000)))
+
+        self.counts = defaultdict(Counter)
+        self.column_changes = Counter()
+
+    def partition(self, path: Path, columns: list, temp_dir: Path, prefix):
+        """
+        Write the rows of an output to partition files by the hash of their key.
+        Each row is written as its speech id, text, person and year, followed by
+        the compared values.
+
+        Args:
+            path: Path of the output.
+            columns: Its column names.
+            temp_dir: Directory to write the partition files to.
+            prefix: Start of the partition file names.
+        """
+        value_columns = ["speech_id", self.text_column, "person", "year", *self.columns]
+
+        files = [open(temp_dir / f"{prefix}.{index}.tsv", "w", encoding="utf-8", newline="") for index in range(self.partitions)]
+        try:
+            writers = [csv.writer(file, delimiter="\t", lineterminator="\n") for file in files]
+            for row in tqdm(read_rows(path), desc=f"Partitioning {path.name}", unit=" rows"):
+                aligned = align_row(row, columns)
+                values = [aligned.get(column, "") for column in value_columns]
+                if self.normalize:
+                    values = [format_value(value, column) for value, column in zip(values, value_columns)]
+                partition = zlib.crc32(f"{values[0]}\t{values[1]}".encode("utf-8")) % self.partitions
+                writers[partition].writerow(values)
+        finally:
+            for file in files:
+                file.close()
+
+    def read_partition(self, path: Path):
+        """
+        Read a partition file, numbering the rows with the same speech id and text.
+
+        Args:
+            path: Path of the partition file.
+
+        Yields:
+            tuple: The key of each row (speech id, text, occurrence), its person and year,
+                and its compared values joined with VALUE_SEPARATOR.
+        """
+        occurrences = Counter()
+        with open(path, "r", encoding="utf-8", newline="") as file:
+            for row in csv.reader(file, delimiter="\t"):
+                key = (row[0], row[1])
+                yield (*key, occurrences[key]), (row[2], row[3], VALUE_SEPARATOR.join(row[4:]))
+                occurrences[key] += 1
+
+    def join_partition(self, old_path: Path, new_path: Path):
+        """
+        Count the added, removed, changed and unchanged rows of one partition.
+
+        Args:
+            old_path: Partition file of the older output.
+            new_path: Partition file of the newer output, with the same number.
+        """
+        old_rows = dict(self.read_partition(old_path))
+        for key, row in self.read_partition(new_path):
+            old_row = old_rows.pop(key, None)
+            if old_row is None:
+                status = "added"
+            elif old_row[2] == row[2]:
+                status = "unchanged"
+            else:
+                status = "changed"
+                old_values = old_row[2].split(VALUE_SEPARATOR)
+                new_values = row[2].split(VALUE_SEPARATOR)
+                for column, old_value, new_value in zip(self.columns, old_values, new_values):
+                    if old_value != new_value:
+                        self.column_changes[column] += 1
+            self.counts[(row[0], row[1])][status] += 1
+
+        for old_row in old_rows.values():
+            self.counts[(old_row[0], old_row[1])]["removed"] += 1
+
+    def run(self, temp_dir: Path):
+        """
+        Partition both outputs and join the partitions.
+
+        Args:
+            temp_dir: An empty directory for the partition files, which are deleted as they are joined.
+        """
+        self.partition(self.old_file, self.old_columns, temp_dir, "old")
+        self.partition(self.new_file, self.new_columns, temp_dir, "new")
+        for index in tqdm(range(self.partitions), desc="Joining partitions"):
+            old_path = temp_dir / f"old.{index}.tsv"
+            new_path = temp_dir / f"new.{index}.tsv"
+            self.join_partition(old_path, new_path)
+            old_path.unlink()
+            new_path.unlink()
+
+    def get_totals(self):
+        """
+        Get the number of rows with each status.
+
+        Returns:
+            Counter: Maps each status in DIFF_STATUSES to its number of rows.
+        """
+        return sum(self.counts.values(), Counter())
+
+    def get_rows(self):
+        """
+        Get the number of rows with each status per person and year.
+
+        Yields:
+            list: The task, person, year and the number of rows with each status in DIFF_STATUSES.
+        """
+        for (person, year), counts in sorted(self.counts.items(), key=lambda item: (item[0][1], item[0][0])):
+            yield [self.task, person, year, *[counts[status] for status in DIFF_STATUSES]]
+
+    def print(self):
+        """
+        Print the totals, the columns that differ most often between changed rows, and
+        the columns that are only in one of the outputs.
+        """
+        totals = self.get_totals()
+        print(f"{self.task}: " + ", ".join(f"{totals[status]} {status}" for status in DIFF_STATUSES))
+        if self.column_changes:
+            print("  Changed columns: " + ", ".join(f"{column} {count}" for column, count in self.column_changes.most_common()))
+        if self.only_old:
+            print("  Columns only in", self.old_file.name + ":", ", ".join(self.only_old))
+        if self.only_new:
+            print("  Columns only in", self.new_file.name + ":", ", ".join(self.only_new))
+
+
+def save_row_diff(path: Path, diffs: list[OutputDiff]):
+    """
+    Save the number of added, removed, changed and unchanged rows per task, person and year.
+
+    Args:
+        path: Path of the TSV file.
+        diffs: The OutputDiffs, after they are run.
+    """
+    write_tsv(path, ROW_DIFF_HEADERS, (row for diff in diffs for row in diff.get_rows()))
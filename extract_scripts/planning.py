@@ -0,0 +1,363 @@
+from utils import headers, file_year, get_tsv_writer, pad_row
+from corpus_reader import CorpusReader
+from token_cache import TokenCache
+from collections import defaultdict, namedtuple
+from pathlib import Path
+import datetime
+import time
+import sys
+import io
+import os
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Number of files per year whose speeches are counted
+FILES_PER_YEAR = 5
+
+# Number of files timed for each config, spread over its files
+CALIBRATION_FILES = 8
+
+# What calibrate measures on the calibration files
+Calibration = namedtuple(
+    "Calibration",
+    ["files", "seconds", "rows", "row_memory", "row_output", "feature_memory", "feature_output"],
+)
+
+
+def get_peak_memory():
+    """
+    Get the peak resident memory of the process so far.
+
+    Returns:
+        int: The peak memory in bytes, or None if it can not be measured on this platform.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes and macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def get_parallelism(workers, executor):
+    """
+    Get how many files are processed at the same time. Threads only run in parallel
+    on free-threaded Python builds.
+
+    Args:
+        workers: Number of workers.
+        executor: "thread" or "process".
+
+    Returns:
+        int: The number of files processed at the same time.
+    """
+    gil_enabled = getattr(sys, "_is_gil_enabled", lambda: True)()
+    if workers <= 1 or (executor == "thread" and gil_enabled):
+        return 1
+    return min(workers, os.cpu_count() or 1)
+
+
+def format_size(size):
+    """
+    Format a number of bytes, e.g. '12.3 MB'.
+
+    Args:
+        size: The number of bytes.
+
+    Returns:
+        str: The formatted size.
+    """
+    for unit in ["B", "kB", "MB", "GB"]:
+        if size < 1000:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1000
+    return f"{size:.1f} TB"
+
+
+def format_duration(seconds):
+    """
+    Format a number of seconds as hours, minutes and seconds, e.g. '1:02:03'.
+
+    Args:
+        seconds: The number of seconds.
+
+    Returns:
+        str: The formatted duration.
+    """
+    return str(datetime.timedelta(seconds=round(seconds)))
+
+
+def spread(items: list, count):
+    """
+    Pick items evenly spread over a list.
+
+    Args:
+        items: The list.
+        count: Maximum number of items to pick.
+
+    Returns:
+        list: The picked items, in list order.
+    """
+    if len(items) <= count:
+        return list(items)
+    return [items[index * len(items) // count] for index in range(count)]
+
+
+def get_row_memory(row: list):
+    """
+    Estimate the memory of a result row. Values shared between rows are counted
+    for every row, so the estimate errs on the high side.
+
+    Args:
+        row: The row.
+
+    Returns:
+        int: The estimated number of bytes.
+    """
+    return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+
+
+class CorpusSurvey:
+    """
+    The sizes of the corpus files and their estimated speech counts per year. The sizes
+    are read without reading the files: file sizes on disk or in the archive, or the
+    number of tokens of files in a token cache. The speeches are counted in a few
+    files per year, and scaled by size to the other files of the year.
+
+    Args:
+        teifiles: Paths of the files to survey.
+        corpus_reader: CorpusReader the files are read with, if they are not in a token cache.
+        token_cache: Token cache the files are in.
+        files_per_year: Number of files per year whose speeches are counted.
+    """
+
+    def __init__(
+        self,
+        teifiles: list[Path],
+        corpus_reader: CorpusReader = None,
+        token_cache: TokenCache = None,
+        files_per_year=FILES_PER_YEAR,
+    ):
+        self.teifiles = teifiles
+        self.corpus_reader = corpus_reader
+        self.token_cache = token_cache
+        self.sizes = {teifile: self.get_size(teifile) for teifile in teifiles}
+
+        self.year_files = defaultdict(list)
+        for teifile in teifiles:
+            self.year_files[file_year(teifile)].append(teifile)
+
+        counted = {teifile for files in self.year_files.values() for teifile in spread(files, files_per_year)}
+        # Read the counted files in corpus order, so a tar archive is read in one pass
+        self.counted = [teifile for teifile in teifiles if teifile in counted]
+        self.speech_counts = dict(zip(self.counted, self.count_speeches(self.counted)))
+
+    def get_size(self, teifile: Path):
+        """
+        Get the size of a file.
+
+        Args:
+            teifile: Path of the file.
+
+        Returns:
+            int: The number of bytes of the file, or of tokens if it is in a token cache.
+        """
+        if self.token_cache:
+            first, last = self.token_cache.files[teifile.relative_to(self.token_cache.cache_dir).as_posix()]["speeches"]
+            sentences = self.token_cache.speech_offsets[[first, last]]
+            start, end = self.token_cache.sentence_offsets[sentences].tolist()
+            return end - start
+        return self.corpus_reader.get_size(teifile)
+
+    def count_speeches(self, teifiles: list[Path]):
+        """
+        Count the speeches of files.
+
+        Args:
+            teifiles: Paths of the files.
+
+        Yields:
+            int: The number of speeches of each file.
+        """
+        if self.token_cache:
+            for teifile in teifiles:
+                first, last = self.token_cache.files[teifile.relative_to(self.token_cache.cache_dir).as_posix()]["speeches"]
+                yield last - first
+            return
+        for source in self.corpus_reader.read_files(teifiles):
+            yield source.getvalue().count(b"<u ")
+
+    def get_total_size(self, teifiles: list[Path]):
+        """
+        Get the total size of files.
+
+        Args:
+            teifiles: Paths of surveyed files.
+
+        Returns:
+            int: The total size, in the unit of the survey.
+        """
+        return sum(self.sizes[teifile] for teifile in teifiles)
+
+    def get_year_rows(self):
+        """
+        Get the number of files, total size and estimated number of speeches of each year.
+
+        Returns:
+            list[tuple]: One (year, files, size, speeches) tuple per year, sorted by year.
+        """
+        rows = []
+        for year, files in sorted(self.year_files.items()):
+            size = self.get_total_size(files)
+            counted = [teifile for teifile in files if teifile in self.speech_counts]
+            counted_size = self.get_total_size(counted)
+            speeches = sum(self.speech_counts[teifile] for teifile in counted)
+            rows.append((year, len(files), size, round(speeches * size / counted_size) if counted_size else 0))
+        return rows
+
+    def print(self):
+        """
+        Print the sizes and estimated speech counts per year.
+        """
+        rows = self.get_year_rows()
+        total_size = sum(row[2] for row in rows)
+        speeches = sum(row[3] for row in rows)
+        print(
+            f"Corpus: {len(self.teifiles)} files, {self.format_size(total_size)}, about {speeches:,} speeches "
+            f"(counted in {len(self.counted)} files)"
+        )
+        print(f"{'year':>8} {'files':>7} {'size':>12} {'speeches':>10}")
+        for year, files, size, speeches in rows:
+            print(f"{year:>8} {files:>7} {self.format_size(size):>12} {speeches:>10,}")
+
+    def format_size(self, size):
+        """
+        Format a size in the unit of the survey.
+
+        Args:
+            size: The size.
+
+        Returns:
+            str: The formatted size.
+        """
+        if self.token_cache:
+            return f"{size:,} tokens"
+        return format_size(size)
+
+
+def calibrate(corpus, teifiles: list[Path]):
+    """
+    Time the extraction of a few files, and measure the size of their results.
+    The files are read before the timing starts.
+
+    Args:
+        corpus: The CorpusExtractor to extract the files with.
+        teifiles: Paths of the files.
+
+    Returns:
+        Calibration: The number of files, the time taken, and the number, memory and
+            TSV size of the result rows and speech features.
+    """
+    sources = list(corpus.read_files(teifiles))
+    start = time.perf_counter()
+    extractions = [corpus.extract_file(teifile, source) for teifile, source in zip(teifiles, sources)]
+    seconds = time.perf_counter() - start
+
+    rows = [row for extraction in extractions for row in extraction.results]
+    header = corpus.get_headers()
+    output = io.StringIO()
+    writer = get_tsv_writer(output)
+    for row in rows:
+        writer.writerow(pad_row(row, len(header)))
+    # The DataFrame of the results keeps a reference to each value
+    row_memory = sum(map(get_row_memory, rows)) + 8 * len(rows) * len(headers[corpus.task_type])
+
+    features = [extraction.speech_features for extraction in extractions if extraction.speech_features is not None]
+    feature_memory = sum(int(table.memory_usage(deep=True).sum()) for table in features)
+    feature_output = sum(len(table.to_csv(sep="\t", index=False, header=False).encode("utf-8")) for table in features)
+
+    return Calibration(
+        len(teifiles),
+        seconds,
+        len(rows),
+        row_memory,
+        len(output.getvalue().encode("utf-8")),
+        feature_memory,
+        feature_output,
+    )
+
+
+class ExtractionPlan:
+    """
+    Estimate the wall time, peak memory and output size of a run from calibrations of
+    each config. Every config reads its metadata and all of its files again, so the
+    wall times and output sizes of the configs add up, while the peak memory is the
+    largest of them.
+
+    Args:
+        survey: The CorpusSurvey of the files of the run.
+        workers: Number of workers of the run.
+        executor: "thread" or "process".
+        calibration_files: Number of files timed for each config.
+    """
+
+    def __init__(self, survey: CorpusSurvey, workers=1, executor="thread", calibration_files=CALIBRATION_FILES):
+        self.survey = survey
+        self.workers = workers
+        self.executor = executor
+        self.calibration_files = calibration_files
+        self.parallelism = get_parallelism(workers, executor)
+        self.start_memory = get_peak_memory()
+        self.base_memory = None
+        self.estimates = []
+
+    def add_config(self, corpus, metadata_seconds):
+        """
+        Calibrate a config and print its estimates.
+
+        Args:
+            corpus: The CorpusExtractor of the config.
+            metadata_seconds: Time it takes to load the metadata.
+        """
+        selected = [teifile for teifile in self.survey.teifiles if corpus.is_selected(teifile)]
+        teifiles = spread(selected, self.calibration_files)
+        calibration = calibrate(corpus, teifiles)
+
+        # The metadata and the interpreter are in memory for all configs, and in every worker process
+        if self.base_memory is None and self.start_memory is not None:
+            self.base_memory = get_peak_memory()
+        size = self.survey.get_total_size(selected)
+        calibration_size = self.survey.get_total_size(teifiles)
+        scale = size / calibration_size if calibration_size else 0
+        seconds = metadata_seconds + calibration.seconds * scale / self.parallelism
+        rows = round(calibration.rows * scale)
+        output = (calibration.row_output + calibration.feature_output) * scale
+
+        memory = None
+        if self.base_memory is not None:
+            memory = self.base_memory + (calibration.row_memory + calibration.feature_memory) * scale
+            if self.executor == "process" and self.workers > 1:
+                memory += self.workers * (self.base_memory - self.start_memory)
+
+        self.estimates.append((seconds, memory, output))
+        print(f"  {len(selected)} files ({self.survey.format_size(size)}), timed on {calibration.files} files in {calibration.seconds:.1f} s")
+        print(
+            f"  Estimated wall time {format_duration(seconds)}, {rows:,} rows, "
+            f"output {format_size(output)}, peak memory {format_size(memory) if memory is not None else 'unknown'}"
+        )
+
+    def print(self):
+        """
+        Print the estimates of the whole run.
+        """
+        seconds = sum(estimate[0] for estimate in self.estimates)
+        memories = [estimate[1] for estimate in self.estimates if estimate[1] is not None]
+        output = sum(estimate[2] for estimate in self.estimates)
+        print(
+            f"Estimated run with {self.workers} {self.executor} worker{'s' if self.workers > 1 else ''} "
+            f"({self.parallelism} file{'s' if self.parallelism > 1 else ''} at a time): "
+            f"wall time {format_duration(seconds)}, "
+            f"peak memory {format_size(max(memories)) if memories else 'unknown'}, output {format_size(output)}"
+        )
@@ -0,0 +1,238 @@
+from utils import TEI_NS, XML_NS, MATTR_WINDOWS, headers, write_tsv
+from speech import read_sentences, hash_sentences
+from corpus_reader import CorpusReader
+from token_cache import TokenCache
+from collections import defaultdict
+from tqdm import tqdm
+from pathlib import Path
+import xml.etree.ElementTree as ET
+import csv
+
+MANIFEST_HEADERS = ["speech_id", "content_hash"]
+
+DIFF_HEADERS = ["speech_id", "status"]
+
+# Statuses of a speech in a newer release, compared to an older one
+DIFF_STATUSES = ["added", "removed", "changed", "unchanged"]
+
+# Result columns that describe the speech and its speaker, the same for all task types.
+# The columns after them, up to speech_source, only depend on the speech's tokens.
+CONTEXT_LENGTH = headers["hardspeech"].index("gov") + 1
+
+# Result columns that are numbers, read back as numbers so the aggregate tables can count them
+NUMERIC_HEADERS = {"is_stylized", "nfv_freq", "word_freq", "word_rank_mean", "word_rank_median", "speech_word_count"}
+
+
+def get_manifest_path(results_file: Path):
+    """
+    Get the path of the speech manifest saved next to a results file.
+
+    Args:
+        results_file: Path of the results TSV file.
+
+    Returns:
+        Path: The path of the manifest, e.g. sf_main_clause.speeches.tsv.
+    """
+    return results_file.with_name(f"{results_file.stem}.speeches.tsv")
+
+
+def fingerprint_corpus(teifiles: list[Path], corpus_reader: CorpusReader = None, token_cache: TokenCache = None):
+    """
+    Hash the tokens of every speech of the corpus files, see hash_sentences.
+
+    Args:
+        teifiles: Paths of the files.
+        corpus_reader: CorpusReader to read the files with, if they are not in a token cache.
+        token_cache: Token cache the files are in.
+
+    Returns:
+        dict: Maps speech ids to content hashes, in corpus order.
+    """
+    fingerprints = {}
+    if token_cache:
+        sources = map(token_cache.get_file, teifiles)
+    else:
+        sources = corpus_reader.prefetch(teifiles) if corpus_reader else teifiles
+
+    for source in tqdm(sources, total=len(teifiles), desc="Fingerprinting speeches"):
+        if token_cache:
+            speeches = source.speeches
+        else:
+            speeches = ET.parse(source).getroot().iterfind(".//tei:u", TEI_NS)
+        for speech in speeches:
+            speech_id = speech.attrib.get(f"{XML_NS}id")
+            if speech_id:
+                fingerprints[speech_id] = hash_sentences(read_sentences(speech))
+    return fingerprints
+
+
+def save_manifest(path: Path, fingerprints: dict):
+    """
+    Save the content hashes of speeches.
+
+    Args:
+        path: Path of the manifest TSV file.
+        fingerprints: Maps speech ids to content hashes.
+    """
+    write_tsv(path, MANIFEST_HEADERS, fingerprints.items())
+
+
+def load_manifest(path: Path):
+    """
+    Load the content hashes of speeches saved with save_manifest.
+
+    Args:
+        path: Path of the manifest TSV file.
+
+    Returns:
+        dict: Maps speech ids to content hashes.
+
+    Raises:
+        ValueError: If the file is not a manifest.
+    """
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        reader = csv.reader(file, delimiter="\t")
+        if next(reader, None) != MANIFEST_HEADERS:
+            raise ValueError(f"{path} is not a speech manifest, its columns should be {MANIFEST_HEADERS}.")
+        return {speech_id: content_hash for speech_id, content_hash in reader}
+
+
+def diff_manifests(old: dict, new: dict):
+    """
+    Compare the speeches of two releases by their ids and content hashes.
+
+    Args:
+        old: Manifest of the older release, from load_manifest.
+        new: Manifest of the newer release.
+
+    Returns:
+        dict: Maps each status in DIFF_STATUSES to the ids of the speeches with it,
+            in the order of the newer release, followed by the removed speeches.
+    """
+    diff = {status: [] for status in DIFF_STATUSES}
+    for speech_id, content_hash in new.items():
+        if speech_id not in old:
+            diff["added"].append(speech_id)
+        elif old[speech_id] != content_hash:
+            diff["changed"].append(speech_id)
+        else:
+            diff["unchanged"].append(speech_id)
+    diff["removed"] = [speech_id for speech_id in old if speech_id not in new]
+    return diff
+
+
+def parse_value(value: str, column: str):
+    """
+    Read back a value of a results TSV file as extraction would have made it.
+
+    Args:
+        value: The value in the file.
+        column: Name of its column.
+
+    Returns:
+        The value, as a number for numeric columns, or None if it is empty.
+    """
+    if value == "":
+        return None
+    if column in NUMERIC_HEADERS or column.startswith("mattr_"):
+        try:
+            return int(value)
+        except ValueError:
+            return float(value)
+    return value
+
+
+def get_content_columns(count, columns: list):
+    """
+    Get the columns of the values of a result row between gov and speech_source. Some
+    detectors give shorter output than others, so the detector output is matched to the
+    columns from the start and the speech-level features from the end.
+
+    Args:
+        count: The number of values of the row between gov and speech_source.
+        columns: The columns of the task type, from year to speech_id.
+
+    Returns:
+        list[str]: The column of each value.
+    """
+    content_columns = columns[CONTEXT_LENGTH:-2]
+    first_feature = f"mattr_{MATTR_WINDOWS[0]}"
+    if first_feature not in content_columns:
+        return content_columns[:count]
+    feature_count = len(columns) - 2 - columns.index(first_feature)
+    result_columns = content_columns[:-feature_count][: count - feature_count]
+    return [*result_columns, *content_columns[-feature_count:]]
+
+
+def parse_contents(values: list, columns: list):
+    """
+    Read back the columns of a result row between gov and speech_source, see get_content_columns.
+
+    Args:
+        values: The values of the row between gov and speech_source.
+        columns: The columns of the task type.
+
+    Returns:
+        list: The parsed values.
+    """
+    return [parse_value(value, column) for value, column in zip(values, get_content_columns(len(values), columns))]
+
+
+class PreviousResults:
+    """
+    The results of a run on an earlier release, to carry forward to a run on a newer
+    one. The run must have saved a speech manifest next to its results, so speeches it
+    processed without finding anything can be told apart from speeches it never read.
+
+    A speech is carried forward if it is in the manifest with the same content hash.
+    Its detector output and speech-level features are taken from the earlier results,
+    and the speaker and speech columns from the newer release, so changes to the
+    metadata are picked up. The earlier run must have used the same frequency list.
+
+    Args:
+        results_file: Path of the earlier results TSV file.
+        task_type: Task type of the new run.
+
+    Raises:
+        ValueError: If the results are of another task type or the manifest is missing.
+    """
+
+    def __init__(self, results_file: Path, task_type):
+        self.results_file = results_file
+        manifest_path = get_manifest_path(results_file)
+        if not manifest_path.exists():
+            raise ValueError(f"{results_file} has no speech manifest {manifest_path.name}. Run it with --fingerprints.")
+        self.fingerprints = load_manifest(manifest_path)
+
+        columns = headers[task_type]
+        self.contents = defaultdict(list)
+        with open(results_file, "r", encoding="utf-8", newline="") as file:
+            reader = csv.reader(file, delimiter="\t")
+            if next(reader, [])[: len(columns)] != columns:
+                raise ValueError(f"{results_file} does not have the columns of {task_type} results.")
+            for row in reader:
+                # Rows shorter than the header were padded at the end, and may be followed by a sample weight
+                row = row[: len(columns)]
+                while row and row[-1] == "":
+                    row.pop()
+                speech_id = row[-1]
+                self.contents[speech_id].append(parse_contents(row[CONTEXT_LENGTH:-2], columns))
+
+    def __str__(self):
+        return f"{self.results_file} ({len(self.fingerprints)} speeches)"
+
+    def get_contents(self, speech_id, content_hash):
+        """
+        Get the earlier results of a speech, if it is unchanged.
+
+        Args:
+            speech_id: The xml:id of the speech.
+            content_hash: The content hash of the speech in the newer release.
+
+        Returns:
+            list[list]: The columns between gov and speech_source of each earlier result row,
+                an empty list if the speech had no results, or None if it has to be checked again.
+        """
+        if self.fingerprints.get(speech_id) != content_hash:
+            return None
+        return self.contents.get(speech_id, [])
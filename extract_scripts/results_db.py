@@ -0,0 +1,120 @@
+from contextlib import closing
+from pathlib import Path
+import sqlite3
+import pandas as pd
+
+# Columns analysts filter on. An index is created for each of them that the table has.
+INDEXED_COLUMNS = ["person", "year", "party_id", "speech_type", "speech_id"]
+
+
+def quote(name):
+    """
+    Quote an SQL identifier, e.g. a column name like 'non-finite_verb'.
+
+    Args:
+        name: Name of the table or column.
+
+    Returns:
+        str: The quoted identifier.
+    """
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def save_results_db(data: pd.DataFrame, db_path: Path, table):
+    """
+    Save extraction results to a table in an SQLite database and index it.
+    An existing table with the same name is replaced.
+
+    Args:
+        data: DataFrame with the extraction results and their headers as columns.
+        db_path: Path to the SQLite database file. Created if it does not exist.
+        table: Name of the table, e.g. the task type or the person.
+    """
+    with closing(sqlite3.connect(db_path)) as connection, connection:
+        data.to_sql(table, connection, if_exists="replace", index=False)
+
+        for column in INDEXED_COLUMNS:
+            if column in data.columns:
+                connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {quote(f'{table}_{column}')} "
+                    f"ON {quote(table)} ({quote(column)})"
+                )
+
+
+def get_tables(db_path: Path):
+    """
+    List the result tables in a database.
+
+    Args:
+        db_path: Path to the SQLite database file.
+
+    Returns:
+        list[str]: Names of the tables.
+    """
+    with closing(sqlite3.connect(db_path)) as connection, connection:
+        rows = connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name"
+        ).fetchall()
+    return [name for name, in rows]
+
+
+def get_columns(db_path: Path, table):
+    """
+    List the columns of a result table.
+
+    Args:
+        db_path: Path to the SQLite database file.
+        table: Name of the table.
+
+    Returns:
+        list[str]: Names of the columns, empty if there is no such table.
+    """
+    with closing(sqlite3.connect(db_path)) as connection, connection:
+        rows = connection.execute(f"PRAGMA table_info({quote(table)})").fetchall()
+    return [row[1] for row in rows]
+
+
+def query_results_db(db_path: Path, table, filters: dict, columns=None, limit=None):
+    """
+    Select the rows of a result table that match the given filters.
+
+    Args:
+        db_path: Path to the SQLite database file.
+        table: Name of the table to query.
+        filters: Dictionary mapping column names to lists of accepted values.
+            Empty lists are ignored.
+        columns: Optional list of columns to return. Defaults to all columns.
+        limit: Optional maximum number of rows to return.
+
+    Returns:
+        pd.DataFrame: The matching rows.
+
+    Raises:
+        ValueError: If a column to return or filter on is not in the table. SQLite would
+            otherwise read an unknown quoted column name as a string.
+    """
+    table_columns = get_columns(db_path, table)
+    filtered = [column for column, values in filters.items() if values]
+    unknown = [column for column in [*(columns or []), *filtered] if column not in table_columns]
+    if unknown:
+        raise ValueError(f"Unknown columns {unknown} in table '{table}'. Available columns: {table_columns}.")
+
+    selected = ", ".join(quote(column) for column in columns) if columns else "*"
+    query = f"SELECT {selected} FROM {quote(table)}"
+
+    conditions = []
+    params = []
+    for column, values in filters.items():
+        if not values:
+            continue
+        placeholders = ", ".join("?" for _ in values)
+        conditions.append(f"{quote(column)} IN ({placeholders})")
+        params.extend(str(value) for value in values)
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    if limit:
+        query += f" LIMIT {int(limit)}"
+
+    with closing(sqlite3.connect(db_path)) as connection, connection:
+        return pd.read_sql_query(query, connection, params=params)
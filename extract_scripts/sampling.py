@@ -0,0 +1,301 @@
+from aggregates import FLAG_COLUMNS
+from collections import Counter
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import hashlib
+
+SAMPLE_WEIGHT_HEADER = "sample_weight"
+
+# Speeches are post-stratified by these columns
+STRATUM_COLUMNS = ["year", "party_id"]
+
+# Strata with fewer sampled speeches are collapsed into their year, and years into the whole corpus,
+# so every stratum has a variance estimate
+MIN_STRATUM_SAMPLED = 2
+
+UNIT_COLUMNS = ["year", "person", "party_id", "speech_id", "word_count"]
+
+ESTIMATE_HEADERS = [
+    "year",
+    "measure",
+    "estimate",
+    "standard_error",
+    "ci_low",
+    "ci_high",
+    "speeches_sampled",
+    "speeches_total",
+    "strata_unsampled",
+]
+
+# Coverage of the confidence intervals
+CONFIDENCE = 0.95
+
+
+class SpeechSample:
+    """
+    A reproducible random sample of speeches. Each speech is in the sample if a hash of
+    its id and the seed falls below the fraction, so the sample does not depend on the
+    order the files are processed in, and every stratum is sampled at the same rate.
+
+    Args:
+        fraction: Fraction of speeches to sample, between 0 and 1.
+        seed: Seed of the sample. Different seeds give independent samples.
+    """
+
+    def __init__(self, fraction, seed=0):
+        self.fraction = fraction
+        self.seed = seed
+        self.threshold = int(fraction * 2**64)
+
+    def __str__(self):
+        return f"Sample<{self.fraction:g}, seed {self.seed}>"
+
+    def is_sampled(self, speech_id):
+        """
+        Check if a speech is in the sample.
+
+        Args:
+            speech_id: The xml:id of the speech.
+
+        Returns:
+            bool: True if the speech is sampled.
+        """
+        digest = hashlib.blake2b(f"{self.seed}:{speech_id}".encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big") < self.threshold
+
+
+def count_sampled(strata, sampled):
+    """
+    Count the sampled speeches of each stratum.
+
+    Args:
+        strata: The stratum of each speech.
+        sampled: Whether each speech is sampled.
+
+    Returns:
+        Counter: Maps every stratum to its number of sampled speeches.
+    """
+    counts = Counter()
+    for stratum, is_sampled in zip(strata, sampled):
+        counts[stratum] += is_sampled
+    return counts
+
+
+def assign_strata(keys, sampled, min_sampled=MIN_STRATUM_SAMPLED):
+    """
+    Post-stratify speeches by year and party. A (year, party) stratum with fewer than
+    min_sampled sampled speeches is collapsed into the remainder of its year, and if the
+    remainder is still too small, the whole year is one stratum. Years that are too small
+    are collapsed into the rest of the corpus in the same way. Unsampled strata are thus
+    kept in the population of their parent instead of being left out.
+
+    Args:
+        keys: The (year, party_id) of each speech.
+        sampled: Whether each speech is sampled.
+        min_sampled: Minimum number of sampled speeches of a stratum.
+
+    Returns:
+        list[tuple]: The stratum of each speech: its (year, party_id), (year, None) for
+            a collapsed part of a year, or (None, None) for a collapsed part of the corpus.
+    """
+    strata = list(keys)
+    for parent in (lambda stratum: (stratum[0], None), lambda stratum: (None, None)):
+        counts = count_sampled(strata, sampled)
+        strata = [parent(stratum) if counts[stratum] < min_sampled else stratum for stratum in strata]
+        counts = count_sampled(strata, sampled)
+        strata = [
+            parent(stratum) if counts.get(parent(stratum), min_sampled) < min_sampled else stratum
+            for stratum in strata
+        ]
+    return strata
+
+
+class SampleEstimator:
+    """
+    Weight the result rows of a sampled run and estimate rates with confidence intervals.
+
+    Every speech that passes the filters is a unit, sampled or not. The speeches are
+    post-stratified by year and party, see assign_strata, and the weight of a sampled speech
+    is the number of speeches in its stratum divided by the number sampled from it. Rates
+    are estimated with the stratified ratio estimator, with speeches as the sampling units,
+    so rows from the same speech are not treated as independent.
+
+    Args:
+        task_type: Type of task the result rows come from.
+        columns: Column names of the result rows, in order.
+    """
+
+    def __init__(self, task_type, columns):
+        self.units = []
+        self.stratum_indices = [columns.index(column) for column in STRATUM_COLUMNS]
+        self.flag_column = FLAG_COLUMNS.get(task_type)
+        self.flag_index = columns.index(self.flag_column) if self.flag_column else None
+        self.weights = None
+
+    def add_units(self, units):
+        """
+        Add the speeches of a file.
+
+        Args:
+            units: List of (year, person, party_id, speech_id, word_count) tuples,
+                with word_count None for speeches that were not sampled.
+        """
+        self.units.extend(units)
+        self.weights = None
+
+    def get_units(self):
+        """
+        Get all speeches as a table.
+
+        Returns:
+            pd.DataFrame: One row per speech, with the columns in UNIT_COLUMNS, 'sampled'
+                and 'stratum', the number of the speech's collapsed stratum.
+        """
+        units = pd.DataFrame(self.units, columns=UNIT_COLUMNS)
+        units["party_id"] = units["party_id"].fillna("")
+        units["sampled"] = units["word_count"].notna()
+        strata = assign_strata(list(zip(units["year"], units["party_id"])), units["sampled"].tolist())
+        numbers = {stratum: number for number, stratum in enumerate(dict.fromkeys(strata))}
+        units["stratum"] = [numbers[stratum] for stratum in strata]
+        return units
+
+    def get_weights(self):
+        """
+        Get the weight of the speeches of each year and party.
+
+        Returns:
+            dict: Maps (year, party_id) to the weight of its speeches.
+        """
+        if self.weights is None:
+            units = self.get_units()
+            strata = units.groupby("stratum")["sampled"].agg(["size", "sum"])
+            strata = strata[strata["sum"] > 0]
+            weights = units["stratum"].map(strata["size"] / strata["sum"])
+            self.weights = dict(zip(zip(units["year"], units["party_id"]), weights))
+        return self.weights
+
+    def get_row_weight(self, row):
+        """
+        Get the sampling weight of a result row.
+
+        Args:
+            row: A result row.
+
+        Returns:
+            float: The weight of the row's speech.
+        """
+        key = tuple(row[index] or "" for index in self.stratum_indices)
+        return self.get_weights().get(key)
+
+    def estimate_ratio(self, units: pd.DataFrame, y, x):
+        """
+        Estimate the ratio of the population totals of two speech-level values.
+
+        Args:
+            units: Table of all speeches, as from get_units, with the columns y and x
+                filled in for the sampled speeches.
+            y: Column of the numerator.
+            x: Column of the denominator.
+
+        Returns:
+            tuple: The estimate and its standard error, NaN if there is no estimate. The
+                standard error is also NaN if a stratum has a single sampled speech, which
+                only happens in years with fewer than MIN_STRATUM_SAMPLED sampled speeches.
+        """
+        population = units.groupby("stratum").size()
+        sampled = units[units["sampled"]]
+        strata = sampled.groupby("stratum")
+        sizes = strata.size().reindex(population.index, fill_value=0)
+        if not sizes.all():
+            # The speeches of a stratum without sampled speeches can not be estimated
+            return np.nan, np.nan
+
+        total_y = (population * strata[y].mean()).sum()
+        total_x = (population * strata[x].mean()).sum()
+        if not total_x:
+            return np.nan, np.nan
+        ratio = total_y / total_x
+
+        # Linearized variance of the ratio, from the residuals between the speeches of each stratum
+        residuals = sampled[y] - ratio * sampled[x]
+        variances = residuals.groupby(sampled["stratum"]).var(ddof=1)
+        variance = (population**2 * (1 - sizes / population) * variances / sizes).sum(skipna=False) / total_x**2
+        return ratio, np.sqrt(variance)
+
+    def estimate(self, results):
+        """
+        Estimate the rates of the task per year and for all years.
+
+        The rate of hits per 1000 words is estimated for every task, and for tasks with
+        a flag column, such as is_stylized, the proportion of flagged hits as well.
+
+        Args:
+            results: List of result rows.
+
+        Returns:
+            pd.DataFrame: One row per year and measure, with the columns in ESTIMATE_HEADERS.
+        """
+        units = self.get_units()
+        # The speech id is the last value of every row, also of rows without a nfv_freq
+        hits = pd.Series([row[-1] for row in results], dtype=object).value_counts()
+        units["hits"] = units["speech_id"].map(hits).fillna(0)
+        units["thousand_words"] = units["word_count"] / 1000
+
+        measures = {"hits_per_1000_words": ("hits", "thousand_words")}
+        if self.flag_index is not None:
+            flagged = pd.Series(
+                [row[-1] for row in results if int(row[self.flag_index] or 0)],
+                dtype=object,
+            ).value_counts()
+            units["flagged"] = units["speech_id"].map(flagged).fillna(0)
+            measures[f"proportion_{self.flag_column}"] = ("flagged", "hits")
+
+        from scipy.stats import t
+
+        groups = [("all", units), *units.groupby("year", sort=True)]
+        estimates = []
+        for year, year_units in groups:
+            sampled_units = year_units[year_units["sampled"]]
+            sampled_strata = sampled_units.groupby(STRATUM_COLUMNS).ngroups
+            # The variance is estimated from few speeches per stratum, so the intervals use
+            # the t distribution with the degrees of freedom of the stratified design
+            degrees_of_freedom = len(sampled_units) - sampled_units["stratum"].nunique()
+            quantile = t.ppf((1 + CONFIDENCE) / 2, degrees_of_freedom) if degrees_of_freedom > 0 else np.nan
+            for measure, (y, x) in measures.items():
+                ratio, standard_error = self.estimate_ratio(year_units, y, x)
+                estimates.append(
+                    [
+                        year,
+                        measure,
+                        ratio,
+                        standard_error,
+                        ratio - quantile * standard_error,
+                        ratio + quantile * standard_error,
+                        len(sampled_units),
+                        len(year_units),
+                        year_units.groupby(STRATUM_COLUMNS).ngroups - sampled_strata,
+                    ]
+                )
+
+        return pd.DataFrame(estimates, columns=ESTIMATE_HEADERS)
+
+    def save(self, output_file: Path, results):
+        """
+        Save the estimates next to the main output file and print the overall ones.
+
+        Args:
+            output_file: Path of the main output TSV file.
+            results: List of result rows.
+        """
+        estimates = self.estimate(results)
+        estimates_path = output_file.with_name(f"{output_file.stem}.sample_estimates.tsv")
+        estimates.to_csv(estimates_path, sep="\t", index=False)
+
+        for estimate in estimates[estimates["year"] == "all"].itertuples():
+            print(
+                f"{estimate.measure}: {estimate.estimate:.4g} "
+                f"(95% CI {estimate.ci_low:.4g} to {estimate.ci_high:.4g}), "
+                f"{estimate.speeches_sampled} of {estimate.speeches_total} speeches sampled"
+            )
+        print("Sample estimates saved to", estimates_path)
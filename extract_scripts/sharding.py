@@ -0,0 +1,216 @@
+from utils import TASK_TYPES, headers, get_tsv_writer, file_year
+from corpus_reader import get_xml_name
+from collections import defaultdict
+from pathlib import Path
+import argparse
+import hashlib
+import heapq
+import csv
+import re
+
+SHARD_PATTERN = re.compile(r"\.shard-(\d+)-of-(\d+)$")
+
+# Columns in front of every shard row, giving its position in a single-node run
+KEY_HEADERS = ["file_index", "row_index"]
+
+
+def parse_shard(text):
+    """
+    Parse a shard argument like '2/4', meaning the second of four shards.
+
+    Args:
+        text: The shard as 'i/N', with 1 <= i <= N.
+
+    Returns:
+        tuple[int, int]: The shard number and the number of shards.
+    """
+    try:
+        shard, shard_count = (int(number) for number in text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Shard must look like 'i/N', not '{text}'.")
+    if not 1 <= shard <= shard_count:
+        raise argparse.ArgumentTypeError(f"Shard number must be between 1 and {shard_count}.")
+    return shard, shard_count
+
+
+def file_hash(teifile: Path):
+    """
+    A hash of the file name that is the same on every machine, and for compressed
+    and uncompressed copies of the file.
+
+    Args:
+        teifile: Path to the TEI file.
+
+    Returns:
+        str: Hex digest of the file name.
+    """
+    return hashlib.sha1(get_xml_name(teifile).encode("utf-8")).hexdigest()
+
+
+def select_shard(teifiles: list[Path], shard, shard_count):
+    """
+    Select the files of one shard. The files of each year are ordered by the hash
+    of their names and dealt out to the shards in turn, so every shard gets about
+    the same number of files from every year, and the split does not depend on
+    where the corpus is stored.
+
+    Args:
+        teifiles: List of all TEI files.
+        shard: The shard number, from 1 to shard_count.
+        shard_count: The number of shards.
+
+    Returns:
+        list[Path]: The files of the shard, in the same order as in teifiles.
+    """
+    files_by_year = defaultdict(list)
+    for teifile in teifiles:
+        files_by_year[file_year(teifile)].append(teifile)
+
+    selected = set()
+    turn = 0
+    for year in sorted(files_by_year):
+        for teifile in sorted(files_by_year[year], key=file_hash):
+            if turn % shard_count == shard - 1:
+                selected.add(teifile)
+            turn += 1
+
+    return [teifile for teifile in teifiles if teifile in selected]
+
+
+def shard_path(output_file: Path, shard, shard_count, suffix=".tsv"):
+    """
+    Get the path of a shard's output file.
+
+    Args:
+        output_file: Path of the output file of a single-node run.
+        shard: The shard number.
+        shard_count: The number of shards.
+        suffix: Suffix of the shard file.
+
+    Returns:
+        Path: e.g. 'hardspeech.shard-2-of-4.tsv' for 'hardspeech.tsv'.
+    """
+    return output_file.with_name(f"{output_file.stem}.shard-{shard}-of-{shard_count}{suffix}")
+
+
+def read_shard_columns(shard_file: Path):
+    """
+    Read the column names of a shard file.
+
+    Args:
+        shard_file: Path of the shard file.
+
+    Returns:
+        list[str]: The columns after the key columns, or None if the file does not start with them.
+    """
+    with open(shard_file, "r", encoding="utf-8", newline="") as file:
+        columns = next(csv.reader(file, delimiter="\t"), [])
+    if columns[: len(KEY_HEADERS)] != KEY_HEADERS:
+        return None
+    return columns[len(KEY_HEADERS) :]
+
+
+def get_task_type(columns):
+    """
+    Get the task type whose output has the given columns.
+
+    Args:
+        columns: Column names of a shard file, without the key columns.
+
+    Returns:
+        str: The task type, or None if no task type has these columns.
+    """
+    return next((task for task in TASK_TYPES if headers[task] == columns), None)
+
+
+def check_shards(shard_files: list[Path], results=True):
+    """
+    Check that the shard files are all the shards of one run.
+
+    Args:
+        shard_files: List of shard output files.
+        results: Whether the shards are result files, whose columns must be those of the
+            same task type. False for other shard files, such as frequency counts.
+
+    Returns:
+        str: An error message, or None if the shards are complete.
+    """
+    numbers = set()
+    counts = set()
+    for shard_file in shard_files:
+        match = SHARD_PATTERN.search(shard_file.stem)
+        if not match:
+            return f"'{shard_file}' is not a shard file, its name should end in '.shard-i-of-N{shard_file.suffix}'."
+        numbers.add(int(match.group(1)))
+        counts.add(int(match.group(2)))
+
+    if len(counts) != 1:
+        return f"The shard files come from runs with different numbers of shards: {sorted(counts)}."
+    shard_count = counts.pop()
+    missing = set(range(1, shard_count + 1)) - numbers
+    if missing or len(shard_files) != shard_count:
+        return f"Expected each of the {shard_count} shards once, missing shards: {sorted(missing)}."
+
+    if not results:
+        return None
+    # The SF tasks have the same columns, but the files of each task have their own name
+    names = {shard_file.stem[: SHARD_PATTERN.search(shard_file.stem).start()] for shard_file in shard_files}
+    if len(names) != 1:
+        return f"The shard files come from different outputs: {sorted(names)}."
+    first_columns = read_shard_columns(shard_files[0])
+    if get_task_type(first_columns) is None:
+        return f"'{shard_files[0]}' does not have the columns of a shard of any task type {TASK_TYPES}."
+    for shard_file in shard_files[1:]:
+        if read_shard_columns(shard_file) != first_columns:
+            return f"'{shard_file}' has different columns than '{shard_files[0]}', the shards come from different tasks."
+
+
+def read_shard(shard_file: Path):
+    """
+    Read the rows of a shard file with their keys.
+
+    Args:
+        shard_file: Path of the shard file.
+
+    Yields:
+        tuple: The (file_index, row_index) key and the row without the key columns.
+    """
+    with open(shard_file, "r", encoding="utf-8", newline="") as file:
+        reader = csv.reader(file, delimiter="\t")
+        next(reader)
+        for row in reader:
+            yield (int(row[0]), int(row[1])), row[2:]
+
+
+def merge_shards(shard_files: list[Path], output_file: Path):
+    """
+    Merge the outputs of all shards into the file a single-node run would produce.
+    The shards are read in parallel and merged on their keys, so only one row per
+    shard is held in memory. The aggregate tables of the shards are summed as well.
+    The shards should be checked with check_shards first.
+
+    Args:
+        shard_files: List of shard output files.
+        output_file: Path of the merged output file.
+    """
+    from aggregates import AGGREGATE_GROUPINGS, AggregateCounter, aggregate_path
+
+    columns = read_shard_columns(shard_files[0])
+    task_type = get_task_type(columns)
+    aggregates = AggregateCounter(task_type, columns)
+
+    with open(output_file, "w", encoding="utf-8", newline="") as file:
+        writer = get_tsv_writer(file)
+        writer.writerow(columns)
+        rows = heapq.merge(*[read_shard(shard_file) for shard_file in shard_files])
+        for _, row in rows:
+            writer.writerow(row)
+
+    for name in AGGREGATE_GROUPINGS:
+        for shard_file in shard_files:
+            table_path = aggregate_path(shard_file, name)
+            if table_path.exists():
+                aggregates.add_table(name, table_path)
+    aggregates.save(output_file)
+
+    print("Merged", len(shard_files), "shards into", output_file)
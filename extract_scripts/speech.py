@@ -1,7 +1,135 @@
-from utils import Token, TEI_NS, HS_PATTERN, TAGS, TASK_TYPES, VERBS, WINDOW, MATTR_WINDOWS
+from utils import Token, Sentence, simple_tag, TEI_NS, HS_PATTERN, TAGS, TASK_TYPES, VERBS, WINDOW, MATTR_WINDOWS
+from token_cache import CachedSpeech
 from lexicalrichness import LexicalRichness
+from functools import cached_property
+import hashlib
 import re
-from statistics import median
+
+
+def get_speaker_type(teispeech):
+    """
+    Determines the type of speaker based on speech annotations.
+
+    Args:
+        teispeech: XML element of the speech, or a CachedSpeech.
+
+    Returns:
+        str: Speaker type (e.g., "chair", "guest", or "regular").
+    """
+    notes = teispeech.attrib.get("ana", "").split()
+    if "#chair" in notes:
+        return "chair"
+    elif "#guest" in notes:
+        return "guest"
+    else:
+        return "regular"
+
+
+def get_speech_type(speech_source, speech_types):
+    """
+    Determines the type of speech based on the speech source.
+
+    Args:
+        speech_source: Source string of the speech.
+        speech_types: Dictionary mapping sources to speech types.
+
+    Returns:
+        str: Speech type description.
+    """
+    base_source = speech_source.split("?")[0]
+    try:
+        return speech_types[base_source]
+    except KeyError:
+        return resolve_speech_type_from_pattern(speech_source, speech_types)
+
+
+def resolve_speech_type_from_pattern(speech_source, speech_types):
+    """
+    Attempts to resolve speech type using regex if not directly found.
+
+    Args:
+        speech_source: Source string of the speech.
+        speech_types: Dictionary mapping sources to speech types.
+
+    Returns:
+        str: Resolved speech type or "none" if not found.
+    """
+    pattern = r"=(\d+)"
+    results = re.findall(pattern, speech_source)
+    if results:
+        base_source = (
+            f"http://www.althingi.is/altext/raeda/{results[0]}/{results[1]}.html"
+        )
+        return speech_types.get(base_source, "none")
+    return "none"
+
+
+def read_token(aword):
+    """
+    Extracts a token from an XML word element.
+
+    Args:
+        aword: XML element representing a word.
+
+    Returns:
+        Token: A Token object containing word, lemma, and tag information, or None if the
+            element is not a word or punctuation.
+    """
+    element_tag = aword.tag.split("}")[-1]
+    if element_tag in ("w", "pc"):
+        word = aword.text
+        if element_tag == "w":
+            lemma = aword.get("lemma")
+        else:
+            lemma = "NONE"
+        tag = aword.get("pos")
+        return Token.get(word, lemma, tag)
+
+
+def read_sentences(teispeech):
+    """
+    Reads the tokens of each sentence in a speech.
+
+    Args:
+        teispeech: XML element of the speech, or a CachedSpeech.
+
+    Returns:
+        list[Sentence]: The sentences of the speech.
+    """
+    if isinstance(teispeech, CachedSpeech):
+        return teispeech.get_sentences()
+
+    sentences = []
+    for asentence in teispeech.findall(".//tei:s", TEI_NS):
+        tokens = []
+        joins = bytearray()
+        for aword in asentence.iter():
+            token = read_token(aword)
+            if token:
+                tokens.append(token)
+                joins.append(bool(aword.get("join")))
+        sentences.append(Sentence(tuple(tokens), bytes(joins)))
+
+    return sentences
+
+
+def hash_sentences(sentences):
+    """
+    Hashes the tokens of a speech, which its text, detector output and speech-level
+    features depend on, but not its speaker or the file it is in.
+
+    Args:
+        sentences: The sentences of the speech.
+
+    Returns:
+        str: Hex digest of the words, lemmas, tags and joins of every sentence.
+    """
+    digest = hashlib.sha1()
+    for sentence in sentences:
+        for token in sentence.tokens:
+            digest.update(f"{token.word}\t{token.lemma}\t{token.tag}\n".encode("utf-8"))
+        digest.update(sentence.joins + b"\x00")
+    return digest.hexdigest()
 
 
 class Speech:
@@ -9,15 +137,16 @@ class Speech:
     Initialize the Speech object with TEI speech data, metadata, and task type.
 
     Args:
-        teispeech: XML element representing the speech.
+        teispeech: XML element representing the speech, or a CachedSpeech from a token cache.
         speech_date: Date of the speech in "YYYY-MM-DD" format.
         speech_year: Year of the speech as a string.
         metadata: Metadata dictionary containing information about MPs, parties, etc.
         mp_affiliations: Dictionary mapping MP IDs to their affiliations.
         task_type: Type of task to perform (e.g., "sf_sub_clause").
+        detector_cache: Optional DetectorCache shared by the speeches of a run.
     """
     def __init__(
-        self, teispeech, speech_date, speech_year, metadata, mp_affiliations, task_type
+        self, teispeech, speech_date, speech_year, metadata, mp_affiliations, task_type, detector_cache=None
     ):
         # Input parameters
         self.speech = teispeech
@@ -25,6 +154,8 @@ class Speech:
         self.speech_year = speech_year
         self.metadata = metadata
         self.task_type = task_type
+        self.detector_cache = detector_cache
+        self.sentences_reused = 0
 
         # Metadata and speaker information
         self.author_id = teispeech.attrib["who"][1:]
@@ -38,17 +169,75 @@ class Speech:
         # Speech content and analysis
         self.speech_id = teispeech.attrib["{http://www.w3.org/XML/1998/namespace}id"]
         self.speech_source = teispeech.attrib["source"]
-        self.word_count = 0
-        self.word_ranks = []
         self.speech_type = self.determine_speech_type()
-        self.full_speech_text = self.join_speech()
-        self.lex_score = [self.get_mattr_score(window) for window in MATTR_WINDOWS]
-        self.rank_sum = sum(self.word_ranks)
-        self.rank_mean = sum(self.word_ranks) / len(self.word_ranks) if self.word_ranks else 0
-        self.rank_median = median(self.word_ranks) if self.word_ranks else 0
+        self.sentences = self.get_sentences()
+
+        # Rank statistics, set for all speeches of a file at once with set_features
+        self.rank_mean = 0
+        self.rank_median = 0
 
         # Results
+        self.hits = []
         self.results = []
+        self.carried = False
+
+    @cached_property
+    def full_speech_text(self):
+        """
+        The full text of the speech. Only joined when needed, for the MATTR scores or
+        when the speech is saved.
+        """
+        return self.join_speech()
+
+    @cached_property
+    def word_ranks(self):
+        """
+        The frequency rank of every word in the speech, in order.
+        """
+        return [
+            self.get_word_freq(token, rank=True)
+            for sentence in self.sentences
+            for token in sentence.tokens
+            if token.lemma != "NONE"
+        ]
+
+    @cached_property
+    def word_count(self):
+        """
+        The number of words in the speech, not counting punctuation.
+        """
+        return sum(
+            token.lemma != "NONE"
+            for sentence in self.sentences
+            for token in sentence.tokens
+        )
+
+    @cached_property
+    def lex_score(self):
+        """
+        The MATTR scores of the speech, one per window in MATTR_WINDOWS. Only computed
+        when needed, as set_features sets them for speeches found in a feature cache.
+        """
+        return [self.get_mattr_score(window) for window in MATTR_WINDOWS]
+
+    def set_features(self, features):
+        """
+        Set the speech-level features computed by a SpeechFeatureTable or read from a cache.
+
+        Args:
+            features: Row of the feature table for this speech.
+        """
+        self.rank_mean = features.word_rank_mean
+        self.rank_median = features.word_rank_median
+        self.lex_score = [getattr(features, f"mattr_{window}") for window in MATTR_WINDOWS]
+
+    @cached_property
+    def content_hash(self):
+        """
+        Hash of the tokens of the speech, see hash_sentences. The speech-level features
+        and the detector output only depend on it.
+        """
+        return hash_sentences(self.sentences)
 
     def save_speech_text(self, path):
         """
@@ -68,13 +257,7 @@ class Speech:
         Returns:
             str: Speaker type (e.g., "chair", "guest", or "regular").
         """
-        notes = self.speech.attrib.get("ana", "").split()
-        if "#chair" in notes:
-            return "chair"
-        elif "#guest" in notes:
-            return "guest"
-        else:
-            return "regular"
+        return get_speaker_type(self.speech)
 
     def determine_speech_type(self):
         """
@@ -83,14 +266,7 @@ class Speech:
         Returns:
             str: Speech type description.
         """
-        speech_types = self.metadata["speech_types"]
-        base_source = self.speech_source.split("?")[0]
-        try:
-            return speech_types[base_source]
-        except KeyError:
-            return self.resolve_speech_type_from_pattern(
-                self.speech_source, speech_types
-            )
+        return get_speech_type(self.speech_source, self.metadata["speech_types"])
         
     def get_mattr_score(self, window_size=WINDOW):
         """
@@ -114,25 +290,15 @@ class Speech:
         
         return lex_score
     
-    def get_token(self, aword):
+    def get_sentences(self):
         """
-        Extracts a token from an XML word element.
-
-        Args:
-            aword: XML element representing a word.
+        Reads the tokens of each sentence in the speech once, so the text, the word
+        ranks and the task checks all use the same shared tokens.
 
         Returns:
-            Token: A Token object containing word, lemma, and tag information.
-        """
-        element_tag = aword.tag.split("}")[-1]
-        if element_tag in ["w", "pc"]:
-            word = aword.text
-            if element_tag == "w":
-                lemma = aword.get("lemma")
-            else:
-                lemma = "NONE"
-            tag = aword.get("pos")
-            return Token(word, lemma, tag)
+            list[Sentence]: The sentences of the speech.
+        """
+        return read_sentences(self.speech)
 
     def join_speech(self):
         """
@@ -142,49 +308,42 @@ class Speech:
             str: Full speech text.
         """
         text = []
-        for asentence in self.speech.findall(".//tei:s", TEI_NS):
-            for aword in asentence.iter():
-                token = self.get_token(aword)
-                if token:
-                    is_joined = not bool(aword.get("join"))
-                    word = token.word + " " * is_joined
-                    text.append(word)
-                    if token.lemma != "NONE":
-                        self.word_ranks.append(self.get_word_freq(token, rank=True))
-                        self.word_count += 1
+        for sentence in self.sentences:
+            for token, is_joined in zip(sentence.tokens, sentence.joins):
+                word = token.word if is_joined else token.word + " "
+                text.append(word)
 
         return "".join(text)
 
     def check_speech(self):
         """
-        Processes the speech to extract results based on the task type.
+        Finds the hits of the task type in every sentence of the speech. Only the
+        detectors run here; the output rows, which need the speech-level features,
+        are made by get_results.
+
+        Returns:
+            bool: True if the speech has any hits.
         """
-        for asentence in self.speech.findall(".//tei:s", TEI_NS):
-            sentence = []
+        for sentence in self.sentences:
+            results = self.check_sentence(sentence)
+            if results:
+                full_text = " ".join([token.word for token in sentence])
+                self.hits.extend((full_text, result) for result in results)
 
-            for aword in asentence.iter():
-                token = self.get_token(aword)
-                if not token:
-                    continue
-                sentence.append(token)
+        return bool(self.hits)
 
-            full_text = " ".join([token.word for token in sentence])
-            results = self.check_sentence(sentence)
+    def get_results(self):
+        """
+        Retrieve the results of processing the speech. The speech-level features must
+        have been set with set_features if the speech has hits.
 
-            for result in results:
+        Returns:
+            list: List of extracted results.
+        """
+        if self.hits and not self.results:
+            for full_text, result in self.hits:
                 data = [
-                    self.speech_year,
-                    self.speech_date,
-                    self.speech_type,
-                    self.author_id,
-                    self.mp["sex"],
-                    self.mp["birth"].split("-")[0],
-                    self.role,
-                    self.speaker_type,
-                    self.party_id,
-                    self.party,
-                    self.party_status,
-                    self.gov,
+                    *self.get_context(),
                     *result,
                     *self.lex_score,
                     self.rank_mean,
@@ -197,14 +356,42 @@ class Speech:
 
                 self.results.append(data)
 
-    def get_results(self):
+        return self.results
+
+    def get_context(self):
         """
-        Retrieve the results of processing the speech.
+        Get the columns of a result row that describe the speech and its speaker, which
+        come from the metadata rather than from the tokens.
 
         Returns:
-            list: List of extracted results.
+            list: The values of the columns from year to gov.
+        """
+        return [
+            self.speech_year,
+            self.speech_date,
+            self.speech_type,
+            self.author_id,
+            self.mp["sex"],
+            self.mp["birth"].split("-")[0],
+            self.role,
+            self.speaker_type,
+            self.party_id,
+            self.party,
+            self.party_status,
+            self.gov,
+        ]
+
+    def carry_forward(self, contents: list[list]):
         """
-        return self.results
+        Set the results from those of the same speech in an earlier release, instead of
+        checking the speech again. Only the columns that depend on the tokens are carried
+        forward; the speaker and speech columns are taken from this release.
+
+        Args:
+            contents: The columns between gov and speech_source of each earlier result row.
+        """
+        self.carried = True
+        self.results = [[*self.get_context(), *content, self.speech_source, self.speech_id] for content in contents]
 
     def slices(self, chunks, slicelen=3):
         """
@@ -226,11 +413,19 @@ class Speech:
         Checks if the given sentence based on the given task type.
 
         Args:
-            sentence: List of Token objects representing the sentence.
+            sentence: Sentence or list of Token objects.
 
         Returns:
             list[list]: Sentence results depending on task type.
         """
+        if self.detector_cache is not None:
+            # A list of tokens is not hashable, so the key holds a tuple of them
+            key = (self.task_type, tuple(sentence))
+            rows = self.detector_cache.get(key)
+            if rows is not None:
+                self.sentences_reused += 1
+                return rows
+
         rows = []
 
         if self.task_type == TASK_TYPES[0]:
@@ -240,6 +435,9 @@ class Speech:
         else:
             self.check_hardspeech(sentence, rows)
 
+        if self.detector_cache is not None:
+            self.detector_cache.put(key, rows)
+
         return rows
 
     def get_word_freq(self, token: Token, rank=False):
@@ -253,13 +451,8 @@ class Speech:
         Returns:
             int: Frequency or rank of the word.
         """
-        if token.tag.startswith("n"):
-            tag = token.tag[:2]
-        else:
-            tag = token.tag[0]
-
         try:
-            results = self.metadata["freq_dict"][token.lemma][tag]
+            results = self.metadata["freq_dict"][token.lemma][simple_tag(token.tag)]
         except KeyError:
             results = 0, 0
         
@@ -267,13 +460,13 @@ class Speech:
             return results[1]
         return results[0]
     
-    def get_hardspeech_env(self, i: int, sentence: list[Token], max_len=10):
+    def get_hardspeech_env(self, i: int, sentence: Sentence, max_len=10):
         """
         Retrieves the context (before and after) of a word in a sentence.
 
         Args:
             i: Index of the word in the sentence.
-            sentence: List of Token objects representing the sentence.
+            sentence: Sentence or list of Token objects.
             max_len: Maximum number of words to include in the context (default is 10).
 
         Returns:
@@ -288,12 +481,12 @@ class Speech:
 
         return " ".join(before), " ".join(after)
 
-    def check_hardspeech(self, sentence: list[Token], rows: list):
+    def check_hardspeech(self, sentence: Sentence, rows: list):
         """
         Checks for hard speech patterns in a sentence.
 
         Args:
-            sentence: List of Token objects representing the sentence.
+            sentence: Sentence or list of Token objects.
             rows: List to store the results of the check.
         """
         for i, token in enumerate(sentence):
@@ -311,7 +504,7 @@ class Speech:
         Checks for SF patterns in a sentence's sub-clause.
 
         Args:
-            sentence: List of Token objects representing the sentence.
+            sentence: Sentence or list of Token objects.
             rows: List to store the results of the check.
         """
         for slice in self.slices(sentence):
@@ -346,7 +539,7 @@ class Speech:
         Checks for SF patterns in a sentence's main clause.
 
         Args:
-            sent: List of Token objects representing the sentence.
+            sent: Sentence or list of Token objects.
             rows: List to store the results of the check.
         """
         if len(sent) <= 3:
@@ -367,23 +560,3 @@ class Speech:
             text = " ".join([token.word for token in sent[:2]])
             frq = self.get_word_freq(sent[1])
             rows.append([1, text, VERBS[sent[1].lemma], sent[0].lemma])
-
-    def resolve_speech_type_from_pattern(self, speech_source, speech_types):
-        """
-        Attempts to resolve speech type using regex if not directly found.
-
-        Args:
-            speech_source: Source string of the speech.
-            speech_types: Dictionary mapping sources to speech types.
-
-        Returns:
-            str: Resolved speech type or "none" if not found.
-        """
-        pattern = r"=(\d+)"
-        results = re.findall(pattern, speech_source)
-        if results:
-            base_source = (
-                f"http://www.althingi.is/altext/raeda/{results[0]}/{results[1]}.html"
-            )
-            return speech_types.get(base_source, "none")
-        return "none"
\ No newline at end of file
@@ -0,0 +1,158 @@
+from speech_features import SPEECH_FEATURE_HEADERS
+from results_db import quote
+from pathlib import Path
+import threading
+import hashlib
+import sqlite3
+
+# Bump when the speech features change, e.g. a new MATTR window or rank definition,
+# so features computed by older code are not reused.
+FEATURE_VERSION = 1
+
+# Features that only depend on the speech's tokens and the frequency list
+CACHED_FEATURES = SPEECH_FEATURE_HEADERS[3:]
+
+# Number of keys looked up per query
+LOOKUP_BATCH_SIZE = 500
+
+
+def fingerprint_file(path: Path):
+    """
+    Hash the contents of a file, e.g. the frequency list the word ranks come from.
+
+    Args:
+        path: Path to the file.
+
+    Returns:
+        str: Hex digest of the file contents.
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class SpeechFeatureCache:
+    """
+    A persistent SQLite store of speech-level features, shared by all task types and configs.
+    Features are keyed by a hash of the speech's tokens, the feature version and the
+    frequency list, so a changed speech or frequency list gets new features.
+
+    Each thread uses its own connection, and several processes can share the database.
+    Call close() when done to close the connections of all threads.
+
+    Args:
+        db_path: Path to the SQLite database file. Created if it does not exist.
+        freq_list: Path to the frequency list the word ranks are computed with.
+    """
+
+    def __init__(self, db_path: Path, freq_list: Path):
+        self.db_path = db_path
+        self.prefix = f"{FEATURE_VERSION}:{fingerprint_file(freq_list)}:"
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+        columns = ", ".join(
+            f"{quote(column)} {'INTEGER' if column in ('speech_word_count', 'lemma_types') else 'REAL'}"
+            for column in CACHED_FEATURES
+        )
+        connection = self.get_connection()
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute(
+            f"CREATE TABLE IF NOT EXISTS speech_features (key TEXT PRIMARY KEY, {columns}) WITHOUT ROWID"
+        )
+        connection.commit()
+
+    def __getstate__(self):
+        # Worker processes open their own connections
+        return {"db_path": self.db_path, "prefix": self.prefix}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def get_connection(self):
+        """
+        Get the connection of the current thread.
+
+        Returns:
+            sqlite3.Connection: The connection.
+        """
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            # Connections are only used by their thread, but close() may run in another one
+            connection = sqlite3.connect(self.db_path, timeout=60, check_same_thread=False)
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    def close(self):
+        """
+        Close the connections of all threads. A later lookup opens a new connection.
+        """
+        with self.lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections.clear()
+        self.local = threading.local()
+
+    def get_key(self, content_hash):
+        """
+        Get the key of a speech's features.
+
+        Args:
+            content_hash: Hash of the speech's tokens, see Speech.content_hash.
+
+        Returns:
+            str: The key.
+        """
+        return hashlib.sha1((self.prefix + content_hash).encode("utf-8")).hexdigest()
+
+    def get_many(self, content_hashes: list):
+        """
+        Look up the features of many speeches.
+
+        Args:
+            content_hashes: Hashes of the speeches' tokens.
+
+        Returns:
+            dict: Maps the content hashes that were found to their features,
+                a tuple of values in the order of CACHED_FEATURES.
+        """
+        keys = {self.get_key(content_hash): content_hash for content_hash in content_hashes}
+        selected = ", ".join(quote(column) for column in CACHED_FEATURES)
+        connection = self.get_connection()
+
+        found = {}
+        key_list = list(keys)
+        for start in range(0, len(key_list), LOOKUP_BATCH_SIZE):
+            batch = key_list[start : start + LOOKUP_BATCH_SIZE]
+            rows = connection.execute(
+                f"SELECT key, {selected} FROM speech_features "
+                f"WHERE key IN ({', '.join('?' * len(batch))})",
+                batch,
+            )
+            for key, *features in rows:
+                found[keys[key]] = tuple(features)
+
+        return found
+
+    def put_many(self, features: dict):
+        """
+        Store the features of many speeches.
+
+        Args:
+            features: Maps content hashes to tuples of values in the order of CACHED_FEATURES.
+        """
+        placeholders = ", ".join("?" * (len(CACHED_FEATURES) + 1))
+        connection = self.get_connection()
+        connection.executemany(
+            f"INSERT OR REPLACE INTO speech_features VALUES ({placeholders})",
+            [(self.get_key(content_hash), *values) for content_hash, values in features.items()],
+        )
+        connection.commit()
@@ -0,0 +1,163 @@
+from utils import MATTR_WINDOWS
+import numpy as np
+import pandas as pd
+
+RANK_PERCENTILES = [10, 25, 75, 90]
+
+SPEECH_FEATURE_HEADERS = [
+    "speech_id",
+    "year",
+    "person",
+    "speech_word_count",
+    "word_rank_mean",
+    "word_rank_median",
+    *[f"word_rank_p{percentile}" for percentile in RANK_PERCENTILES],
+    "lemma_types",
+    "lemma_ttr",
+    *[f"mattr_{score}" for score in MATTR_WINDOWS],
+]
+
+
+class SpeechFeatureTable:
+    """
+    Collect the word ranks and lemmas of many speeches and compute the speech-level
+    features for all of them at once with NumPy.
+
+    Args:
+        speeches: Optional list of Speech objects to add.
+    """
+
+    def __init__(self, speeches=()):
+        self.speeches = []
+        self.ranks = []
+        self.lemma_ids = []
+        self.lemma_vocabulary = {}
+
+        for speech in speeches:
+            self.add(speech)
+
+    def add(self, speech):
+        """
+        Add a speech to the table.
+
+        Args:
+            speech: Speech object whose word ranks have been collected.
+        """
+        vocabulary = self.lemma_vocabulary
+        lemma_ids = [
+            vocabulary.setdefault(token.lemma, len(vocabulary))
+            for sentence in speech.sentences
+            for token in sentence
+            if token.lemma != "NONE"
+        ]
+        self.speeches.append(speech)
+        self.ranks.append(speech.word_ranks)
+        self.lemma_ids.append(lemma_ids)
+
+    def get_segments(self, lists):
+        """
+        Concatenate per-speech lists into one array.
+
+        Args:
+            lists: List with one list of numbers per speech.
+
+        Returns:
+            tuple: The concatenated values, the speech index of each value and
+                the number of values per speech.
+        """
+        lengths = np.array([len(values) for values in lists], dtype=np.int64)
+        values = np.fromiter(
+            (value for values in lists for value in values),
+            dtype=np.int64,
+            count=int(lengths.sum()),
+        )
+        segment_ids = np.repeat(np.arange(len(lists)), lengths)
+        return values, segment_ids, lengths
+
+    def get_percentiles(self, values, segment_ids, lengths, percentiles):
+        """
+        Compute percentiles of each speech's values, interpolating linearly
+        like numpy.percentile. Speeches without values get 0.
+
+        Args:
+            values: Concatenated values of all speeches.
+            segment_ids: Speech index of each value.
+            lengths: Number of values per speech.
+            percentiles: List of percentiles between 0 and 100.
+
+        Returns:
+            list[np.ndarray]: One array per percentile with a value per speech.
+        """
+        order = np.lexsort((values, segment_ids))
+        sorted_values = values[order].astype(np.float64)
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(lengths) else lengths
+        has_values = lengths > 0
+        last = np.maximum(lengths - 1, 0)
+
+        results = []
+        for percentile in percentiles:
+            position = last * percentile / 100
+            low = np.floor(position).astype(np.int64)
+            high = np.ceil(position).astype(np.int64)
+            fraction = position - low
+
+            result = np.zeros(len(lengths))
+            low_values = sorted_values[(starts + low)[has_values]]
+            high_values = sorted_values[(starts + high)[has_values]]
+            difference = high_values - low_values
+            fraction = fraction[has_values]
+            # Interpolate from the nearer end, as numpy does, to avoid rounding errors
+            result[has_values] = np.where(
+                fraction >= 0.5,
+                high_values - difference * (1 - fraction),
+                low_values + difference * fraction,
+            )
+            results.append(result)
+
+        return results
+
+    def compute(self) -> pd.DataFrame:
+        """
+        Compute the features of every speech in the table.
+
+        Returns:
+            pd.DataFrame: One row per speech, with the columns in SPEECH_FEATURE_HEADERS.
+        """
+        ranks, rank_segments, word_counts = self.get_segments(self.ranks)
+        count = len(self.speeches)
+        has_words = word_counts > 0
+
+        rank_sums = np.bincount(rank_segments, weights=ranks, minlength=count)
+        rank_means = np.zeros(count)
+        rank_means[has_words] = rank_sums[has_words] / word_counts[has_words]
+        rank_median, *rank_percentiles = self.get_percentiles(
+            ranks, rank_segments, word_counts, [50, *RANK_PERCENTILES]
+        )
+
+        lemma_ids, lemma_segments, _ = self.get_segments(self.lemma_ids)
+        speech_lemmas = np.unique((lemma_segments << 32) | lemma_ids)
+        lemma_types = np.bincount(speech_lemmas >> 32, minlength=count)
+        lemma_ttr = np.zeros(count)
+        lemma_ttr[has_words] = lemma_types[has_words] / word_counts[has_words]
+
+        return pd.DataFrame(
+            {
+                "speech_id": [speech.speech_id for speech in self.speeches],
+                "year": [speech.speech_year for speech in self.speeches],
+                "person": [speech.author_id for speech in self.speeches],
+                "speech_word_count": word_counts,
+                "word_rank_mean": rank_means,
+                "word_rank_median": rank_median,
+                **{
+                    f"word_rank_p{percentile}": values
+                    for percentile, values in zip(RANK_PERCENTILES, rank_percentiles)
+                },
+                "lemma_types": lemma_types,
+                "lemma_ttr": lemma_ttr,
+                **{
+                    f"mattr_{score}": [speech.lex_score[i] for speech in self.speeches]
+                    for i, score in enumerate(MATTR_WINDOWS)
+                },
+            },
+            columns=SPEECH_FEATURE_HEADERS,
+        )
@@ -0,0 +1,75 @@
+from output_diff import OutputDiff, align_row
+from utils import headers, write_tsv
+import pytest
+
+SF_COLUMNS = headers["sf_main_clause"]
+HS_COLUMNS = headers["hardspeech"]
+
+CONTEXT = ["2015", "2015-01-10", "ræða", "JonJonsson", "M", "1950", "member", "chair", "party.A", "A-flokkur", "majority", "LV.1"]
+FEATURES = ["0.56", "0.56", "0.56", "85.92", "1.0", "25"]
+
+
+def sf_row(speech_id, stylized=True):
+    # Stylized main clause rows have no nfv_freq, and are padded at the end when saved
+    detector = ["1", "Komið hefur fram", "hefur", "komið"] if stylized else ["0", "Það hefur komið fram", "hefur", "komið", "12"]
+    return [*CONTEXT, *detector, *FEATURES, "Komið hefur fram .", "http://www.althingi.is/altext/raeda/2015/1.html", speech_id]
+
+
+def hs_row(speech_id, word_freq="0"):
+    detector = ["Það er happ að", "tapa", "ekki .", "", "p", "tapa", "sng", word_freq]
+    return [*CONTEXT, *detector, *FEATURES, "Það er happ að tapa ekki .", "http://www.althingi.is/altext/raeda/2015/1.html", speech_id]
+
+
+def run_diff(tmp_path, columns, old_rows, new_rows, partition_size=1):
+    write_tsv(tmp_path / "old.tsv", columns, old_rows)
+    write_tsv(tmp_path / "new.tsv", columns, new_rows)
+    temp_dir = tmp_path / "partitions"
+    temp_dir.mkdir()
+    diff = OutputDiff(tmp_path / "old.tsv", tmp_path / "new.tsv", "task", partition_size)
+    diff.run(temp_dir)
+    return diff
+
+
+def test_align_short_row():
+    row = [*sf_row("u1"), ""]
+    aligned = align_row(row, SF_COLUMNS)
+    assert aligned["speech_id"] == "u1"
+    assert aligned["speech_source"] == "http://www.althingi.is/altext/raeda/2015/1.html"
+    assert "nfv_freq" not in aligned
+    assert aligned["speech_word_count"] == "25"
+
+
+def test_short_rows_keyed_by_speech(tmp_path):
+    diff = run_diff(tmp_path, SF_COLUMNS, [sf_row("s1"), sf_row("s2")], [sf_row("s2")])
+    totals = diff.get_totals()
+    assert (totals["removed"], totals["unchanged"], totals["changed"], totals["added"]) == (1, 1, 0, 0)
+    assert not diff.column_changes
+
+
+def test_stylized_change(tmp_path):
+    diff = run_diff(tmp_path, SF_COLUMNS, [sf_row("s1", stylized=False)], [sf_row("s1")])
+    totals = diff.get_totals()
+    assert totals["added"] == totals["removed"] == 1
+
+
+def test_occurrences(tmp_path):
+    old_rows = [hs_row("s1"), hs_row("s1"), hs_row("s2")]
+    new_rows = [hs_row("s1"), hs_row("s1", word_freq="3"), hs_row("s1"), hs_row("s2")]
+    diff = run_diff(tmp_path, HS_COLUMNS, old_rows, new_rows)
+    totals = diff.get_totals()
+    assert (totals["added"], totals["removed"], totals["changed"], totals["unchanged"]) == (1, 0, 1, 2)
+    assert diff.column_changes == {"word_freq": 1}
+    assert list(diff.get_rows()) == [["task", "JonJonsson", "2015", 1, 0, 1, 2]]
+
+
+def test_parquet_matches_tsv(tmp_path):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    rows = [sf_row("s1"), sf_row("s2", stylized=False)]
+    write_tsv(tmp_path / "old.tsv", SF_COLUMNS, rows)
+    pd.read_csv(tmp_path / "old.tsv", sep="\t", float_precision="round_trip").to_parquet(tmp_path / "new.parquet")
+    temp_dir = tmp_path / "partitions"
+    temp_dir.mkdir()
+    diff = OutputDiff(tmp_path / "old.tsv", tmp_path / "new.parquet", "task")
+    diff.run(temp_dir)
+    assert diff.get_totals()["unchanged"] == 2
@@ -0,0 +1,108 @@
+from sampling import SampleEstimator, SpeechSample, assign_strata
+from utils import headers
+import numpy as np
+
+SF_COLUMNS = headers["sf_main_clause"]
+
+YEARS = ["2010", "2011", "2012"]
+PARTIES = ["party.A", "party.B", "party.C", "party.D", ""]
+
+
+def make_corpus(speeches_per_person=6, persons_per_party=4, seed=0):
+    """
+    Make speeches whose hit rates and shares of stylized hits differ by party and person,
+    as (year, person, party_id, speech_id, word_count, hits, flagged) tuples.
+    """
+    rng = np.random.default_rng(seed)
+    speeches = []
+    for year in YEARS:
+        for party_index, party in enumerate(PARTIES):
+            for person_index in range(persons_per_party):
+                person = f"Person{party_index}{person_index}"
+                rate = rng.uniform(20, 120)
+                stylized = rng.uniform(0.1, 0.9)
+                for index in range(speeches_per_person):
+                    word_count = int(rng.integers(50, 2000))
+                    hits = int(rng.poisson(word_count * rate / 1000))
+                    flagged = int(rng.binomial(hits, stylized))
+                    speech_id = f"u{year}.{party_index}.{person_index}.{index}"
+                    speeches.append((year, person, party, speech_id, word_count, hits, flagged))
+    return speeches
+
+
+def make_row(year, person, party, speech_id, is_stylized):
+    row = [""] * len(SF_COLUMNS)
+    row[SF_COLUMNS.index("year")] = year
+    row[SF_COLUMNS.index("person")] = person
+    row[SF_COLUMNS.index("party_id")] = party
+    row[SF_COLUMNS.index("is_stylized")] = str(int(is_stylized))
+    row[-1] = speech_id
+    return row
+
+
+def run_sample(speeches, sample):
+    estimator = SampleEstimator("sf_main_clause", SF_COLUMNS)
+    units = []
+    results = []
+    for year, person, party, speech_id, word_count, hits, flagged in speeches:
+        if not sample.is_sampled(speech_id):
+            units.append((year, person, party, speech_id, None))
+            continue
+        units.append((year, person, party, speech_id, word_count))
+        results.extend(make_row(year, person, party, speech_id, index < flagged) for index in range(hits))
+    estimator.add_units(units)
+    return estimator, results
+
+
+def get_estimates(speeches, sample):
+    estimator, results = run_sample(speeches, sample)
+    return estimator.estimate(results).set_index(["year", "measure"])
+
+
+def test_full_run_is_exact():
+    speeches = make_corpus()
+    estimates = get_estimates(speeches, SpeechSample(1.0))
+    hits = sum(speech[5] for speech in speeches)
+    words = sum(speech[4] for speech in speeches)
+    flagged = sum(speech[6] for speech in speeches)
+    assert np.isclose(estimates.loc[("all", "hits_per_1000_words"), "estimate"], 1000 * hits / words)
+    assert np.isclose(estimates.loc[("all", "proportion_is_stylized"), "estimate"], flagged / hits)
+    assert (estimates["standard_error"] == 0).all()
+
+
+def test_confidence_intervals_cover_full_run():
+    speeches = make_corpus()
+    truth = get_estimates(speeches, SpeechSample(1.0))["estimate"]
+    runs = 100
+    covered = 0
+    for seed in range(runs):
+        estimates = get_estimates(speeches, SpeechSample(0.2, seed))
+        covered += (estimates["ci_low"] <= truth) & (truth <= estimates["ci_high"])
+    # The intervals are 95% ones, but the strata are small, so allow some undercoverage
+    assert (covered / runs >= 0.85).all(), covered / runs
+
+
+def test_weights_sum_to_population():
+    speeches = make_corpus()
+    estimator, results = run_sample(speeches, SpeechSample(0.2, 3))
+    weights = estimator.get_weights()
+    sampled = [speech for speech in speeches if SpeechSample(0.2, 3).is_sampled(speech[3])]
+    assert np.isclose(sum(weights[(speech[0], speech[2])] for speech in sampled), len(speeches))
+    assert all(estimator.get_row_weight(row) for row in results)
+
+
+def test_small_strata_are_collapsed():
+    keys = [("2010", "A")] * 3 + [("2010", "B")] * 2 + [("2010", "C")] * 2 + [("2011", "A")] * 4 + [("2012", "A")] * 2
+    sampled = [True, True, False] + [True, False] + [False, False] + [True, False, False, False] + [True, False]
+    strata = assign_strata(keys, sampled)
+    # B and C are too small on their own, and their remainder has one sampled speech, so 2010 is one stratum
+    assert strata[:7] == [("2010", None)] * 7
+    # 2011 and 2012 have one sampled speech each, so they are collapsed into the rest of the corpus
+    assert strata[7:] == [(None, None)] * 6
+
+    # If the rest of the corpus is still too small, the whole corpus is one stratum
+    assert assign_strata(keys[:11], sampled[:11]) == [(None, None)] * 11
+
+    sampled = [True, True, False] + [True, False] + [True, False] + [True, True, False, False] + [True, True]
+    strata = assign_strata(keys, sampled)
+    assert strata == [("2010", "A")] * 3 + [("2010", None)] * 4 + [("2011", "A")] * 4 + [("2012", "A")] * 2
@@ -0,0 +1,304 @@
+from utils import TEI_NS, METADATA_FILE, TOKEN_CACHE_MANIFEST, Token, Sentence
+from corpus_reader import CorpusReader
+from functools import cached_property
+from tqdm import tqdm
+from pathlib import Path
+import xml.etree.ElementTree as ET
+import numpy as np
+import json
+
+CACHE_VERSION = 1
+
+# Columns of the cache, one value per token, and their types
+TOKEN_COLUMNS = {
+    "word": np.int32,
+    "lemma": np.int32,
+    "tag": np.int32,
+    "token": np.int32,
+    "join": np.uint8,
+}
+
+# Attributes of the <u> elements that are kept in the speech table
+SPEECH_ATTRIBUTES = ["who", "{http://www.w3.org/XML/1998/namespace}id", "source", "ana"]
+
+
+def build_token_cache(corpus_reader: CorpusReader, cache_dir: Path):
+    """
+    Convert TEI files to a token cache that FileHandler can read instead of the XML.
+
+    The cache stores one memory-mapped column per token attribute: vocabulary ids for
+    the word, lemma and tag, the id of the (word, lemma, tag) combination and the join
+    flag. Sentence and speech boundaries are stored as offsets, and the attributes of
+    each speech in a speech table. The metadata file is copied to the cache, so the
+    cache can be used in place of the corpus directory.
+
+    Args:
+        corpus_reader: CorpusReader of the corpus. File paths in the cache are relative to its root.
+        cache_dir: Directory to write the cache to.
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    xml_files = corpus_reader.get_files()
+    corpus_dir = corpus_reader.get_root()
+
+    vocabulary = {}
+    token_types = {}
+    files = []
+    speech_count = 0
+    sentence_count = 0
+    token_count = 0
+
+    columns = {name: open(cache_dir / f"{name}.bin", "wb") for name in TOKEN_COLUMNS}
+    sentence_offsets = open(cache_dir / "sentences.bin", "wb")
+    speech_offsets = open(cache_dir / "speeches.bin", "wb")
+    speech_table = open(cache_dir / "speeches.jsonl", "w", encoding="utf-8")
+
+    try:
+        sources = corpus_reader.prefetch(xml_files)
+        for teifile, source in tqdm(zip(xml_files, sources), total=len(xml_files), desc="Building token cache"):
+            root = ET.parse(source).getroot()
+            dates = root.findall(".//tei:bibl/tei:date", TEI_NS)
+            first_speech = speech_count
+            values = {name: [] for name in TOKEN_COLUMNS}
+            sentence_starts = []
+            speech_starts = []
+
+            for teispeech in root.findall(".//tei:u", TEI_NS):
+                attributes = {
+                    name: teispeech.attrib[name]
+                    for name in SPEECH_ATTRIBUTES
+                    if name in teispeech.attrib
+                }
+                speech_table.write(json.dumps(attributes, ensure_ascii=False) + "\n")
+                speech_starts.append(sentence_count)
+                speech_count += 1
+
+                for asentence in teispeech.findall(".//tei:s", TEI_NS):
+                    sentence_starts.append(token_count)
+                    sentence_count += 1
+
+                    for aword in asentence.iter():
+                        element_tag = aword.tag.split("}")[-1]
+                        if element_tag not in ("w", "pc"):
+                            continue
+                        lemma = aword.get("lemma") if element_tag == "w" else "NONE"
+                        ids = tuple(
+                            vocabulary.setdefault(value, len(vocabulary))
+                            for value in (aword.text, lemma, aword.get("pos"))
+                        )
+                        values["word"].append(ids[0])
+                        values["lemma"].append(ids[1])
+                        values["tag"].append(ids[2])
+                        values["token"].append(token_types.setdefault(ids, len(token_types)))
+                        values["join"].append(bool(aword.get("join")))
+                        token_count += 1
+
+            for name, dtype in TOKEN_COLUMNS.items():
+                columns[name].write(np.array(values[name], dtype=dtype).tobytes())
+            sentence_offsets.write(np.array(sentence_starts, dtype=np.int64).tobytes())
+            speech_offsets.write(np.array(speech_starts, dtype=np.int64).tobytes())
+
+            files.append(
+                {
+                    "path": teifile.relative_to(corpus_dir).as_posix(),
+                    "date": dates[0].text if dates else None,
+                    "speeches": [first_speech, speech_count],
+                }
+            )
+
+        # The offsets end with the total counts, so item i + 1 is where item i ends
+        sentence_offsets.write(np.array([token_count], dtype=np.int64).tobytes())
+        speech_offsets.write(np.array([sentence_count], dtype=np.int64).tobytes())
+    finally:
+        for column in columns.values():
+            column.close()
+        sentence_offsets.close()
+        speech_offsets.close()
+        speech_table.close()
+
+    np.array(list(token_types), dtype=np.int32).reshape(-1, 3).tofile(cache_dir / "token_types.bin")
+    with open(cache_dir / "vocabulary.json", "w", encoding="utf-8") as vocabulary_file:
+        json.dump(list(vocabulary), vocabulary_file, ensure_ascii=False)
+
+    metadata_file = corpus_reader.find(METADATA_FILE)
+    if metadata_file:
+        (cache_dir / METADATA_FILE).write_bytes(corpus_reader.read(metadata_file).getvalue())
+
+    manifest = {
+        "version": CACHE_VERSION,
+        "files": files,
+        "speeches": speech_count,
+        "sentences": sentence_count,
+        "tokens": token_count,
+    }
+    with open(cache_dir / TOKEN_CACHE_MANIFEST, "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, ensure_ascii=False, indent=4)
+
+    print(f"Cached {token_count} tokens in {speech_count} speeches from {len(files)} files to", cache_dir)
+
+
+def read_column(path: Path, dtype):
+    """
+    Memory-map a column of the cache.
+
+    Args:
+        path: Path to the column file.
+        dtype: Type of the values.
+
+    Returns:
+        np.ndarray: The read-only column.
+    """
+    if path.stat().st_size == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+class TokenCache:
+    """
+    Read a token cache made by build_token_cache. The columns are memory-mapped, so
+    only the parts of the corpus that are processed are read from disk.
+
+    Args:
+        cache_dir: Directory of the cache.
+    """
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = cache_dir
+        with open(cache_dir / TOKEN_CACHE_MANIFEST, "r", encoding="utf-8") as manifest_file:
+            self.manifest = json.load(manifest_file)
+        if self.manifest["version"] != CACHE_VERSION:
+            raise ValueError(
+                f"The token cache in {cache_dir} has version {self.manifest['version']}, "
+                f"expected {CACHE_VERSION}. Build it again."
+            )
+
+        self.columns = {
+            name: read_column(cache_dir / f"{name}.bin", dtype)
+            for name, dtype in TOKEN_COLUMNS.items()
+        }
+        self.token_types = read_column(cache_dir / "token_types.bin", np.int32).reshape(-1, 3)
+        self.sentence_offsets = read_column(cache_dir / "sentences.bin", np.int64)
+        self.speech_offsets = read_column(cache_dir / "speeches.bin", np.int64)
+        self.files = {file["path"]: file for file in self.manifest["files"]}
+        self.tokens = [None] * len(self.token_types)
+
+    def __getstate__(self):
+        # Worker processes map the columns again instead of copying them
+        return self.cache_dir
+
+    def __setstate__(self, cache_dir):
+        self.__init__(cache_dir)
+
+    @cached_property
+    def vocabulary(self):
+        with open(self.cache_dir / "vocabulary.json", "r", encoding="utf-8") as vocabulary_file:
+            return json.load(vocabulary_file)
+
+    @cached_property
+    def speech_attributes(self):
+        with open(self.cache_dir / "speeches.jsonl", "r", encoding="utf-8") as speech_table:
+            return [json.loads(line) for line in speech_table]
+
+    def get_paths(self):
+        """
+        Get the paths of the cached files, as if the cache directory were the corpus directory.
+
+        Returns:
+            list[Path]: Paths of the cached files, in the order they were cached.
+        """
+        return [self.cache_dir / file["path"] for file in self.manifest["files"]]
+
+    def get_file(self, path: Path):
+        """
+        Get a cached file.
+
+        Args:
+            path: Path of the file, as returned by get_paths.
+
+        Returns:
+            CachedFile: The cached file.
+        """
+        file = self.files[path.relative_to(self.cache_dir).as_posix()]
+        first, last = file["speeches"]
+        speeches = [CachedSpeech(self, index) for index in range(first, last)]
+        return CachedFile(path, file["date"], speeches)
+
+    def get_token(self, token_id):
+        """
+        Get the shared Token for a token id.
+
+        Args:
+            token_id: Id of the (word, lemma, tag) combination.
+
+        Returns:
+            Token: The token.
+        """
+        token = self.tokens[token_id]
+        if token is None:
+            word, lemma, tag = (self.vocabulary[value] for value in self.token_types[token_id])
+            token = self.tokens[token_id] = Token.get(word, lemma, tag)
+        return token
+
+    def get_sentences(self, speech_index):
+        """
+        Read the sentences of a speech.
+
+        Args:
+            speech_index: Index of the speech in the cache.
+
+        Returns:
+            list[Sentence]: The sentences of the speech.
+        """
+        first, last = self.speech_offsets[speech_index : speech_index + 2]
+        offsets = self.sentence_offsets[first : last + 1].tolist()
+        if not offsets:
+            return []
+
+        start, end = offsets[0], offsets[-1]
+        tokens = [self.tokens[token_id] or self.get_token(token_id) for token_id in self.columns["token"][start:end].tolist()]
+        joins = self.columns["join"][start:end].tobytes()
+
+        return [
+            Sentence(tuple(tokens[first - start : last - start]), joins[first - start : last - start])
+            for first, last in zip(offsets, offsets[1:])
+        ]
+
+
+class CachedFile:
+    """
+    A TEI file read from a token cache.
+
+    Args:
+        path: Path of the file in the cache.
+        date: Date of the file in "YYYY-MM-DD" format.
+        speeches: List of CachedSpeech objects in the file.
+    """
+
+    def __init__(self, path: Path, date, speeches: list):
+        self.path = path
+        self.date = date
+        self.speeches = speeches
+
+
+class CachedSpeech:
+    """
+    A speech read from a token cache. It has the same attributes as the <u> element
+    it was read from, and gives its sentences to Speech directly.
+
+    Args:
+        cache: The TokenCache the speech is in.
+        index: Index of the speech in the cache.
+    """
+
+    def __init__(self, cache: TokenCache, index):
+        self.cache = cache
+        self.index = index
+        self.attrib = cache.speech_attributes[index]
+
+    def get_sentences(self):
+        """
+        Read the sentences of the speech.
+
+        Returns:
+            list[Sentence]: The sentences of the speech.
+        """
+        return self.cache.get_sentences(self.index)
@@ -1,16 +1,95 @@
+from concurrent.futures import ThreadPoolExecutor
 from collections import namedtuple
 from xml.etree.ElementTree import Element
 from datetime import datetime
 from dataclasses import dataclass, field
+from operator import itemgetter
 from pathlib import Path
 from typing import Optional
+import threading
+import time
+import csv
+import sys
+
+
+class Token(tuple):
+    """
+    A word or punctuation token with its lemma and tag.
+
+    Tokens should be created with Token.get, which returns one shared object for every
+    occurrence of the same (word, lemma, tag) and interns the strings, so repeated word
+    forms, lemmas and tags are only stored once.
+    """
+
+    __slots__ = ()
+
+    _vocabulary = {}
+
+    def __new__(cls, word, lemma, tag):
+        return tuple.__new__(cls, (word, lemma, tag))
+
+    def __getnewargs__(self):
+        return tuple(self)
+
+    def __repr__(self):
+        return f"Token(word={self.word!r}, lemma={self.lemma!r}, tag={self.tag!r})"
+
+    word = property(itemgetter(0))
+    lemma = property(itemgetter(1))
+    tag = property(itemgetter(2))
+
+    @classmethod
+    def get(cls, word, lemma, tag):
+        """
+        Get the shared token for a word, lemma and tag.
+
+        Args:
+            word: The word form.
+            lemma: The lemma of the word.
+            tag: The part of speech tag.
+
+        Returns:
+            Token: The shared token.
+        """
+        token = cls._vocabulary.get((word, lemma, tag))
+        if token is None:
+            token = cls(*[sys.intern(value) if value else value for value in (word, lemma, tag)])
+            token = cls._vocabulary.setdefault(token, token)
+        return token
+
+
+class Sentence:
+    """
+    The tokens of a sentence and whether each token is joined to the next one
+    without a space.
+
+    Args:
+        tokens: Tuple of Token objects.
+        joins: Bytes with one flag per token, 1 if the token is joined to the next one.
+    """
+
+    __slots__ = ("tokens", "joins")
+
+    def __init__(self, tokens: tuple, joins: bytes):
+        self.tokens = tokens
+        self.joins = joins
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __iter__(self):
+        return iter(self.tokens)
+
+    def __getitem__(self, index):
+        return self.tokens[index]
+
 
-Token = namedtuple("Token", ["word", "lemma", "tag"])
 Affiliation = namedtuple("Affiliation", ["party", "role", "coalition", "gov"])
 
 EXTRACTION_DATA_PATH = Path("./extraction_data")
 
 METADATA_FILE = "IGC-Parla-22.10.ana.xml"
+TOKEN_CACHE_MANIFEST = "manifest.json"
 SPEECH_TYPES_FILE = EXTRACTION_DATA_PATH / "speech_types.tsv"
 PHONE_DICT = EXTRACTION_DATA_PATH / "ice_pron_dict_north_clear.tsv"
 FREQ_DICT = EXTRACTION_DATA_PATH / "giga_simple_freq_2.json"
@@ -18,11 +97,30 @@ FREQ_DICT = EXTRACTION_DATA_PATH / "giga_simple_freq_2.json"
 VERBS = {"vera": "be", "hafa": "have", "munu": "mod", "skulu": "mod"}
 TAGS = ("sþ", "ss", "sn")
 TASK_TYPES = ["sf_main_clause", "sf_sub_clause", "hardspeech"]
+SPEAKER_TYPES = ("chair", "guest", "regular")
 HS_PATTERN = r".*[^cfhkpstvglmnr0CDNGT] ([ptkc])_h.*"
 HS_VOICED_PATTERN = r".*[lmnr]_0 ([ptkc])[^_].*"
 WINDOW = 200
 MATTR_WINDOWS = [100, 300, 500]
 
+# Metadata entries each task type needs. Other entries are never loaded.
+SF_METADATA = ["mp_dict", "parties", "relations", "speech_types", "freq_dict"]
+TASK_METADATA = {
+    "sf_main_clause": SF_METADATA,
+    "sf_sub_clause": SF_METADATA,
+    "hardspeech": [*SF_METADATA, "phone_dict"],
+}
+
+# The file each metadata entry is read from. Entries of the same file are loaded together.
+METADATA_SOURCES = {
+    "mp_dict": "metadata XML",
+    "parties": "metadata XML",
+    "relations": "metadata XML",
+    "speech_types": "speech types",
+    "phone_dict": "phonetic dictionary",
+    "freq_dict": "frequency list",
+}
+
 # XML namespace
 TEI_NS = {"tei": "http://www.tei-c.org/ns/1.0"}
 XML_NS = "{http://www.w3.org/XML/1998/namespace}"
@@ -101,6 +199,13 @@ class SaveConfig:
     timespans: list[Optional[int]] = field(default_factory=list)
     person: str = ''
     max_year: int = 2024
+    party_ids: list[str] = field(default_factory=list)
+    sexes: list[str] = field(default_factory=list)
+    roles: list[str] = field(default_factory=list)
+    speaker_types: list[str] = field(default_factory=list)
+    speech_types: list[str] = field(default_factory=list)
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
 
     def __post_init__(self):
         if self.timespans:
@@ -113,14 +218,175 @@ class SaveConfig:
             
             if self.person:
                 self.save_path = self.save_path / self.person
+
+        unknown = set(self.speaker_types) - set(SPEAKER_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown speaker types {sorted(unknown)}. Choose from {SPEAKER_TYPES}.")
+        for date in (self.start_date, self.end_date):
+            if date:
+                datetime.strptime(date, DATE_FORMAT)
     
     def __str__(self):
         text = ""
         if self.person:
             text = self.person
-        else:
+        elif self.years:
             text = f"{min(self.years)}-{max(self.years)}"
-        return f"Config<{text}>"
+        filters = [
+            f"{name}={','.join(values)}"
+            for name, values in [
+                ("party_ids", self.party_ids),
+                ("sexes", self.sexes),
+                ("roles", self.roles),
+                ("speaker_types", self.speaker_types),
+                ("speech_types", self.speech_types),
+            ]
+            if values
+        ]
+        if self.start_date or self.end_date:
+            filters.append(f"dates={self.start_date or ''}..{self.end_date or ''}")
+        return f"Config<{' '.join([text, *filters]).strip() or 'all'}>"
+
+    def filters_years(self):
+        """
+        Checks if the config only includes some years.
+
+        Returns:
+            bool: True if files can be skipped by their year.
+        """
+        return bool(self.years or self.start_date or self.end_date)
+
+    def includes_year(self, year: int):
+        """
+        Checks if a year is included by the years, timespans and date range.
+
+        Args:
+            year (int): The year.
+
+        Returns:
+            bool: True if the year is included.
+        """
+        if self.years and year not in self.years:
+            return False
+        if self.start_date and year < int(self.start_date[:4]):
+            return False
+        if self.end_date and year > int(self.end_date[:4]):
+            return False
+        return True
+
+    def includes_date(self, date: str):
+        """
+        Checks if the date of a file is included.
+
+        Args:
+            date (str): Date in "YYYY-MM-DD" format.
+
+        Returns:
+            bool: True if the date is included.
+        """
+        if not self.includes_year(int(date.split("-")[0])):
+            return False
+        return (not self.start_date or date >= self.start_date) and (not self.end_date or date <= self.end_date)
+
+    def includes_speaker(self, person: str, sex: str):
+        """
+        Checks if a speaker is included, from the person metadata alone.
+
+        Args:
+            person (str): The speaker's id.
+            sex (str): The speaker's sex, e.g. 'F'.
+
+        Returns:
+            bool: True if the speaker is included.
+        """
+        if self.person and person != self.person:
+            return False
+        return not self.sexes or sex in self.sexes
+
+    def includes_affiliation(self, affiliation: Affiliation):
+        """
+        Checks if a speaker's affiliation on the date of a file is included.
+
+        Args:
+            affiliation (Affiliation): The affiliation.
+
+        Returns:
+            bool: True if the party and role are included.
+        """
+        if self.party_ids and affiliation.party not in self.party_ids:
+            return False
+        return not self.roles or affiliation.role in self.roles
+
+    def includes_speech(self, speaker_type: str, speech_type: str):
+        """
+        Checks if a speech is included, from the attributes of its <u> element.
+
+        Args:
+            speaker_type (str): The speaker type, e.g. 'chair'.
+            speech_type (str): The speech type, e.g. 'ræða'.
+
+        Returns:
+            bool: True if the speech is included.
+        """
+        if self.speaker_types and speaker_type not in self.speaker_types:
+            return False
+        return not self.speech_types or speech_type in self.speech_types
+
+
+class LazyMetadata(dict):
+    """
+    A metadata dictionary that loads each entry the first time it is accessed.
+    Each entry is loaded under its own lock, so threads sharing it load each entry
+    once, and different entries can be loaded at the same time.
+
+    Args:
+        loaders: Dictionary mapping metadata keys to functions that load them.
+    """
+
+    def __init__(self, loaders: dict):
+        super().__init__()
+        self.loaders = loaders
+        self.lock = threading.Lock()
+        self.key_locks = {}
+
+    def __missing__(self, key):
+        if key not in self.loaders:
+            raise KeyError(key)
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self:
+                self[key] = self.loaders[key]()
+        return dict.__getitem__(self, key)
+
+    def load(self, keys):
+        """
+        Load the given entries, if they are not already loaded.
+
+        Args:
+            keys: List of metadata keys.
+        """
+        for key in keys:
+            self[key]
+
+    def load_concurrently(self, sources: dict):
+        """
+        Load groups of entries in a thread pool, one thread per group, so reading and
+        parsing different files overlaps.
+
+        Args:
+            sources: Dictionary mapping source names to lists of metadata keys.
+
+        Returns:
+            dict: The time in seconds each source took to load.
+        """
+        def load_source(keys):
+            start = time.perf_counter()
+            self.load(keys)
+            return time.perf_counter() - start
+
+        with ThreadPoolExecutor(max(1, len(sources))) as pool:
+            return dict(zip(sources, pool.map(load_source, sources.values())))
 
 
 def is_in_timespan(element: Element, date: datetime):
@@ -146,3 +412,91 @@ def is_in_timespan(element: Element, date: datetime):
     if date_from <= date <= date_to:
         return True
     return False
+
+
+def file_year(teifile: Path):
+    """
+    Gets the year of a TEI file from the name of its directory, e.g. '2013'.
+
+    Args:
+        teifile (Path): Path to the TEI file.
+
+    Returns:
+        str: The year, or the directory name if the file is not in a year directory.
+    """
+    return teifile.parent.stem
+
+
+def is_token_cache(path: Path):
+    """
+    Checks if a path is a token cache directory made with the 'cache' command.
+
+    Args:
+        path (Path): Path to check.
+
+    Returns:
+        bool: True if the path is a token cache.
+    """
+    return (path / TOKEN_CACHE_MANIFEST).exists()
+
+
+def get_tsv_writer(file):
+    """
+    Creates a csv writer that writes TSV rows the way pandas.DataFrame.to_csv does.
+
+    Args:
+        file: A text file opened with newline="".
+
+    Returns:
+        A csv writer.
+    """
+    return csv.writer(file, delimiter="\t", lineterminator="\n")
+
+
+def write_tsv(path: Path, header: list, rows):
+    """
+    Writes rows to a TSV file. Each value is written on its own, so the output does not
+    depend on the other rows, and rows shorter than the header are padded with empty values.
+
+    Args:
+        path (Path): Path of the TSV file.
+        header (list): The column names.
+        rows: Iterable of rows, each a list of values.
+    """
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = get_tsv_writer(file)
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow(pad_row(row, len(header)))
+
+
+def simple_tag(tag: str):
+    """
+    Simplifies a tag to the word class the frequency lists are keyed by, the first
+    two letters for nouns (e.g. 'nk') and the first letter otherwise (e.g. 's').
+
+    Args:
+        tag (str): The full tag, e.g. 'nkeo'.
+
+    Returns:
+        str: The simplified tag.
+    """
+    if tag.startswith("n"):
+        return tag[:2]
+    return tag[0]
+
+
+def pad_row(row: list, length: int):
+    """
+    Pads a row with None values up to the given length.
+
+    Args:
+        row (list): The row.
+        length (int): The number of columns.
+
+    Returns:
+        list: The padded row.
+    """
+    if len(row) < length:
+        return [*row, *[None] * (length - len(row))]
+    return row
@@ -0,0 +1,2 @@
+# test_chat_api.py is a manual script that calls the OpenAI API when it is imported
+collect_ignore = ["test_chat_api.py"]
@@ -1,9 +1,11 @@
 #!/Users/atlisa/Library/Caches/pypoetry/virtualenvs/eilisch-_JKlGsFC-py3.12/bin/python
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from numbers_parser import Document
 from pathlib import Path
 import pandas as pd
 import argparse
 import warnings
+import os
 
 # Define the columns that should be converted to integers
 # This is because in the conversion process the int columns are sometimes read as floats
@@ -22,53 +24,110 @@ def get_numbers_data(filename: str) -> pd.DataFrame:
     doc = Document(filename)
     sheet = doc.sheets[0]
     table = sheet.tables[0]
-    data = table.rows(values_only=True)
+    rows = table.iter_rows(values_only=True)
 
-    df = pd.DataFrame(data[1:], columns=data[0])
-    for col in int_columns:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')
+    # Fill one list per column while reading the rows, instead of keeping every row
+    header = list(next(rows, []))
+    columns = [[] for _ in header]
+    for row in rows:
+        for column, value in zip(columns, row):
+            column.append(value)
 
-    return df
+    data = {}
+    for name, values in zip(header, columns):
+        if name in int_columns:
+            data[name] = pd.to_numeric(pd.Series(values), errors='coerce').astype('Int64')
+        else:
+            data[name] = pd.Series(values)
 
+    return pd.DataFrame(data, columns=header)
 
-parser = argparse.ArgumentParser()
 
-parser.add_argument(
-    "input",
-    nargs="+",
-    help="One or more .numbers files, or a single directory containing .numbers files"
-)
-parser.add_argument(
-    "--output",
-    type=str,
-    default="tsv_files",
-    help="Output directory for TSV files (default: 'tsv_files' in cwd)"
-)
-args = parser.parse_args()
+def is_up_to_date(numbers_file: Path, tsv_filename: Path) -> bool:
+    return tsv_filename.exists() and tsv_filename.stat().st_mtime >= numbers_file.stat().st_mtime
 
-if __name__ == "__main__":
 
-    input_files = args.input
-    output_dir = Path(args.output)
-    output_dir.mkdir(parents=True, exist_ok=True)
+def convert(numbers_file: Path, tsv_filename: Path) -> str:
+    # Suppress RuntimeWarning from numbers_parser
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        df = get_numbers_data(numbers_file.resolve())
+
+    df.to_csv(tsv_filename, sep="\t", index=False)
+    return f"Converted {numbers_file} to {tsv_filename}"
 
-    for input_file in input_files:
+
+def get_numbers_files(inputs: list[str]) -> list[Path]:
+    numbers_files = []
+    for input_file in inputs:
         input_path = Path(input_file)
         if input_path.is_dir():
-            numbers_files = list(input_path.glob("*.numbers"))
+            numbers_files.extend(sorted(input_path.glob("*.numbers")))
         elif input_path.suffix == ".numbers":
-            numbers_files = [input_path]
+            numbers_files.append(input_path)
         else:
             print(f"Skipping {input_file}: not a .numbers file or directory.")
+    return numbers_files
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "input",
+        nargs="+",
+        help="One or more .numbers files, or a single directory containing .numbers files"
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="tsv_files",
+        help="Output directory for TSV files (default: 'tsv_files' in cwd)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of files to convert in parallel (default: number of CPUs)"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Convert all files, also those whose TSV file is newer than the .numbers file"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    jobs = []
+    for numbers_file in get_numbers_files(args.input):
+        tsv_filename = output_dir / (numbers_file.stem + ".tsv")
+        if not args.force and is_up_to_date(numbers_file, tsv_filename):
+            print(f"Skipping {numbers_file}: {tsv_filename} is up to date.")
             continue
+        jobs.append((numbers_file, tsv_filename))
+
+    if args.workers <= 1 or len(jobs) <= 1:
+        for numbers_file, tsv_filename in jobs:
+            try:
+                print(convert(numbers_file, tsv_filename))
+            except Exception as error:
+                print(f"Could not convert {numbers_file}: {error}")
+        return
 
-        for numbers_file in numbers_files:
-            # Suppress RuntimeWarning from numbers_parser
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                df = get_numbers_data(numbers_file.resolve())
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(convert, *job): job[0] for job in jobs}
+        for future in as_completed(futures):
+            try:
+                print(future.result())
+            except Exception as error:
+                print(f"Could not convert {futures[future]}: {error}")
 
-            tsv_filename = output_dir / (numbers_file.stem + ".tsv")
-            df.to_csv(tsv_filename, sep="\t", index=False)
-            print(f"Converted {numbers_file} to {tsv_filename}")
\ No newline at end of file
+
+if __name__ == "__main__":
+    main()
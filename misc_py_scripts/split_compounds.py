@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+
+# Splits the compound words of the corpus vocabulary with a chat completions API.
+# Every word form is only sent once: splits are kept in an SQLite cache, and a run
+# only sends the words that are not in it, in concurrent batches with retries.
+from dotenv import load_dotenv
+from pathlib import Path
+from tqdm import tqdm
+import xml.etree.ElementTree as ET
+import argparse
+import asyncio
+import aiohttp
+import sqlite3
+import random
+import os
+
+BASE_URL = "https://api.openai.com/v1"
+MODEL = "gpt-4o-mini"
+
+PROMPT = (
+    "Split the following Icelandic words that are made up of two or more words. "
+    "Use a hyphen '-' between each split, and write words that are not compounds unchanged. "
+    "Do not add any explanation or numbering. Just output the splits in a new line for each word, "
+    "in the same order:\n\n"
+)
+
+# HTTP statuses worth retrying: rate limits and server errors
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class SplitCache:
+    """
+    A persistent cache of compound splits in SQLite, keyed by word form and model.
+    Words whose response was rejected are stored with a NULL split, so they are not sent again.
+
+    Args:
+        db_path: Path of the SQLite database. It is created if it does not exist.
+        model: The model the splits are made with.
+    """
+
+    def __init__(self, db_path: Path, model):
+        self.model = model
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS splits (word TEXT, model TEXT, split TEXT, PRIMARY KEY (word, model))"
+        )
+        self.connection.commit()
+
+    def get_many(self, words: list[str]):
+        """
+        Get the cached splits of words.
+
+        Args:
+            words: The word forms.
+
+        Returns:
+            dict: Maps the cached words to their splits, None for rejected words.
+        """
+        splits = {}
+        for start in range(0, len(words), 500):
+            chunk = words[start : start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = self.connection.execute(
+                f"SELECT word, split FROM splits WHERE model = ? AND word IN ({placeholders})",
+                [self.model, *chunk],
+            )
+            splits.update(rows)
+        return splits
+
+    def put_many(self, splits: dict):
+        """
+        Store splits, replacing earlier ones of the same words.
+
+        Args:
+            splits: Maps word forms to their splits, None for rejected words.
+        """
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO splits VALUES (?, ?, ?)",
+            [(word, self.model, split) for word, split in splits.items()],
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+def read_words(path: Path):
+    """
+    Read the word forms of a corpus file: the <w> elements of TEI XML files, or one
+    word per line of other files.
+
+    Args:
+        path: Path of the file.
+
+    Yields:
+        str: The word forms, with repeats.
+    """
+    if path.name.endswith(".xml"):
+        for _, element in ET.iterparse(path):
+            if element.tag.split("}")[-1] == "w" and element.text:
+                yield element.text.strip()
+            element.clear()
+    else:
+        with open(path, "r", encoding="utf-8") as word_file:
+            for line in word_file:
+                yield line.strip()
+
+
+def get_vocabulary(paths: list[Path], min_length=1):
+    """
+    Get the distinct word forms of the corpus that can be compounds.
+
+    Args:
+        paths: Paths of XML files, word lists or directories of XML files.
+        min_length: Only keep words of at least this many letters.
+
+    Returns:
+        list[str]: The distinct alphabetic word forms, sorted.
+    """
+    files = []
+    for path in paths:
+        files.extend(sorted(path.rglob("*.xml")) if path.is_dir() else [path])
+
+    vocabulary = set()
+    for file in tqdm(files, desc="Reading words"):
+        vocabulary.update(word for word in read_words(file) if len(word) >= min_length and word.isalpha())
+    return sorted(vocabulary)
+
+
+def make_batches(words: list[str], batch_size, max_chars):
+    """
+    Group words into batches of at most batch_size words and max_chars characters.
+
+    Args:
+        words: The words.
+        batch_size: Maximum number of words per batch.
+        max_chars: Maximum number of characters of the words of a batch.
+
+    Returns:
+        list[list[str]]: The batches.
+    """
+    batches = []
+    batch = []
+    chars = 0
+    for word in words:
+        if batch and (len(batch) >= batch_size or chars + len(word) + 1 > max_chars):
+            batches.append(batch)
+            batch = []
+            chars = 0
+        batch.append(word)
+        chars += len(word) + 1
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def parse_splits(batch: list[str], content: str):
+    """
+    Match the lines of a response to the words of its batch. A line is only accepted
+    as the split of a word if it is the word with hyphens added. Other lines, e.g. with
+    the casing changed or a letter added, are rejected.
+
+    Args:
+        batch: The words that were sent.
+        content: The text of the response.
+
+    Returns:
+        dict: Maps the words to their splits, None for words whose line was rejected.
+
+    Raises:
+        ValueError: If the response does not have one line per word.
+    """
+    lines = [line.strip() for line in content.strip().splitlines() if line.strip()]
+    if len(lines) != len(batch):
+        raise ValueError(f"Expected {len(batch)} lines, got {len(lines)}")
+    return {word: line if line.replace("-", "") == word else None for word, line in zip(batch, lines)}
+
+
+class CompoundSplitter:
+    """
+    Send batches of words to a chat completions endpoint, a few at a time, retrying
+    failed requests with exponential backoff.
+
+    Args:
+        session: The aiohttp session.
+        base_url: Base URL of the API, e.g. https://api.openai.com/v1 or a local server.
+        api_key: The API key.
+        model: The model to use.
+        concurrency: Maximum number of requests in flight.
+        retries: Number of times a failed batch is tried again.
+        timeout: Timeout of each request in seconds.
+    """
+
+    def __init__(self, session, base_url, api_key, model=MODEL, concurrency=4, retries=5, timeout=120):
+        self.session = session
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.model = model
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.retries = retries
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+
+    async def request(self, batch: list[str]):
+        """
+        Send one request for a batch.
+
+        Args:
+            batch: The words.
+
+        Returns:
+            dict: Maps the words to their splits, see parse_splits.
+        """
+        payload = {
+            "model": self.model,
+            "temperature": 0,
+            "messages": [
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": PROMPT + "\n".join(batch)},
+            ],
+        }
+        async with self.session.post(self.url, json=payload, headers=self.headers, timeout=self.timeout) as response:
+            if response.status in RETRY_STATUSES:
+                raise aiohttp.ClientResponseError(
+                    response.request_info, response.history, status=response.status, message=response.reason
+                )
+            response.raise_for_status()
+            completion = await response.json()
+        return parse_splits(batch, completion["choices"][0]["message"]["content"])
+
+    async def split(self, batch: list[str]):
+        """
+        Split a batch of words, retrying with exponential backoff. Client errors other
+        than rate limits are not retried.
+
+        Args:
+            batch: The words.
+
+        Returns:
+            dict: Maps the words to their splits, see parse_splits, or None if the batch failed.
+        """
+        async with self.semaphore:
+            for attempt in range(self.retries + 1):
+                try:
+                    return await self.request(batch)
+                except aiohttp.ClientResponseError as error:
+                    if error.status not in RETRY_STATUSES or attempt == self.retries:
+                        tqdm.write(f"Batch starting with '{batch[0]}' failed: {error.status} {error.message}")
+                        return None
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as error:
+                    if attempt == self.retries:
+                        tqdm.write(f"Batch starting with '{batch[0]}' failed: {error!r}")
+                        return None
+                await asyncio.sleep(min(60, 2**attempt) * (0.5 + random.random()))
+
+
+async def split_words(words: list[str], cache: SplitCache, args):
+    """
+    Split the words that are not in the cache, storing each batch as it is done, so
+    an interrupted run can be resumed. Words whose line was rejected are stored as
+    rejected, and only sent again with --retry-rejected.
+
+    Args:
+        words: The distinct word forms.
+        cache: The SplitCache.
+        args: The command line arguments.
+
+    Returns:
+        tuple: The number of words sent, the number of them that were split and the
+            number that were rejected.
+    """
+    cached = cache.get_many(words)
+    unseen = [word for word in words if word not in cached or (args.retry_rejected and cached[word] is None)]
+    batches = make_batches(unseen, args.batch_size, args.max_chars)
+    print(f"{len(words) - len(unseen)} of {len(words)} words cached, sending {len(unseen)} in {len(batches)} batches")
+
+    stored = rejected = 0
+    async with aiohttp.ClientSession() as session:
+        splitter = CompoundSplitter(
+            session, args.base_url, os.getenv("OPENAI_API_KEY"), args.model, args.concurrency, args.retries, args.timeout
+        )
+        tasks = [asyncio.create_task(splitter.split(batch)) for batch in batches]
+        for task in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Splitting words"):
+            splits = await task
+            if splits:
+                cache.put_many(splits)
+                rejected += sum(split is None for split in splits.values())
+                stored += sum(split is not None for split in splits.values())
+    return len(unseen), stored, rejected
+
+
+def save_splits(out_file: Path, words: list[str], cache: SplitCache):
+    """
+    Save the cached splits of the words as a TSV file of words and splits.
+
+    Args:
+        out_file: Path of the TSV file.
+        words: The words.
+        cache: The SplitCache.
+    """
+    splits = cache.get_many(words)
+    with open(out_file, "w", encoding="utf-8") as tsv_out:
+        tsv_out.write("word\tsplit\n")
+        for word in words:
+            if splits.get(word) is not None:
+                tsv_out.write(f"{word}\t{splits[word]}\n")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Split the compound words of the corpus with a chat completions API.")
+    parser.add_argument(
+        "inputs", type=Path, nargs="+", help="Corpus directories or TEI XML files to read the <w> words of, or word lists with one word per line."
+    )
+    parser.add_argument("--cache", type=Path, default=Path("compound_splits.db"), help="SQLite database of the splits. Defaults to compound_splits.db.")
+    parser.add_argument("--out-file", type=Path, default=None, help="Optional TSV file to save the splits of all the words to.")
+    parser.add_argument("--base-url", default=BASE_URL, help=f"Base URL of the API, e.g. a local server. Defaults to {BASE_URL}.")
+    parser.add_argument("--model", default=MODEL, help=f"Model to use. Defaults to {MODEL}.")
+    parser.add_argument("--min-length", type=int, default=6, help="Only split words of at least this many letters. Defaults to 6.")
+    parser.add_argument("--batch-size", type=int, default=100, help="Maximum number of words per request. Defaults to 100.")
+    parser.add_argument("--max-chars", type=int, default=2000, help="Maximum number of characters of the words of a request. Defaults to 2000.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum number of requests at a time. Defaults to 4.")
+    parser.add_argument("--retries", type=int, default=5, help="Number of times a failed request is tried again. Defaults to 5.")
+    parser.add_argument("--retry-rejected", action="store_true", help="Send the words whose earlier responses were rejected again.")
+    parser.add_argument("--timeout", type=float, default=120, help="Timeout of a request in seconds. Defaults to 120.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    args = parse_args()
+
+    words = get_vocabulary(args.inputs, args.min_length)
+    cache = SplitCache(args.cache, args.model)
+    try:
+        sent, stored, rejected = asyncio.run(split_words(words, cache, args))
+        print(f"Stored splits of {stored} of the {sent} words sent in", args.cache)
+        if rejected:
+            print(f"Rejected {rejected} lines that did not match their word. They are not sent again unless --retry-rejected is given.")
+        if args.out_file:
+            save_splits(args.out_file, words, cache)
+            print("Splits saved to", args.out_file)
+    finally:
+        cache.close()
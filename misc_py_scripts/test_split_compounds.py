@@ -0,0 +1,130 @@
+from split_compounds import PROMPT, SplitCache, make_batches, split_words
+from argparse import Namespace
+from aiohttp import web
+import split_compounds
+import asyncio
+import pytest
+
+COMPOUNDS = {"alþingismaður": "alþingis-maður", "fjárlagafrumvarp": "fjárlaga-frumvarp", "þingsályktun": "þings-ályktun"}
+
+
+@pytest.fixture(autouse=True)
+def short_backoff(monkeypatch):
+    # Keep the retries, but wait as little as the backoff allows
+    monkeypatch.setattr(split_compounds.random, "random", lambda: 0.0)
+
+
+class MockEndpoint:
+    """
+    A local chat completions endpoint. Each request takes the next of the given
+    responses: an HTTP status to fail with, or "short" to leave out a line.
+    Afterwards it splits the words in COMPOUNDS, capitalizes the words in
+    capitalized, and returns other words unchanged.
+    """
+
+    def __init__(self, responses=(), capitalized=()):
+        self.responses = list(responses)
+        self.capitalized = set(capitalized)
+        self.batches = []
+
+    async def handle(self, request):
+        payload = await request.json()
+        batch = payload["messages"][-1]["content"][len(PROMPT) :].split("\n")
+        self.batches.append(batch)
+        response = self.responses.pop(0) if self.responses else None
+        if isinstance(response, int):
+            return web.Response(status=response)
+        lines = [word.capitalize() if word in self.capitalized else COMPOUNDS.get(word, word) for word in batch]
+        if response == "short":
+            lines = lines[:-1]
+        return web.json_response({"choices": [{"message": {"content": "\n".join(lines)}}]})
+
+    async def run(self, words, cache, **options):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        args = Namespace(
+            base_url=f"http://127.0.0.1:{port}/v1",
+            model="mock",
+            concurrency=2,
+            retries=3,
+            timeout=10,
+            batch_size=100,
+            max_chars=2000,
+            retry_rejected=False,
+        )
+        vars(args).update(options)
+        try:
+            return await split_words(words, cache, args)
+        finally:
+            await runner.cleanup()
+
+
+def run(endpoint, words, cache, **options):
+    return asyncio.run(endpoint.run(words, cache, **options))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SplitCache(tmp_path / "splits.db", "mock")
+    yield cache
+    cache.close()
+
+
+def test_retries_rate_limits_and_server_errors(cache):
+    words = sorted(COMPOUNDS)
+    endpoint = MockEndpoint(responses=[429, 500])
+    assert run(endpoint, words, cache) == (3, 3, 0)
+    assert endpoint.batches == [words] * 3
+    assert cache.get_many(words) == COMPOUNDS
+
+
+def test_malformed_line_count_is_retried(cache):
+    words = sorted(COMPOUNDS)
+    endpoint = MockEndpoint(responses=["short"])
+    assert run(endpoint, words, cache) == (3, 3, 0)
+    assert endpoint.batches == [words] * 2
+
+
+def test_batches_split_on_size_and_chars(cache):
+    words = [f"orð{index:03}" for index in range(10)]
+    endpoint = MockEndpoint()
+    run(endpoint, words, cache, batch_size=4)
+    assert sorted(map(len, endpoint.batches)) == [2, 4, 4]
+
+    words = [f"langtorð{index:03}" for index in range(10)]
+    endpoint = MockEndpoint()
+    run(endpoint, words, cache, max_chars=25)
+    assert all(sum(len(word) + 1 for word in batch) <= 25 for batch in endpoint.batches)
+    assert sorted(word for batch in endpoint.batches for word in batch) == words
+
+
+def test_make_batches_keeps_long_words():
+    assert make_batches(["a" * 30, "bb", "cc"], 10, 10) == [["a" * 30], ["bb", "cc"]]
+
+
+def test_second_run_sends_nothing(cache):
+    words = sorted(COMPOUNDS) + ["stóll"]
+    run(MockEndpoint(), words, cache)
+    endpoint = MockEndpoint()
+    assert run(endpoint, words, cache) == (0, 0, 0)
+    assert endpoint.batches == []
+
+
+def test_rejected_lines_are_marked(cache):
+    words = sorted(COMPOUNDS) + ["stóll"]
+    endpoint = MockEndpoint(capitalized=["stóll"])
+    assert run(endpoint, words, cache) == (4, 3, 1)
+    assert cache.get_many(["stóll"]) == {"stóll": None}
+
+    endpoint = MockEndpoint()
+    assert run(endpoint, words, cache) == (0, 0, 0)
+    assert endpoint.batches == []
+
+    assert run(endpoint, words, cache, retry_rejected=True) == (1, 1, 0)
+    assert endpoint.batches == [["stóll"]]
+    assert cache.get_many(["stóll"]) == {"stóll": "stóll"}